@@ -0,0 +1,98 @@
+"""
+Prometheus metrics for the API, served at GET /metrics: request latency per
+route template, captures by outcome, tasks published to the broker, and the
+time spent in database queries. With several API processes (API_WORKERS),
+set PROMETHEUS_MULTIPROC_DIR to an empty directory shared by them so that
+/metrics reports the sum over all of them rather than one process at random.
+"""
+
+import os
+import time
+from typing import Container
+
+from celery.signals import after_task_publish
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest, multiprocess,
+)
+from sqlalchemy import event
+
+# Seconds; dense below 100 ms where most API requests and queries land
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Statement kinds timed separately; the rest count as "other"
+STATEMENT_KINDS = ("SELECT", "INSERT", "UPDATE", "DELETE")
+
+REQUEST_LATENCY = Histogram(
+    "synapse_api_request_duration_seconds", "Time to respond to an API request",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+CAPTURES = Counter(
+    "synapse_api_captures_total", "Captured sources by outcome (processing, duplicate, rejected)",
+    ["source_type", "outcome"],
+)
+TASKS_ENQUEUED = Counter(
+    "synapse_api_tasks_enqueued_total", "Celery tasks published to the broker", ["task"],
+)
+DB_QUERY_LATENCY = Histogram(
+    "synapse_api_db_query_duration_seconds", "Time to execute a database statement",
+    ["statement"], buckets=LATENCY_BUCKETS,
+)
+# Resolved once: labels() takes a lock and a dict lookup on every call
+_QUERY_TIMERS = {kind: DB_QUERY_LATENCY.labels(kind) for kind in STATEMENT_KINDS + ("other",)}
+
+
+def route_label(scope: dict) -> str:
+    """The matched route's path template, so /items/{item_id} is one series and not one per id"""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def observe_request(method: str, scope: dict, status: int, seconds: float) -> None:
+    REQUEST_LATENCY.labels(method, route_label(scope), str(status)).observe(seconds)
+
+
+def count_capture(source_type, outcome: str, source_types: Container[str]) -> None:
+    """
+    Count one capture. The source type comes from the client, so anything
+    outside `source_types` is counted as "invalid" rather than becoming a
+    new series.
+    """
+    CAPTURES.labels(source_type if source_type in source_types else "invalid", outcome).inc()
+
+
+def statement_kind(statement: str) -> str:
+    kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return kind if kind in STATEMENT_KINDS else "other"
+
+
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is not None:
+        _QUERY_TIMERS[statement_kind(statement)].observe(time.perf_counter() - started)
+
+
+def instrument_engine(engine) -> None:
+    """Time every statement the engine runs (an AsyncEngine is instrumented through its sync_engine)"""
+    engine = getattr(engine, "sync_engine", engine)
+    event.listen(engine, "before_cursor_execute", _query_started)
+    event.listen(engine, "after_cursor_execute", _query_finished)
+
+
+@after_task_publish.connect
+def _task_published(sender=None, **kwargs):
+    # sender is the task name; fires once the broker has accepted the message
+    TASKS_ENQUEUED.labels(sender or "unknown").inc()
+
+
+def metrics_response() -> tuple:
+    """The exposition body and its content type"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,5 +1,7 @@
 import os
+import time
 from celery import Celery
+from celery.signals import before_task_publish
 
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
@@ -7,3 +9,21 @@ CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:63
 celery_app = Celery("synapse_api")
 celery_app.conf.broker_url = CELERY_BROKER_URL
 celery_app.conf.result_backend = CELERY_RESULT_BACKEND
+
+
+def send_tasks(tasks):
+    """
+    Publish (task_name, args) pairs over one producer.
+    A batch shares a single broker connection and channel instead of
+    acquiring one from the pool per message.
+    """
+    with celery_app.producer_or_acquire() as producer:
+        for task_name, args in tasks:
+            celery_app.send_task(task_name, args=args, producer=producer)
+
+
+@before_task_publish.connect
+def _stamp_sent_at(headers=None, **kwargs):
+    # Workers measure queue wait from this (synapse_worker_task_queue_wait_seconds)
+    if headers is not None:
+        headers.setdefault("sent_at", time.time())
@@ -0,0 +1,146 @@
+"""
+Celery worker and queue metrics for the console, collected in the background.
+Inspect broadcasts wait up to a second for worker replies, so instead of
+running them on every request the collector refreshes a snapshot on an
+interval (only while the console is being watched) and the endpoint serves
+that. Queue depth is read from the broker, not from the workers.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List
+
+from starlette.concurrency import run_in_threadpool
+
+from celery_app import celery_app
+from report_cache import CachedReport
+
+logger = logging.getLogger(__name__)
+
+CELERY_METRICS_INTERVAL = float(os.getenv('CELERY_METRICS_INTERVAL', '10'))
+# Stop refreshing once nobody has asked for metrics for this many seconds
+CELERY_METRICS_IDLE_AFTER = float(os.getenv('CELERY_METRICS_IDLE_AFTER', '300'))
+# Broker queues whose depth is reported; Celery's default queue unless configured
+CELERY_METRICS_QUEUES = [
+    queue.strip() for queue in os.getenv('CELERY_METRICS_QUEUES', '').split(',') if queue.strip()
+] or [celery_app.conf.task_default_queue]
+INSPECT_TIMEOUT = 1.0
+INSPECT_METHODS = ("stats", "active", "reserved", "scheduled")
+
+
+def _broker_connection(connection):
+    # Tried once: kombu would otherwise spend seconds retrying a broker that is down
+    connection.ensure_connection(max_retries=1, interval_start=0, timeout=INSPECT_TIMEOUT)
+    return connection
+
+
+def inspect(method: str) -> Dict[str, Any]:
+    """One inspect broadcast: replies by worker name"""
+    with celery_app.connection_or_acquire() as connection:
+        inspector = celery_app.control.inspect(timeout=INSPECT_TIMEOUT, connection=_broker_connection(connection))
+        return getattr(inspector, method)() or {}
+
+
+def queue_depths(queues: List[str]) -> Dict[str, int]:
+    """Messages waiting in each broker queue"""
+    depths = {}
+    with celery_app.connection_for_read() as connection:
+        _broker_connection(connection)
+        for queue in queues:
+            channel = connection.channel()
+            try:
+                _, depths[queue], _ = channel.queue_declare(queue=queue, passive=True)
+            except connection.channel_errors:
+                depths[queue] = 0  # brokers report a queue that was never declared (or emptied, on Redis) as missing
+            finally:
+                channel.close()
+    return depths
+
+
+def build_snapshot(replies: Dict[str, Dict[str, Any]], depths: Dict[str, int], errors: List[str]) -> Dict[str, Any]:
+    stats, active = replies.get("stats", {}), replies.get("active", {})
+    reserved, scheduled = replies.get("reserved", {}), replies.get("scheduled", {})
+
+    # Waiting tasks: those still in the broker plus those workers have prefetched
+    queues: Dict[str, int] = dict(depths)
+    for dataset in (reserved, scheduled):
+        for tasks in dataset.values():
+            for task in tasks:
+                queue_name = task.get("delivery_info", {}).get("routing_key", task.get("name", "default"))
+                queues[queue_name] = queues.get(queue_name, 0) + 1
+
+    return {
+        "workers": [
+            {
+                "name": worker,
+                "processed": data.get("total", {}),
+                "pid": data.get("pid"),
+                "uptime": data.get("uptime"),
+                "loadavg": data.get("loadavg"),
+            }
+            for worker, data in stats.items()
+        ],
+        "active_tasks": {worker: len(tasks) for worker, tasks in active.items()},
+        "queued_tasks": queues,
+        "broker_queue_depth": depths,
+        "collected_at": datetime.utcnow().isoformat(),
+        "errors": errors,
+    }
+
+
+class CeleryMetricsCollector:
+    def __init__(self, interval: float = CELERY_METRICS_INTERVAL, idle_after: float = CELERY_METRICS_IDLE_AFTER,
+                 queues: List[str] = CELERY_METRICS_QUEUES, clock=time.monotonic):
+        self.interval = interval
+        self.idle_after = idle_after
+        self.queues = queues
+        self.clock = clock
+        # Outlives the refresh interval, so requests are served from the
+        # snapshot while the background loop keeps it current
+        self.report = CachedReport(ttl=2 * interval, clock=clock)
+        self.last_requested = float("-inf")
+
+    def collect(self) -> Dict[str, Any]:
+        """Run the broadcasts and the depth query side by side; failures are reported, not raised"""
+        replies: Dict[str, Dict[str, Any]] = {}
+        depths: Dict[str, int] = {}
+        errors: List[str] = []
+        with ThreadPoolExecutor(max_workers=len(INSPECT_METHODS) + 1) as pool:
+            pending = {method: pool.submit(inspect, method) for method in INSPECT_METHODS}
+            pending["queue_depth"] = pool.submit(queue_depths, self.queues)
+            for name, future in pending.items():
+                try:
+                    result = future.result()
+                except Exception as exc:
+                    errors.append(f"{name}: {exc}")
+                    continue
+                if name == "queue_depth":
+                    depths = result
+                else:
+                    replies[name] = result
+        return build_snapshot(replies, depths, errors)
+
+    async def _collect(self) -> Dict[str, Any]:
+        return await run_in_threadpool(self.collect)
+
+    async def get(self) -> Dict[str, Any]:
+        """The current snapshot; collected now only if the collector has been idle"""
+        self.last_requested = self.clock()
+        return await self.report.get(self._collect)
+
+    async def run(self) -> None:
+        """Refresh loop for the life of the process"""
+        while True:
+            if self.clock() - self.last_requested < self.idle_after:
+                try:
+                    await self.report.refresh(self._collect)
+                except Exception as exc:
+                    logger.warning(f"Celery metrics refresh failed: {str(exc)}")
+            await asyncio.sleep(self.interval)
+
+
+celery_metrics = CeleryMetricsCollector()
@@ -1,19 +1,36 @@
+import asyncio
+import base64
+import binascii
+import json
 import os
-import pathlib
+import time
+import uuid
 from datetime import datetime
-from typing import Any, Dict, Optional
+from functools import lru_cache
+from typing import Any, Awaitable, Dict, List, Literal, Optional, Tuple
 
 import boto3
 import redis
 import requests
+from botocore.config import Config as BotoConfig
 from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from sqlalchemy import text
-from sqlalchemy.orm import Session
+from sqlalchemy import func, literal, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
 from database import get_db
-from models import KnowledgeItem
+from models import ITEM_STAGES, KnowledgeItem, KnowledgeItemStats
 from celery_app import celery_app
+from celery_metrics import celery_metrics
+from content_store import ContentStore
+from item_cache import item_cache
+from item_events import publish_item_event
+from item_stream import ITEM_STREAM_RETRY_MS, sse_message
+from log_files import follow_lines, log_path, read_tail, tail_lines
+from report_cache import CachedReport
+from storage import storage_from_env
 
 def require_console_access(x_console_token: Optional[str] = Header(None, alias="X-Console-Token")):
     token = os.getenv("CONSOLE_API_TOKEN")
@@ -39,9 +56,48 @@ def _status_payload(ok: bool, detail: Optional[str] = None) -> Dict[str, Any]:
     }
 
 
-def _check_postgres(db: Session) -> Dict[str, Any]:
+# Each check must answer within this many seconds or is reported unhealthy
+HEALTH_CHECK_TIMEOUT = float(os.getenv("CONSOLE_HEALTH_TIMEOUT", "2"))
+# Seconds a health report is reused, so dashboards and load balancers poll cheaply
+HEALTH_CACHE_TTL = float(os.getenv("CONSOLE_HEALTH_TTL", "5"))
+
+
+# Long-lived clients, built on first use; their own timeouts stay within the
+# check deadline so a thread left behind by a timed-out check ends soon after
+@lru_cache(maxsize=1)
+def _redis_client() -> redis.Redis:
+    broker_url = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
+    return redis.from_url(broker_url, socket_timeout=HEALTH_CHECK_TIMEOUT,
+                          socket_connect_timeout=HEALTH_CHECK_TIMEOUT)
+
+
+@lru_cache(maxsize=1)
+def _s3_client():
+    return boto3.client(
+        "s3",
+        endpoint_url=os.getenv("MINIO_ENDPOINT", "http://localhost:9000"),
+        aws_access_key_id=os.getenv("MINIO_ACCESS_KEY", "minioadmin"),
+        aws_secret_access_key=os.getenv("MINIO_SECRET_KEY", "minioadmin"),
+        region_name="us-east-1",
+        config=BotoConfig(connect_timeout=HEALTH_CHECK_TIMEOUT, read_timeout=HEALTH_CHECK_TIMEOUT,
+                          retries={"max_attempts": 1}),
+    )
+
+
+@lru_cache(maxsize=1)
+def _stt_session() -> requests.Session:
+    return requests.Session()
+
+
+@lru_cache(maxsize=1)
+def _content_store() -> ContentStore:
+    # Bodies the worker offloaded; storage must be configured like the worker's
+    return ContentStore(storage_from_env())
+
+
+async def _check_postgres(db: AsyncSession) -> Dict[str, Any]:
     try:
-        db.execute(text("SELECT 1"))
+        await db.execute(text("SELECT 1"))
         return _status_payload(True)
     except Exception as exc:  # pragma: no cover - defensive
         return _status_payload(False, str(exc))
@@ -49,9 +105,7 @@ def _check_postgres(db: Session) -> Dict[str, Any]:
 
 def _check_redis() -> Dict[str, Any]:
     try:
-        broker_url = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
-        client = redis.from_url(broker_url)
-        client.ping()
+        _redis_client().ping()
         return _status_payload(True)
     except Exception as exc:
         return _status_payload(False, str(exc))
@@ -59,15 +113,8 @@ def _check_redis() -> Dict[str, Any]:
 
 def _check_minio() -> Dict[str, Any]:
     try:
-        s3_client = boto3.client(
-            "s3",
-            endpoint_url=os.getenv("MINIO_ENDPOINT", "http://localhost:9000"),
-            aws_access_key_id=os.getenv("MINIO_ACCESS_KEY", "minioadmin"),
-            aws_secret_access_key=os.getenv("MINIO_SECRET_KEY", "minioadmin"),
-            region_name="us-east-1",
-        )
         bucket = os.getenv("MINIO_BUCKET", "synapse")
-        s3_client.head_bucket(Bucket=bucket)
+        _s3_client().head_bucket(Bucket=bucket)
         return _status_payload(True)
     except Exception as exc:
         return _status_payload(False, str(exc))
@@ -78,7 +125,7 @@ def _check_stt() -> Dict[str, Any]:
         configured = os.getenv("STT_SERVICE_URL", "http://localhost:5000/transcribe")
         base_url = configured.rsplit("/", 1)[0] if configured.endswith("/transcribe") else configured
         health_url = os.getenv("STT_HEALTH_URL", f"{base_url}/health")
-        response = requests.get(health_url, timeout=5)
+        response = _stt_session().get(health_url, timeout=HEALTH_CHECK_TIMEOUT)
         response.raise_for_status()
         data = response.json()
         detail = f"model={data.get('model')}" if isinstance(data, dict) else None
@@ -89,10 +136,14 @@ def _check_stt() -> Dict[str, Any]:
 
 def _check_worker() -> Dict[str, Any]:
     try:
-        inspector = celery_app.control.inspect(timeout=1)
+        # A pooled broker connection, tried once: kombu would otherwise spend
+        # several seconds retrying a broker that is down
+        with celery_app.connection_or_acquire() as connection:
+            connection.ensure_connection(max_retries=1, interval_start=0, timeout=HEALTH_CHECK_TIMEOUT)
+            inspector = celery_app.control.inspect(timeout=min(1.0, HEALTH_CHECK_TIMEOUT), connection=connection)
+            ping = inspector.ping() if inspector else None
         if not inspector:
             return _status_payload(False, "Inspector unavailable")
-        ping = inspector.ping()
         if not ping:
             return _status_payload(False, "No workers responded")
         workers = ", ".join(ping.keys())
@@ -101,79 +152,139 @@ def _check_worker() -> Dict[str, Any]:
         return _status_payload(False, str(exc))
 
 
-@router.get("/health")
-def get_console_health(db: Session = Depends(get_db)) -> Dict[str, Any]:
-    return {
-        "components": {
-            "api": _status_payload(True),
-            "postgres": _check_postgres(db),
-            "redis": _check_redis(),
-            "minio": _check_minio(),
-            "stt_service": _check_stt(),
-            "worker": _check_worker(),
-        }
+async def _within_deadline(check: Awaitable[Dict[str, Any]]) -> Dict[str, Any]:
+    try:
+        return await asyncio.wait_for(check, HEALTH_CHECK_TIMEOUT)
+    except asyncio.TimeoutError:
+        return _status_payload(False, f"No answer within {HEALTH_CHECK_TIMEOUT:g}s")
+
+
+async def _collect_health(db: AsyncSession) -> Dict[str, Any]:
+    # All checks run at once; the blocking clients run in the threadpool
+    checks = {
+        "postgres": _check_postgres(db),
+        "redis": run_in_threadpool(_check_redis),
+        "minio": run_in_threadpool(_check_minio),
+        "stt_service": run_in_threadpool(_check_stt),
+        "worker": run_in_threadpool(_check_worker),
     }
+    results = await asyncio.gather(*(_within_deadline(check) for check in checks.values()))
+    return {"components": {"api": _status_payload(True), **dict(zip(checks, results))}}
+
+
+_health_report = CachedReport(ttl=HEALTH_CACHE_TTL)
+
+
+@router.get("/health")
+async def get_console_health(db: AsyncSession = Depends(get_db)) -> Dict[str, Any]:
+    return await _health_report.get(lambda: _collect_health(db))
 
 
 @router.get("/metrics")
-def get_console_metrics() -> Dict[str, Any]:
+async def get_console_metrics() -> Dict[str, Any]:
+    # Served from the collector's snapshot; see celery_metrics
+    return await celery_metrics.get()
+
+
+# Below this many matching rows the listing total is an exact (capped) count;
+# above it the planner's estimate is returned instead of scanning every row
+CONSOLE_EXACT_COUNT_LIMIT = int(os.getenv("CONSOLE_EXACT_COUNT_LIMIT", "10000"))
+
+
+def _encode_cursor(item: KnowledgeItem) -> str:
+    raw = f"{item.created_at.isoformat()}|{item.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
     try:
-        inspector = celery_app.control.inspect(timeout=1)
-        if not inspector:
-            raise RuntimeError("Celery inspector unavailable")
-    except Exception as exc:  # pragma: no cover - Celery misconfig
-        raise HTTPException(status_code=500, detail=f"Unable to inspect Celery: {exc}")
-
-    stats = inspector.stats() or {}
-    active = inspector.active() or {}
-    reserved = inspector.reserved() or {}
-    scheduled = inspector.scheduled() or {}
-
-    queues: Dict[str, int] = {}
-    for dataset in (reserved, scheduled):
-        for tasks in dataset.values():
-            for task in tasks:
-                queue_name = task.get("delivery_info", {}).get("routing_key", task.get("name", "default"))
-                queues[queue_name] = queues.get(queue_name, 0) + 1
-
-    metrics = {
-        "workers": [
-            {
-                "name": worker,
-                "processed": data.get("total", {}),
-                "pid": data.get("pid"),
-                "uptime": data.get("uptime"),
-                "loadavg": data.get("loadavg"),
-            }
-            for worker, data in stats.items()
-        ],
-        "active_tasks": {worker: len(tasks) for worker, tasks in active.items()},
-        "queued_tasks": queues,
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, item_id = raw.split("|")
+        return datetime.fromisoformat(created_at), uuid.UUID(item_id)
+    except (ValueError, binascii.Error):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+async def _estimated_count(db: AsyncSession, status_filter: Optional[str]) -> Tuple[int, bool]:
+    """
+    Row count for the listing and whether it is an estimate.
+    Counts exactly up to CONSOLE_EXACT_COUNT_LIMIT rows, which stays cheap on
+    the (status, created_at) index; past that it reads the planner's estimate.
+    """
+    capped = select(literal(1)).select_from(KnowledgeItem)
+    if status_filter:
+        capped = capped.where(KnowledgeItem.status == status_filter)
+    capped = capped.limit(CONSOLE_EXACT_COUNT_LIMIT + 1)
+    counted = (await db.execute(select(func.count()).select_from(capped.subquery()))).scalar_one()
+    if counted <= CONSOLE_EXACT_COUNT_LIMIT:
+        return counted, False
+
+    if status_filter:
+        explain = text("EXPLAIN (FORMAT JSON) SELECT 1 FROM knowledge_items WHERE status = :status")
+        plan = (await db.execute(explain, {"status": status_filter})).scalar_one()
+    else:
+        plan = (await db.execute(text("EXPLAIN (FORMAT JSON) SELECT 1 FROM knowledge_items"))).scalar_one()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return max(int(plan[0]["Plan"]["Plan Rows"]), counted), True
+
+
+def _stats_payload(stats: Optional[KnowledgeItemStats]) -> Optional[Dict[str, Any]]:
+    """Where the item's last processing attempt spent its time, or None before it has one"""
+    if stats is None:
+        return None
+    stages = {stage: getattr(stats, f"{stage}_ms") for stage in ITEM_STAGES}
+    return {
+        "outcome": stats.outcome,
+        "total_ms": stats.total_ms,
+        "stages_ms": {stage: ms for stage, ms in stages.items() if ms is not None},
+        "bytes_downloaded": stats.bytes_downloaded,
+        "images_found": stats.images_found,
+        "images_stored": stats.images_stored,
+        "recorded_at": stats.recorded_at.isoformat() if stats.recorded_at else None,
     }
-    return metrics
 
 
 @router.get("/knowledge-items")
-def list_knowledge_items(
+async def list_knowledge_items(
     status_filter: Optional[str] = Query(None, alias="status"),
     limit: int = Query(50, ge=1, le=200),
-    offset: int = Query(0, ge=0),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    count: Literal["estimated", "exact", "none"] = Query("estimated"),
+    db: AsyncSession = Depends(get_db),
 ) -> Dict[str, Any]:
-    base_query = db.query(KnowledgeItem)
+    # Keyset pagination on (created_at, id): every page is an index range
+    # scan of `limit` rows, however deep the console has paged. Each row's
+    # stats come along through a primary-key lookup in the same query
+    query = select(KnowledgeItem, KnowledgeItemStats).outerjoin(
+        KnowledgeItemStats, KnowledgeItemStats.knowledge_item_id == KnowledgeItem.id)
     if status_filter:
-        base_query = base_query.filter(KnowledgeItem.status == status_filter)
-
-    total = base_query.count()
-    items = (
-        base_query.order_by(KnowledgeItem.created_at.desc())
-        .offset(offset)
-        .limit(limit)
-        .all()
-    )
+        query = query.where(KnowledgeItem.status == status_filter)
+    if cursor:
+        created_at, item_id = _decode_cursor(cursor)
+        query = query.where(tuple_(KnowledgeItem.created_at, KnowledgeItem.id) < tuple_(created_at, item_id))
+
+    rows = (
+        await db.execute(
+            query.order_by(KnowledgeItem.created_at.desc(), KnowledgeItem.id.desc()).limit(limit + 1)
+        )
+    ).all()
+    items = rows[:limit]
+    next_cursor = _encode_cursor(items[-1][0]) if len(rows) > limit else None
+
+    total, estimated = None, False
+    if count == "exact":
+        base_query = select(KnowledgeItem)
+        if status_filter:
+            base_query = base_query.where(KnowledgeItem.status == status_filter)
+        total = (await db.execute(select(func.count()).select_from(base_query.subquery()))).scalar_one()
+    elif count == "estimated":
+        total, estimated = await _estimated_count(db, status_filter)
 
     return {
         "total": total,
+        "total_is_estimate": estimated,
+        "next_cursor": next_cursor,
         "items": [
             {
                 "id": str(item.id),
@@ -184,9 +295,11 @@ def list_knowledge_items(
                 "last_error": item.last_error,
                 "title": item.title,
                 "source_url": item.source_url,
-                "has_transcript": bool(item.processed_text_content),
+                "has_transcript": bool(item.text_content_length),
+                "text_content_length": item.text_content_length,
+                "stats": _stats_payload(stats),
             }
-            for item in items
+            for item, stats in items
         ],
     }
 
@@ -199,23 +312,38 @@ def _celery_task_for_source(source_type: str) -> str:
     return "tasks.process_media"
 
 
+async def _announce_change(item: KnowledgeItem) -> None:
+    """Drop cached copies of an item edited here and tell the status streams, in every API process"""
+    item_cache.invalidate(str(item.id))
+    await run_in_threadpool(publish_item_event, str(item.id), item.status, str(item.user_id))
+
+
 @router.post("/knowledge-items/{item_id}/retry")
-def retry_knowledge_item(item_id: str, db: Session = Depends(get_db)) -> Dict[str, Any]:
-    item: Optional[KnowledgeItem] = (
-        db.query(KnowledgeItem).filter(KnowledgeItem.id == item_id).first()
-    )
+async def retry_knowledge_item(item_id: str, db: AsyncSession = Depends(get_db)) -> Dict[str, Any]:
+    item: Optional[KnowledgeItem] = await db.get(KnowledgeItem, item_id)
     if not item:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Item not found")
 
     task_name = _celery_task_for_source(item.source_type)
+    offloaded_keys = [key for key in (item.text_content_key, item.html_content_key) if key]
     item.status = "pending"
     item.processed_at = None
     item.last_error = None
     item.processed_text_content = None
     item.processed_html_content = None
-    db.commit()
-
-    celery_app.send_task(task_name, args=[item_id])
+    item.text_content_length = None
+    item.html_content_length = None
+    item.text_content_key = None
+    item.html_content_key = None
+    # Search must not find the old text; on SQLite the FTS5 triggers follow processed_text_content
+    item.search_vector = None
+    await db.commit()
+    await _announce_change(item)
+    if offloaded_keys:
+        # Nothing points at the cleared bodies once the reset is committed
+        await run_in_threadpool(_content_store().discard, offloaded_keys)
+
+    await run_in_threadpool(celery_app.send_task, task_name, args=[item_id])
     return {"status": "queued", "task": task_name}
 
 
@@ -229,14 +357,12 @@ ALLOWED_STATUSES = {"pending", "processing", "ready_for_distillation", "error"}
 
 
 @router.patch("/knowledge-items/{item_id}")
-def update_knowledge_item(
+async def update_knowledge_item(
     item_id: str,
     payload: KnowledgeItemUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ) -> Dict[str, Any]:
-    item: Optional[KnowledgeItem] = (
-        db.query(KnowledgeItem).filter(KnowledgeItem.id == item_id).first()
-    )
+    item: Optional[KnowledgeItem] = await db.get(KnowledgeItem, item_id)
     if not item:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Item not found")
 
@@ -260,8 +386,9 @@ def update_knowledge_item(
         stripped = payload.last_error.strip()
         item.last_error = stripped if stripped else None
 
-    db.commit()
-    db.refresh(item)
+    await db.commit()
+    await db.refresh(item)
+    await _announce_change(item)
 
     return {
         "id": str(item.id),
@@ -272,19 +399,39 @@ def update_knowledge_item(
         "last_error": item.last_error,
         "title": item.title,
         "source_url": item.source_url,
-        "has_transcript": bool(item.processed_text_content),
+        "has_transcript": bool(item.text_content_length),
+        "text_content_length": item.text_content_length,
     }
 
 
 @router.get("/logs")
-def tail_logs(lines: int = Query(200, ge=1, le=500)) -> Dict[str, Any]:
-    log_path = os.getenv("API_LOG_PATH", os.path.join(os.path.dirname(__file__), "app.log"))
-    path = pathlib.Path(log_path)
-    if not path.exists():
-        return {"lines": []}
-
-    with path.open("r") as log_file:
-        content = log_file.readlines()
-
-    tail = [line.rstrip("\n") for line in content[-lines:]]
-    return {"lines": tail}
+async def tail_logs(lines: int = Query(200, ge=1, le=500)) -> Dict[str, Any]:
+    # Reads only the last blocks of the log (and backups, if it was just rotated)
+    return {"lines": await run_in_threadpool(tail_lines, log_path(), lines)}
+
+
+# Seconds between keepalive comments on an idle log stream
+LOG_STREAM_KEEPALIVE = 15
+
+
+async def _log_events(path: str, backlog: List[str], start_at: int):
+    yield f"retry: {ITEM_STREAM_RETRY_MS}\n\n"
+    for line in backlog:
+        yield sse_message("log", {"line": line})
+    idle_since = time.monotonic()
+    async for line in follow_lines(path, start_at):
+        if line is not None:
+            yield sse_message("log", {"line": line})
+            idle_since = time.monotonic()
+        elif time.monotonic() - idle_since >= LOG_STREAM_KEEPALIVE:
+            yield ": keepalive\n\n"
+            idle_since = time.monotonic()
+
+
+@router.get("/logs/follow")
+async def follow_logs(lines: int = Query(0, ge=0, le=500)) -> StreamingResponse:
+    """Server-Sent Events: the last `lines` log lines, then each line as it is written"""
+    path = log_path()
+    backlog, end = await run_in_threadpool(read_tail, path, lines)
+    return StreamingResponse(_log_events(path, backlog, end), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
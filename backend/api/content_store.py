@@ -0,0 +1,123 @@
+import codecs
+import gzip
+import logging
+import os
+import uuid
+from typing import Any, Dict, Iterator, List, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+# Bodies longer than this many characters are stored gzipped in object storage
+# with a pointer in the row, instead of inline in knowledge_items (0 disables)
+CONTENT_OFFLOAD_THRESHOLD = int(os.getenv('CONTENT_OFFLOAD_THRESHOLD', str(128 * 1024)))
+CONTENT_READ_CHUNK = 64 * 1024
+
+# Length column maintained alongside each deferred content column
+CONTENT_LENGTH_COLUMNS = {
+    "processed_text_content": "text_content_length",
+    "processed_html_content": "html_content_length",
+}
+
+# Pointer column for each offloadable content column
+CONTENT_KEY_COLUMNS = {
+    "processed_text_content": "text_content_key",
+    "processed_html_content": "html_content_key",
+}
+
+
+def with_content_lengths(values: Dict[str, Any]) -> Dict[str, Any]:
+    """Add the matching length columns to an update that writes content columns"""
+    values = dict(values)
+    for column, length_column in CONTENT_LENGTH_COLUMNS.items():
+        if column in values and length_column not in values:
+            values[length_column] = len(values[column]) if values[column] else None
+    return values
+
+
+def content_key(item_id: str, column: str) -> str:
+    """
+    A new storage key for an item's offloaded body. Each upload gets its own
+    key, so the object a committed row points to is never overwritten.
+    """
+    return f"content/{str(item_id)[:2]}/{item_id}/{column}-{uuid.uuid4().hex}.gz"
+
+
+class ContentStore:
+    """
+    Moves large knowledge item bodies out of Postgres into the storage
+    backend the worker already uses for images (local or MinIO).
+    """
+
+    def __init__(self, storage, threshold: int = CONTENT_OFFLOAD_THRESHOLD):
+        self.storage = storage
+        self.threshold = threshold
+
+    def offload(self, item_id: str, values: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Column values for complete_item with oversized bodies replaced by pointers.
+        Runs in the work phase: the upload happens before any connection is taken.
+        Length columns always describe the full body, wherever it is kept.
+        """
+        values = with_content_lengths(values)
+        for column, key_column in CONTENT_KEY_COLUMNS.items():
+            if column not in values:
+                continue
+            body = values[column]
+            if self.threshold and body and len(body) > self.threshold:
+                key = content_key(item_id, column)
+                self.storage.put_bytes(key, gzip.compress(body.encode('utf-8'), compresslevel=6), 'application/gzip')
+                values[column] = None
+                values[key_column] = key
+            else:
+                values[key_column] = None
+        return values
+
+    @staticmethod
+    def uploaded_keys(values: Dict[str, Any]) -> List[str]:
+        """Keys `offload` uploaded for `values`; to discard if the row is never written"""
+        return [values[key_column] for key_column in CONTENT_KEY_COLUMNS.values() if values.get(key_column)]
+
+    @staticmethod
+    def stale_keys(previous: Mapping[str, Optional[str]], values: Dict[str, Any]) -> List[str]:
+        """Keys the row held before `values` replaced them (`previous` maps key column -> key)"""
+        return [
+            previous[key_column]
+            for column, key_column in CONTENT_KEY_COLUMNS.items()
+            if column in values and previous.get(key_column) and previous[key_column] != values.get(key_column)
+        ]
+
+    def discard(self, keys: List[str]) -> None:
+        for key in keys:
+            try:
+                self.storage.delete(key)
+            except Exception as e:
+                logger.warning(f"Could not delete offloaded content {key}: {str(e)}")
+
+    def iter_text(self, key: str) -> Iterator[str]:
+        """Decompress an offloaded body incrementally, yielding text chunks"""
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        with self.storage.open(key) as raw, gzip.GzipFile(fileobj=raw) as body:
+            while True:
+                chunk = body.read(CONTENT_READ_CHUNK)
+                if not chunk:
+                    break
+                text = decoder.decode(chunk)
+                if text:
+                    yield text
+        tail = decoder.decode(b'', final=True)
+        if tail:
+            yield tail
+
+    def read_text(self, key: str) -> str:
+        return ''.join(self.iter_text(key))
+
+    def read_head(self, key: str, chars: int) -> str:
+        """The first `chars` characters of an offloaded body, decompressing no further than needed"""
+        head = []
+        remaining = chars
+        for text in self.iter_text(key):
+            head.append(text[:remaining])
+            remaining -= len(head[-1])
+            if remaining <= 0:
+                break
+        return ''.join(head)
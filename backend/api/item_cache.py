@@ -0,0 +1,148 @@
+"""
+In-process cache of knowledge item responses.
+Clients poll GET /api/v1/knowledge-items/{id} until processing finishes;
+cached entries let those polls be answered (usually with 304 Not Modified)
+without touching Postgres. Entries are dropped when an item event says the
+item changed, and entries are only kept while that subscription is live,
+so a Redis outage falls back to reading the database instead of serving
+stale items. A publisher that lost events sends a resync once it reaches
+Redis again, which empties the cache. Concurrent misses for one item share
+a single load.
+"""
+
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from item_events import is_resync
+from report_cache import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+ITEM_CACHE_MAX_ENTRIES = int(os.getenv('ITEM_CACHE_MAX_ENTRIES', '1024'))  # 0 disables caching
+ITEM_CACHE_MAX_BYTES = int(os.getenv('ITEM_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+# Upper bound on an entry's age; bounds memory held by items nobody polls
+ITEM_CACHE_TTL = float(os.getenv('ITEM_CACHE_TTL', '300'))
+
+
+@dataclass
+class CachedItem:
+    etag: str
+    payload: Dict[str, Any]  # response fields, without offloaded bodies
+    body: Optional[bytes] = None  # serialized response; None when bodies stream from storage
+    offloaded: Dict[str, str] = field(default_factory=dict)  # column -> storage key
+    expires_at: float = 0.0
+
+    @property
+    def size(self) -> int:
+        return len(self.body) if self.body is not None else len(self.etag) + 1024
+
+
+def make_etag(data: bytes, weak: bool = False) -> str:
+    tag = f'"{hashlib.blake2b(data, digest_size=16).hexdigest()}"'
+    return f'W/{tag}' if weak else tag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check with the weak comparison RFC 9110 prescribes for it"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    return any(
+        (candidate[2:] if candidate.startswith('W/') else candidate) == opaque
+        for candidate in (part.strip() for part in if_none_match.split(','))
+    )
+
+
+class ItemCache:
+    def __init__(self, max_entries: int = ITEM_CACHE_MAX_ENTRIES, max_bytes: int = ITEM_CACHE_MAX_BYTES,
+                 ttl: float = ITEM_CACHE_TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.enabled = False  # set while invalidations are being received
+        self._entries: "OrderedDict[str, CachedItem]" = OrderedDict()
+        self._bytes = 0
+        self._loads = SingleFlight()
+        self._changed_in_flight = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def set_live(self, live: bool) -> None:
+        """Item events listener: only cache while invalidations are arriving"""
+        self.enabled = live
+        if not live:
+            self.clear()
+
+    def item_event(self, event: Dict[str, Any]) -> None:
+        if is_resync(event):
+            self.clear()
+        else:
+            self.invalidate(event["item_id"])
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+        self._changed_in_flight.update(self._loads)
+
+    def invalidate(self, item_id: str) -> None:
+        entry = self._entries.pop(item_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+        if item_id in self._loads:
+            # A load that started before the change must not be cached
+            self._changed_in_flight.add(item_id)
+
+    def get(self, item_id: str) -> Optional[CachedItem]:
+        entry = self._entries.get(item_id)
+        if entry is None:
+            return None
+        if not self.enabled or self.clock() >= entry.expires_at:
+            self.invalidate(item_id)
+            return None
+        self._entries.move_to_end(item_id)
+        return entry
+
+    def _store(self, item_id: str, entry: CachedItem) -> None:
+        if not self.enabled or self.max_entries <= 0 or entry.size > self.max_bytes // 8:
+            return
+        self.invalidate(item_id)
+        entry.expires_at = self.clock() + self.ttl
+        self._entries[item_id] = entry
+        self._bytes += entry.size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+
+    async def get_or_load(self, item_id: str,
+                          load: Callable[[], Awaitable[Optional[CachedItem]]]) -> Optional[CachedItem]:
+        """
+        The cached entry, or the result of `load()`. Concurrent callers for the
+        same id await one load. A None result (no such item) is not cached.
+        """
+        entry = self.get(item_id)
+        if entry is not None:
+            return entry
+        return await self._loads.run(item_id, lambda: self._load(item_id, load),
+                                     lambda entry: self._loaded(item_id, entry))
+
+    async def _load(self, item_id: str, load: Callable[[], Awaitable[Optional[CachedItem]]]) -> Optional[CachedItem]:
+        self._changed_in_flight.discard(item_id)
+        return await load()
+
+    def _loaded(self, item_id: str, entry: Optional[CachedItem]) -> None:
+        if entry is not None and item_id not in self._changed_in_flight:
+            self._store(item_id, entry)
+        self._changed_in_flight.discard(item_id)
+
+
+# Shared by the public item endpoint and the console routes that edit items
+item_cache = ItemCache()
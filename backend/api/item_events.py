@@ -0,0 +1,151 @@
+"""
+Knowledge item change notifications over Redis pub/sub.
+Whoever commits a change to an item (worker state transitions, console
+edits) publishes {"item_id", "user_id", "status"} on ITEM_EVENTS_CHANNEL.
+Each API process holds one subscription (follow_item_events) and hands the
+events to its listeners: the item cache and the status streams.
+A publisher that could not deliver an event publishes a resync event
+(status RESYNC_STATUS, no item) as soon as Redis takes messages again,
+telling listeners to forget whatever the lost events would have changed.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Union
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+ITEM_EVENTS_REDIS_URL = os.getenv('ITEM_EVENTS_REDIS_URL', os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+ITEM_EVENTS_CHANNEL = 'synapse:item-events'
+# After a failed publish, skip publishing for this many seconds instead of
+# stalling every state transition on an unreachable Redis
+PUBLISH_RETRY_AFTER = 5.0
+ITEM_EVENTS_RETRY_DELAY = 5.0
+RESYNC_STATUS = 'resync'
+
+
+def encode_item_event(item_id: Optional[str], status: str, user_id: Optional[str] = None) -> str:
+    return json.dumps({
+        "item_id": str(item_id) if item_id is not None else None,
+        "user_id": str(user_id) if user_id is not None else None,
+        "status": status,
+    })
+
+
+def decode_item_event(data: Union[str, bytes]) -> Dict[str, Any]:
+    return json.loads(data)
+
+
+def is_resync(event: Dict[str, Any]) -> bool:
+    """Events were lost: any item may have changed"""
+    return event.get("status") == RESYNC_STATUS and event.get("item_id") is None
+
+
+class ItemEventPublisher:
+    """
+    Publishes item events; never raises, so a Redis outage cannot fail processing.
+    After a failure it skips publishing for PUBLISH_RETRY_AFTER and owes a
+    resync event, which it retries on a timer until Redis accepts it.
+    """
+
+    def __init__(self, client: redis.Redis, clock=time.monotonic, schedule=None):
+        self.client = client
+        self.clock = clock
+        self.schedule = schedule or _schedule_daemon
+        self._down_until = 0.0
+        self._resync_owed = False
+        self._resync_scheduled = False
+        self._lock = threading.Lock()
+
+    def publish(self, item_id: str, status: str, user_id: Optional[str] = None) -> bool:
+        return self._send(encode_item_event(item_id, status, user_id), f"item event for {item_id}")
+
+    def _send(self, message: str, what: str) -> bool:
+        with self._lock:
+            if self.clock() < self._down_until:
+                self._owe_resync()
+                return False
+            try:
+                if self._resync_owed:
+                    self.client.publish(ITEM_EVENTS_CHANNEL, encode_item_event(None, RESYNC_STATUS))
+                    self._resync_owed = False
+                if message is not None:
+                    self.client.publish(ITEM_EVENTS_CHANNEL, message)
+                return True
+            except redis.RedisError as e:
+                self._down_until = self.clock() + PUBLISH_RETRY_AFTER
+                self._owe_resync()
+                logger.warning(f"Could not publish {what}: {str(e)}")
+                return False
+
+    def _owe_resync(self) -> None:
+        self._resync_owed = True
+        if not self._resync_scheduled:
+            self._resync_scheduled = True
+            self.schedule(PUBLISH_RETRY_AFTER, self._retry_resync)
+
+    def _retry_resync(self) -> None:
+        with self._lock:
+            self._resync_scheduled = False
+            if not self._resync_owed:
+                return
+        self._send(None, "resync event")
+
+
+def _schedule_daemon(delay: float, callback) -> None:
+    timer = threading.Timer(delay, callback)
+    timer.daemon = True
+    timer.start()
+
+
+_publisher: Optional[ItemEventPublisher] = None
+
+
+def publish_item_event(item_id: str, status: str, user_id: Optional[str] = None) -> bool:
+    """Publish through the process-wide publisher; returns whether it was sent"""
+    global _publisher
+    if _publisher is None:
+        client = redis.Redis.from_url(ITEM_EVENTS_REDIS_URL, socket_timeout=1, socket_connect_timeout=1)
+        _publisher = ItemEventPublisher(client)
+    return _publisher.publish(item_id, status, user_id)
+
+
+async def follow_item_events(listeners: Iterable[Any], url: str = ITEM_EVENTS_REDIS_URL,
+                             retry_delay: float = ITEM_EVENTS_RETRY_DELAY) -> None:
+    """
+    Feed item events to `listeners` for the life of the process. Each listener
+    has set_live(bool), told whether events are flowing (events published while
+    the subscription is down are lost), and item_event(event), which must
+    handle resync events (is_resync).
+    """
+    import redis.asyncio as aioredis
+    listeners = list(listeners)
+    while True:
+        client = aioredis.from_url(url, health_check_interval=30)
+        try:
+            pubsub = client.pubsub()
+            await pubsub.subscribe(ITEM_EVENTS_CHANNEL)
+            for listener in listeners:
+                listener.set_live(True)
+            logger.info("Following item events")
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                event = decode_item_event(message["data"])
+                for listener in listeners:
+                    listener.item_event(event)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Item events unavailable, retrying in {retry_delay:.0f}s: {str(e)}")
+        finally:
+            for listener in listeners:
+                listener.set_live(False)
+            await client.close()
+        await asyncio.sleep(retry_delay)
@@ -0,0 +1,137 @@
+"""
+Server-Sent Events streams of knowledge item status changes.
+ItemEventHub hands this process's item events to the open streams that
+watch the item or its user, so clients learn that processing finished as
+soon as the worker commits it instead of polling for it.
+"""
+
+import asyncio
+import json
+import os
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set
+
+from item_events import is_resync
+
+# Events a stream may fall behind by before it is closed; the client reconnects and resyncs
+ITEM_STREAM_QUEUE_SIZE = 100
+# Seconds between comment lines that keep idle connections open through proxies
+ITEM_STREAM_KEEPALIVE = float(os.getenv('ITEM_STREAM_KEEPALIVE', '15'))
+# Reconnect delay EventSource clients are told to use
+ITEM_STREAM_RETRY_MS = 3000
+MAX_STREAM_ITEMS = 100
+
+
+class ItemSubscription:
+    def __init__(self, item_ids: Iterable[str], user_id: Optional[str], queue_size: int):
+        self.item_ids = frozenset(item_ids)
+        self.user_id = user_id
+        self.closed = False
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    def offer(self, event: Dict[str, Any]) -> bool:
+        """Queue an event without blocking; False if the reader has fallen too far behind"""
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def close(self) -> None:
+        self.closed = True
+        try:
+            self._queue.put_nowait(None)  # wakes a waiting reader
+        except asyncio.QueueFull:
+            pass  # the reader is busy and sees `closed` once it has drained the queue
+
+    async def next_event(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """The next event, None once closed and drained; raises asyncio.TimeoutError when idle for `timeout`"""
+        if self.closed and self._queue.empty():
+            return None
+        return await asyncio.wait_for(self._queue.get(), timeout)
+
+
+class ItemEventHub:
+    """Item events listener that fans events out to subscriptions by item and by user"""
+
+    def __init__(self, queue_size: int = ITEM_STREAM_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.live = False
+        self._by_item: Dict[str, Set[ItemSubscription]] = defaultdict(set)
+        self._by_user: Dict[str, Set[ItemSubscription]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._subscriptions())
+
+    def _subscriptions(self) -> Set[ItemSubscription]:
+        return {sub for subs in (*self._by_item.values(), *self._by_user.values()) for sub in subs}
+
+    def subscribe(self, item_ids: Iterable[str], user_id: Optional[str] = None) -> ItemSubscription:
+        subscription = ItemSubscription(item_ids, user_id, self.queue_size)
+        for item_id in subscription.item_ids:
+            self._by_item[item_id].add(subscription)
+        if user_id is not None:
+            self._by_user[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: ItemSubscription) -> None:
+        for index, keys in ((self._by_item, subscription.item_ids), (self._by_user, [subscription.user_id])):
+            for key in keys:
+                subs = index.get(key)
+                if subs is not None:
+                    subs.discard(subscription)
+                    if not subs:
+                        del index[key]
+
+    def set_live(self, live: bool) -> None:
+        self.live = live
+        if not live:
+            # Events are being missed; end the streams so clients reconnect and resync
+            self._close_all()
+
+    def _close_all(self) -> None:
+        for subscription in self._subscriptions():
+            subscription.close()
+            self.unsubscribe(subscription)
+
+    def item_event(self, event: Dict[str, Any]) -> None:
+        if is_resync(event):
+            # A publisher lost events; reconnecting clients get a fresh snapshot
+            self._close_all()
+            return
+        targets = self._by_item.get(event["item_id"], set()) | self._by_user.get(event.get("user_id"), set())
+        for subscription in targets:
+            if not subscription.offer(event):
+                subscription.close()
+                self.unsubscribe(subscription)
+
+
+def sse_message(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def sse_stream(hub: ItemEventHub, subscription: ItemSubscription,
+                     snapshot: List[Dict[str, Any]]) -> AsyncIterator[str]:
+    """
+    The stream body: the current status of the watched items, then every
+    change as it is published. Ends when the hub closes the subscription.
+    """
+    try:
+        yield f"retry: {ITEM_STREAM_RETRY_MS}\n\n"
+        for event in snapshot:
+            yield sse_message("status", event)
+        while True:
+            try:
+                event = await subscription.next_event(ITEM_STREAM_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if event is None:
+                return
+            yield sse_message("status", event)
+    finally:
+        hub.unsubscribe(subscription)
+
+
+# Fed by the process's item events subscription
+item_hub = ItemEventHub()
@@ -0,0 +1,148 @@
+"""
+The API's log file: size-based rotation with gzip-compressed backups, and
+the reading side the console uses. tail_lines reads only the last blocks
+of the file, continuing into the newest backups when the live file is
+short; follow_lines streams lines as they are written, across rotations.
+"""
+
+import asyncio
+import gzip
+import os
+import shutil
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from typing import AsyncIterator, List, Optional, Tuple
+
+API_LOG_MAX_BYTES = int(os.getenv("API_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+API_LOG_BACKUP_COUNT = int(os.getenv("API_LOG_BACKUP_COUNT", "5"))
+TAIL_BLOCK_SIZE = 64 * 1024
+FOLLOW_POLL_INTERVAL = 0.5
+
+
+def log_path() -> str:
+    return os.getenv("API_LOG_PATH", os.path.join(os.path.dirname(__file__), "app.log"))
+
+
+class CompressingRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler whose backups are app.log.1.gz, app.log.2.gz, ..."""
+
+    def __init__(self, filename: str, maxBytes: int = API_LOG_MAX_BYTES,
+                 backupCount: int = API_LOG_BACKUP_COUNT, **kwargs):
+        super().__init__(filename, maxBytes=maxBytes, backupCount=backupCount, **kwargs)
+        self.namer = lambda name: f"{name}.gz"
+        self.rotator = self._compress
+
+    @staticmethod
+    def _compress(source: str, dest: str) -> None:
+        with open(source, "rb") as plain, gzip.open(dest, "wb", compresslevel=6) as compressed:
+            shutil.copyfileobj(plain, compressed)
+        os.remove(source)
+
+
+def _backups(path: str) -> List[str]:
+    """Existing backups, newest first (compressed or, from before compression, plain)"""
+    found = []
+    index = 1
+    while True:
+        for candidate in (f"{path}.{index}.gz", f"{path}.{index}"):
+            if os.path.exists(candidate):
+                found.append(candidate)
+                break
+        else:
+            return found
+        index += 1
+
+
+def _decode(line: bytes) -> str:
+    return line.decode("utf-8", errors="replace")
+
+
+def _tail_file(path: str, count: int, block_size: int) -> Tuple[List[bytes], int]:
+    """The last `count` lines of a plain file, and the offset they end at"""
+    with open(path, "rb") as log_file:
+        end = log_file.seek(0, os.SEEK_END)
+        position, blocks, newlines = end, [], 0
+        # One newline more than lines wanted guarantees the first kept line is whole
+        while position > 0 and newlines <= count:
+            size = min(block_size, position)
+            position -= size
+            log_file.seek(position)
+            block = log_file.read(size)
+            blocks.append(block)
+            newlines += block.count(b"\n")
+    lines = b"".join(reversed(blocks)).splitlines()
+    if position > 0:
+        lines = lines[1:]
+    return lines[-count:] if count else [], end
+
+
+def _tail_backup(path: str, count: int) -> List[bytes]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as backup:
+        return list(deque(backup, maxlen=count))
+
+
+def read_tail(path: str, count: int, block_size: int = TAIL_BLOCK_SIZE) -> Tuple[List[str], int]:
+    """
+    The last `count` lines of the log, oldest first, and the offset in the
+    live file where they end (where following it should start).
+    """
+    try:
+        lines, end = _tail_file(path, count, block_size)
+    except FileNotFoundError:
+        lines, end = [], 0
+    for backup in _backups(path):
+        if len(lines) >= count:
+            break
+        lines = [line.rstrip(b"\n") for line in _tail_backup(backup, count - len(lines))] + lines
+    return [_decode(line) for line in lines], end
+
+
+def tail_lines(path: str, count: int, block_size: int = TAIL_BLOCK_SIZE) -> List[str]:
+    return read_tail(path, count, block_size)[0]
+
+
+async def follow_lines(path: str, start_at: Optional[int] = None,
+                       poll_interval: float = FOLLOW_POLL_INTERVAL) -> AsyncIterator[Optional[str]]:
+    """
+    Lines appended to the log from `start_at` (default: its current end),
+    read by polling. When the file is rotated or truncated, the new file is
+    read from its start. Yields None after each idle poll so callers can
+    send keepalives.
+    """
+    log_file = None
+    partial = b""
+    try:
+        while True:
+            if log_file is None:
+                try:
+                    log_file = open(path, "rb")
+                except FileNotFoundError:
+                    await asyncio.sleep(poll_interval)
+                    yield None
+                    continue
+                end = log_file.seek(0, os.SEEK_END)
+                log_file.seek(min(start_at, end) if start_at is not None else end)
+                start_at = 0  # files opened after a rotation are read from the start
+
+            chunk = log_file.read(TAIL_BLOCK_SIZE)
+            if chunk:
+                *complete, partial = (partial + chunk).split(b"\n")
+                for line in complete:
+                    yield _decode(line)
+                continue
+
+            try:
+                current = os.stat(path)
+            except FileNotFoundError:
+                current = None
+            if (current is None or current.st_ino != os.fstat(log_file.fileno()).st_ino
+                    or current.st_size < log_file.tell()):
+                log_file.close()
+                log_file = None
+                continue
+            await asyncio.sleep(poll_interval)
+            yield None
+    finally:
+        if log_file is not None:
+            log_file.close()
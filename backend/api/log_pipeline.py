@@ -0,0 +1,133 @@
+"""
+Non-blocking logging for the API process.
+Loggers hand records to a bounded in-memory queue; a background thread
+(QueueListener) drains it into the log file and stderr, so request
+handlers never wait on disk or terminal I/O. The file gets one JSON
+object per line (or the classic text format), and high-volume request
+records can be sampled before they are queued.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from log_files import CompressingRotatingFileHandler, log_path
+
+API_LOG_FORMAT = os.getenv("API_LOG_FORMAT", "json")  # json | text, for the log file
+API_LOG_QUEUE_SIZE = int(os.getenv("API_LOG_QUEUE_SIZE", "10000"))
+# Share of routine request records (fast, successful) that are kept
+API_REQUEST_LOG_SAMPLE_RATE = float(os.getenv("API_REQUEST_LOG_SAMPLE_RATE", "1.0"))
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else was passed in `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: timestamp, level, logger, message and any `extra` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items()
+                     if key not in _RECORD_ATTRIBUTES and key != "sample")
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RequestLogSampler(logging.Filter):
+    """Keeps `rate` of the records logged with extra={"sample": True}; all others pass"""
+
+    def __init__(self, rate: float = API_REQUEST_LOG_SAMPLE_RATE):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return not getattr(record, "sample", False) or random.random() < self.rate
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of blocking or raising"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message and traceback now, while the arguments are still
+        # current, but leave the formatting to the listener's handlers
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener: Optional[QueueListener] = None
+
+
+def configure_logging(level: int = logging.INFO) -> DroppingQueueHandler:
+    """Route the root logger through the queue; the handlers run on the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    file_handler = CompressingRotatingFileHandler(log_path())
+    file_handler.setFormatter(JsonFormatter() if API_LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    queue_handler = DroppingQueueHandler(queue.Queue(API_LOG_QUEUE_SIZE))
+    queue_handler.addFilter(RequestLogSampler())
+    _listener = QueueListener(queue_handler.queue, file_handler, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in [h for h in root.handlers if isinstance(h, DroppingQueueHandler)]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    return queue_handler
+
+
+def _restart_after_fork() -> None:
+    # The listener thread does not survive a fork, and the queue's lock may
+    # have been held when it happened; give the child its own
+    if _listener is not None:
+        fresh = queue.Queue(API_LOG_QUEUE_SIZE)
+        for handler in logging.getLogger().handlers:
+            if isinstance(handler, DroppingQueueHandler):
+                handler.queue = fresh
+        _listener.queue = fresh
+        _listener.start()
+
+
+def _flush_at_exit() -> None:
+    if _listener is not None:
+        _listener.stop()  # drains what is queued
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
+atexit.register(_flush_at_exit)
@@ -1,49 +1,105 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Request
+from fastapi import FastAPI, Depends, HTTPException, Query, status, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, HttpUrl
-from typing import Literal
+from typing import List, Literal, Optional
 from datetime import datetime
+import asyncio
+import json
 import uuid
 import logging
 import sys
 import os
+import time
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from models import KnowledgeItem as models_KnowledgeItem
-from schemas import CaptureRequest, CaptureResponse, KnowledgeItem as schemas_KnowledgeItem
-from database import engine, Base, get_db
-from sqlalchemy.orm import Session
+from schemas import (
+    CaptureRequest, CaptureResponse, CaptureBatchRequest, CaptureBatchResponse, CaptureBatchResult,
+    KnowledgeItem as schemas_KnowledgeItem, SearchResponse, SearchResult, SimilarItem, SimilarItemsResponse,
+)
+from database import engine, Base, get_async_engine, get_db
+from sqlalchemy import delete, select
+from sqlalchemy.orm import undefer_group
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
 
+from contextlib import asynccontextmanager
 from functools import wraps
 
-from celery_app import celery_app
+from api_metrics import count_capture, instrument_engine, metrics_response, observe_request
+from celery_app import celery_app, send_tasks
+from celery_metrics import celery_metrics
+from content_store import CONTENT_KEY_COLUMNS, ContentStore
+from item_cache import CachedItem, etag_matches, item_cache, make_etag
+from item_events import follow_item_events
+from item_stream import MAX_STREAM_ITEMS, item_hub, sse_stream
+from log_pipeline import configure_logging
+from search import install_sqlite_search, search_items
+from similarity import embedding_model, similar_items
+from storage import storage_from_env
 from console_routes import router as console_router
 
-# Configure structured logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('app.log'),
-        logging.StreamHandler()
-    ]
-)
+# Configure structured logging: records are queued and written by a background
+# thread to the rotating app.log (JSON lines by default) and stderr
+configure_logging()
 logger = logging.getLogger(__name__)
 
+# Requests slower than this are always logged, whatever the sample rate
+API_SLOW_REQUEST_MS = float(os.getenv("API_SLOW_REQUEST_MS", "1000"))
+
 def log_execution_time(func):
     """Decorator to log execution time of functions"""
     @wraps(func)
     async def wrapper(*args, **kwargs):
-        start_time = datetime.now()
+        started = time.perf_counter()
         result = await func(*args, **kwargs)
-        execution_time = (datetime.now() - start_time).total_seconds()
-        logger.info(f"Function {func.__name__} executed in {execution_time:.2f} seconds")
+        execution_time = time.perf_counter() - started
+        logger.info(f"Function {func.__name__} executed in {execution_time:.2f} seconds",
+                    extra={"function": func.__name__, "duration_ms": round(execution_time * 1000, 2),
+                           "sample": execution_time * 1000 < API_SLOW_REQUEST_MS})
         return result
     return wrapper
 
+# Celery task that processes each supported source type
+CAPTURE_TASKS = {
+    "webpage": "tasks.process_webpage",
+    "video": "tasks.process_media",
+    "audio": "tasks.process_media",
+    "voicememo": "tasks.process_voicememo",
+}
+
+# Bodies the worker offloaded to object storage; must match the worker's backend
+content_store = ContentStore(storage_from_env())
+
+# Time the request path's queries for /metrics
+instrument_engine(get_async_engine())
+
 # Create database tables
 Base.metadata.create_all(bind=engine)
+if engine.dialect.name == "sqlite":
+    # Postgres searches the migrated search_vector column; SQLite gets FTS5
+    with engine.begin() as connection:
+        install_sqlite_search(connection)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One subscription per process feeds the item cache and the status streams;
+    # the cache only serves while it is live
+    follower = asyncio.create_task(follow_item_events([item_cache, item_hub]))
+    # Keeps the console's Celery metrics snapshot current while it is watched
+    collector = asyncio.create_task(celery_metrics.run())
+    yield
+    for task in (follower, collector):
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
 
 app = FastAPI(
+    lifespan=lifespan,
     title="Synapse API",
     description="API for the Synapse knowledge management system - a platform for capturing, processing, and organizing knowledge from various sources",
     version="1.0.0",
@@ -80,9 +136,24 @@ app.include_router(console_router)
 # Add middleware for logging requests
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    logger.info(f"Request: {request.method} {request.url}")
-    response = await call_next(request)
-    logger.info(f"Response: {response.status_code}")
+    # One record per request, after the response; routine ones may be sampled
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    except Exception:
+        observe_request(request.method, request.scope, 500, time.perf_counter() - started)
+        duration_ms = (time.perf_counter() - started) * 1000
+        logger.exception(f"Request: {request.method} {request.url} failed after {duration_ms:.1f} ms",
+                         extra={"method": request.method, "path": request.url.path,
+                                "duration_ms": round(duration_ms, 2)})
+        raise
+    elapsed = time.perf_counter() - started
+    observe_request(request.method, request.scope, response.status_code, elapsed)
+    duration_ms = elapsed * 1000
+    logger.info(f"Request: {request.method} {request.url} - Response: {response.status_code} in {duration_ms:.1f} ms",
+                extra={"method": request.method, "path": request.url.path, "status": response.status_code,
+                       "duration_ms": round(duration_ms, 2),
+                       "sample": response.status_code < 400 and duration_ms < API_SLOW_REQUEST_MS})
     return response
 
 # We'll use the schemas from schemas.py instead of defining them here
@@ -96,6 +167,17 @@ async def health_check():
     """Health check endpoint for monitoring"""
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
+@app.get("/metrics",
+         tags=["System"],
+         summary="Prometheus metrics",
+         description="Request latency per route, capture and enqueue counts, and database query timings, "
+                     "in the Prometheus text format.",
+         response_class=Response)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    body, content_type = metrics_response()
+    return Response(content=body, media_type=content_type)
+
 @app.post("/api/v1/capture", 
           response_model=CaptureResponse, 
           status_code=status.HTTP_202_ACCEPTED,
@@ -105,74 +187,99 @@ async def health_check():
           Capture content from different sources (webpage, video, audio) for processing.
           This endpoint returns immediately with a 202 Accepted status while the actual processing happens asynchronously in the background.
           The client can use the returned item_id to check the processing status later.
+          URLs are canonicalized first; capturing a URL that already exists returns 200 with the
+          existing item and does not queue it again.
           """,
           response_description="Capture request accepted and queued for processing")
 @log_execution_time
-async def capture_item(request: CaptureRequest, db: Session = Depends(get_db)):
+async def capture_item(request: CaptureRequest, response: Response, db: AsyncSession = Depends(get_db)):
     """
     Capture endpoint for processing different types of content.
-    Returns 202 Accepted immediately while processing happens asynchronously.
+    Returns 202 Accepted immediately while processing happens asynchronously,
+    or 200 with the existing item if the canonical URL was already captured.
     """
     try:
         # Validate request
         if not request.url:
+            count_capture(request.source_type, "rejected", CAPTURE_TASKS)
             logger.warning("Capture request received with empty URL")
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="URL is required"
             )
             
-        if request.source_type not in ["webpage", "video", "audio", "voicememo"]:
+        if request.source_type not in CAPTURE_TASKS:
+            count_capture(request.source_type, "rejected", CAPTURE_TASKS)
             logger.warning(f"Invalid source_type received: {request.source_type}")
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Invalid source_type. Must be 'webpage', 'video', 'audio', or 'voicememo'"
             )
 
-        # Generate a unique item ID
-        item_id = str(uuid.uuid4())
-        
-        # Create a new KnowledgeItem in the database
-        db_item = models_KnowledgeItem(
-            id=item_id,
-            user_id=str(uuid.uuid4()),  # Generate a random UUID for now
-            source_url=str(request.url),
-            source_type=request.source_type,
-            status="pending"
-        )
-        
-        # Add to database
-        db.add(db_item)
-        db.commit()
-        db.refresh(db_item)
-        
+        # A repeat capture is answered from the unique source_url index
+        existing = await _find_capture(db, request.url)
+        if existing is None:
+            # Generate a unique item ID
+            item_id = str(uuid.uuid4())
+            inserted = (await db.execute(
+                pg_insert(models_KnowledgeItem)
+                .values(
+                    id=item_id,
+                    user_id=uuid.uuid4(),  # Generate a random UUID for now
+                    source_url=request.url,
+                    source_type=request.source_type,
+                    status="pending",
+                )
+                .on_conflict_do_nothing(index_elements=["source_url"])
+                .returning(models_KnowledgeItem.id)
+            )).scalar()
+            await db.commit()
+            if inserted is None:
+                # A concurrent capture of the same URL committed first
+                existing = await _find_capture(db, request.url)
+                if existing is None:
+                    raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                                        detail="URL is being captured concurrently, retry")
+
+        if existing is not None:
+            logger.info(f"Duplicate capture of {request.url} resolved to item {existing.id}")
+            count_capture(request.source_type, "duplicate", CAPTURE_TASKS)
+            response.status_code = status.HTTP_200_OK
+            return CaptureResponse(
+                item_id=str(existing.id),
+                status=existing.status,
+                message="URL already captured",
+                source_type=existing.source_type,
+                source_url=request.url
+            )
+
         # Log the capture request with structured data
         logger.info("Capture request received", extra={
             "item_id": item_id,
             "source_type": request.source_type,
-            "url": str(request.url),
+            "url": request.url,
             "timestamp": datetime.now().isoformat()
         })
         
         # Enqueue task to Celery/Redis queue
-        if request.source_type == "webpage":
-            task_name = "tasks.process_webpage"
-        elif request.source_type == "voicememo":
-            task_name = "tasks.process_voicememo"
-        else:  # video or audio
-            task_name = "tasks.process_media"
-            
-        # Send task to Celery
-        celery_app.send_task(task_name, args=[item_id])
+        task_name = CAPTURE_TASKS[request.source_type]
+
+        # Send task to Celery; the broker publish is blocking I/O, so keep it off the event loop
+        try:
+            await run_in_threadpool(celery_app.send_task, task_name, args=[item_id])
+        except Exception:
+            await _discard_unqueued(db, [item_id])
+            raise
         
         logger.info(f"Task {task_name} enqueued for item {item_id}")
+        count_capture(request.source_type, "processing", CAPTURE_TASKS)
         
         return CaptureResponse(
             item_id=item_id,
             status="processing",
             message="Capture request received and queued for processing",
             source_type=request.source_type,
-            source_url=str(request.url)
+            source_url=request.url
         )
         
     except HTTPException:
@@ -186,25 +293,222 @@ async def capture_item(request: CaptureRequest, db: Session = Depends(get_db)):
             detail=f"Internal server error: {str(e)}"
         )
 
+async def _discard_unqueued(db: AsyncSession, item_ids: List[str]) -> None:
+    """
+    Delete captured rows whose task could not be published. Nothing would
+    ever process them, and a retried capture would be answered as a
+    duplicate; without the row the retry starts over. Rows a worker has
+    already claimed (the batch published part of its tasks) are kept.
+    """
+    try:
+        await db.rollback()
+        await db.execute(
+            delete(models_KnowledgeItem)
+            .where(models_KnowledgeItem.id.in_(item_ids), models_KnowledgeItem.status == "pending")
+        )
+        await db.commit()
+    except Exception as e:
+        logger.error(f"Error discarding unqueued captures {item_ids}: {str(e)}", exc_info=True)
+
+async def _find_capture(db: AsyncSession, url: str):
+    """Id, status and source type of the item captured from a canonical URL, if any"""
+    return (await db.execute(
+        select(models_KnowledgeItem.id, models_KnowledgeItem.status, models_KnowledgeItem.source_type)
+        .where(models_KnowledgeItem.source_url == url)
+    )).first()
+
+def _rejected_item(index: int, item: dict, error: str) -> CaptureBatchResult:
+    return CaptureBatchResult(
+        index=index,
+        status="rejected",
+        source_type=item.get("source_type") if isinstance(item.get("source_type"), str) else None,
+        source_url=item.get("url") if isinstance(item.get("url"), str) else None,
+        error=error,
+    )
+
+@app.post("/api/v1/capture/batch",
+          response_model=CaptureBatchResponse,
+          status_code=status.HTTP_202_ACCEPTED,
+          tags=["Capture"],
+          summary="Capture many sources in one request",
+          description="""
+          Capture up to 500 sources at once, e.g. a share-sheet burst or a bookmark import.
+          Accepted items are inserted with one multi-row statement and enqueued over a single broker
+          connection. Each item gets its own result: `processing` with its new item_id, `duplicate`
+          if the URL was already captured, or `rejected` with the validation error.
+          """,
+          response_description="Per-item capture results in request order")
+@log_execution_time
+async def capture_batch(request: CaptureBatchRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Batch capture endpoint.
+    Returns 202 Accepted with one result per submitted item.
+    """
+    results = [None] * len(request.items)
+    rows = []
+    first_index = {}
+    repeats = []
+
+    for index, item in enumerate(request.items):
+        try:
+            capture = CaptureRequest.model_validate(item)
+        except ValidationError as e:
+            results[index] = _rejected_item(index, item, "; ".join(err["msg"] for err in e.errors()))
+            continue
+        if capture.source_type not in CAPTURE_TASKS:
+            results[index] = _rejected_item(
+                index, item, "Invalid source_type. Must be 'webpage', 'video', 'audio', or 'voicememo'")
+            continue
+        if capture.url in first_index:
+            # Repeated within the batch: point at the first occurrence
+            repeats.append((index, capture))
+            continue
+        first_index[capture.url] = index
+        rows.append({
+            "id": uuid.uuid4(),
+            "user_id": uuid.uuid4(),  # Generate a random UUID for now
+            "source_url": capture.url,
+            "source_type": capture.source_type,
+            "status": "pending",
+        })
+
+    try:
+        inserted = set()
+        if rows:
+            # One multi-row INSERT; URLs that already exist are skipped, not fatal
+            stmt = (
+                pg_insert(models_KnowledgeItem)
+                .values(rows)
+                .on_conflict_do_nothing(index_elements=["source_url"])
+                .returning(models_KnowledgeItem.id)
+            )
+            inserted = {str(row_id) for row_id in (await db.execute(stmt)).scalars()}
+            await db.commit()
+
+        existing = {}
+        duplicate_urls = [row["source_url"] for row in rows if str(row["id"]) not in inserted]
+        if duplicate_urls:
+            existing = {url: str(item_id) for item_id, url in (await db.execute(
+                select(models_KnowledgeItem.id, models_KnowledgeItem.source_url)
+                .where(models_KnowledgeItem.source_url.in_(duplicate_urls))
+            )).all()}
+
+        tasks = []
+        for row in rows:
+            item_id = str(row["id"])
+            index = first_index[row["source_url"]]
+            if item_id in inserted:
+                tasks.append((CAPTURE_TASKS[row["source_type"]], [item_id]))
+                results[index] = CaptureBatchResult(
+                    index=index, item_id=item_id, status="processing",
+                    source_type=row["source_type"], source_url=row["source_url"])
+            else:
+                results[index] = CaptureBatchResult(
+                    index=index, item_id=existing.get(row["source_url"]), status="duplicate",
+                    source_type=row["source_type"], source_url=row["source_url"],
+                    error="URL already captured")
+
+        if tasks:
+            # Single hop off the event loop and one producer for the whole batch
+            try:
+                await run_in_threadpool(send_tasks, tasks)
+            except Exception:
+                await _discard_unqueued(db, [args[0] for _, args in tasks])
+                raise
+    except Exception as e:
+        logger.error(f"Error processing capture batch: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {str(e)}"
+        )
+
+    for index, capture in repeats:
+        first = results[first_index[capture.url]]
+        results[index] = CaptureBatchResult(
+            index=index, item_id=first.item_id, status="duplicate",
+            source_type=capture.source_type, source_url=capture.url,
+            error=f"Duplicate of item {first.index} in this batch")
+
+    counts = {state: sum(1 for result in results if result.status == state)
+              for state in ("processing", "duplicate", "rejected")}
+    for result in results:
+        count_capture(result.source_type, result.status, CAPTURE_TASKS)
+    logger.info(f"Capture batch of {len(results)}: {counts['processing']} enqueued, "
+                f"{counts['duplicate']} duplicates, {counts['rejected']} rejected")
+    return CaptureBatchResponse(accepted=counts["processing"], duplicates=counts["duplicate"],
+                                rejected=counts["rejected"], results=results)
+
+def _stream_item_json(payload: dict, offloaded: dict):
+    """Item JSON whose offloaded fields are decompressed from storage chunk by chunk"""
+    yield json.dumps(payload, ensure_ascii=False)[:-1]
+    for column, key in offloaded.items():
+        yield f', "{column}": "'
+        for chunk in content_store.iter_text(key):
+            yield json.dumps(chunk, ensure_ascii=False)[1:-1]
+        yield '"'
+    yield '}'
+
+async def _load_cached_item(db: AsyncSession, item_id: str) -> Optional[CachedItem]:
+    """The item's response for the cache, or None if there is no such item"""
+    # The one endpoint that returns the bodies, so it loads the deferred content group
+    db_item = await db.get(models_KnowledgeItem, item_id, options=[undefer_group("content")])
+    if db_item is None:
+        return None
+    offloaded = {
+        column: getattr(db_item, key_column)
+        for column, key_column in CONTENT_KEY_COLUMNS.items()
+        if getattr(db_item, key_column)
+    }
+    payload = schemas_KnowledgeItem.model_validate(db_item, from_attributes=True).model_dump(mode="json", exclude=set(offloaded))
+    if offloaded:
+        # Every upload gets a new key and objects are never rewritten, so the
+        # keys stand in for the bodies' bytes
+        etag = make_etag(json.dumps([payload, offloaded], sort_keys=True).encode(), weak=True)
+        return CachedItem(etag=etag, payload=payload, offloaded=offloaded)
+    body = json.dumps(payload, ensure_ascii=False).encode()
+    return CachedItem(etag=make_etag(body), payload=payload, body=body)
+
 @app.get("/api/v1/knowledge-items/{item_id}", 
          response_model=schemas_KnowledgeItem,
          tags=["Knowledge Items"],
          summary="Get a specific knowledge item",
-         description="Retrieve a specific knowledge item by its unique identifier",
+         description="""
+         Retrieve a specific knowledge item by its unique identifier. Responses carry an
+         `ETag`; send it back in `If-None-Match` to get `304 Not Modified` while the item
+         is unchanged, which is the cheap way to poll for processing to finish.
+         """,
          response_description="The requested knowledge item")
 @log_execution_time
-async def get_knowledge_item(item_id: str, db: Session = Depends(get_db)):
+async def get_knowledge_item(item_id: str, request: Request, db: AsyncSession = Depends(get_db)):
     """
     Get a specific knowledge item by ID
     """
     try:
-        db_item = db.query(models_KnowledgeItem).filter(models_KnowledgeItem.id == item_id).first()
-        if db_item is None:
+        try:
+            item_id = str(uuid.UUID(item_id))
+        except ValueError:
+            raise HTTPException(status_code=404, detail="Knowledge item not found")
+        cached = await item_cache.get_or_load(item_id, lambda: _load_cached_item(db, item_id))
+        if cached is None:
             logger.warning(f"Knowledge item not found: {item_id}")
             raise HTTPException(status_code=404, detail="Knowledge item not found")
-            
-        logger.info(f"Knowledge item retrieved: {item_id}")
-        return db_item
+
+        # no-cache: clients may store the response but must revalidate it each time
+        headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), cached.etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        if cached.body is not None:
+            logger.info(f"Knowledge item retrieved: {item_id}")
+            return Response(cached.body, media_type="application/json", headers=headers)
+
+        # Large bodies live in object storage: check they are there, then stream
+        # them into the JSON document instead of holding them in memory
+        for key in cached.offloaded.values():
+            if not await run_in_threadpool(content_store.storage.exists, key):
+                raise Exception(f"Offloaded content {key} is missing from storage")
+        logger.info(f"Knowledge item retrieved: {item_id} (streaming {', '.join(cached.offloaded)})")
+        return StreamingResponse(_stream_item_json(cached.payload, cached.offloaded),
+                                 media_type="application/json", headers=headers)
     except HTTPException as he:
         # Re-raise HTTP exceptions (like 404) without wrapping them
         raise he
@@ -215,6 +519,131 @@ async def get_knowledge_item(item_id: str, db: Session = Depends(get_db)):
             detail=f"Internal server error: {str(e)}"
         )
 
+@app.get("/api/v1/item-events",
+         tags=["Knowledge Items"],
+         summary="Stream item status changes",
+         description=f"""
+         A Server-Sent Events stream of `status` events, each with the `item_id`,
+         `user_id` and new `status` of an item, for the items given as `item_id`
+         (repeatable, up to {MAX_STREAM_ITEMS}) and for every item of `user_id`.
+         The stream opens with the current status of the listed items, then sends
+         each change as the worker commits it. Returns 503 while item events are
+         unavailable; clients then fall back to polling.
+         """,
+         response_class=StreamingResponse,
+         response_description="text/event-stream of status events")
+async def stream_item_events(
+    item_id: List[str] = Query(default=[], description="Items to watch"),
+    user_id: Optional[str] = Query(default=None, description="Watch every item of this user"),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Stream status changes of knowledge items
+    """
+    if not item_id and user_id is None:
+        raise HTTPException(status_code=400, detail="Filter the stream by item_id or user_id")
+    if len(item_id) > MAX_STREAM_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_STREAM_ITEMS} item_id values per stream")
+    try:
+        item_ids = {str(uuid.UUID(value)) for value in item_id}
+        user_id = str(uuid.UUID(user_id)) if user_id is not None else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="item_id and user_id must be UUIDs")
+    if not item_hub.live:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Item events are unavailable")
+
+    # Subscribe before reading the current status so no change falls in between
+    subscription = item_hub.subscribe(item_ids, user_id)
+    try:
+        snapshot = []
+        if item_ids:
+            rows = (await db.execute(
+                select(models_KnowledgeItem.id, models_KnowledgeItem.user_id, models_KnowledgeItem.status)
+                .where(models_KnowledgeItem.id.in_([uuid.UUID(value) for value in item_ids]))
+            )).all()
+            snapshot = [{"item_id": str(row.id), "user_id": str(row.user_id), "status": row.status} for row in rows]
+        # The stream can stay open for hours; don't hold a connection for it
+        await db.close()
+    except Exception as e:
+        item_hub.unsubscribe(subscription)
+        logger.error(f"Error opening item event stream: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {str(e)}"
+        )
+    logger.info(f"Item event stream opened for {len(item_ids)} items" + (f" and user {user_id}" if user_id else ""))
+    return StreamingResponse(sse_stream(item_hub, subscription, snapshot), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/api/v1/search",
+         response_model=SearchResponse,
+         tags=["Knowledge Items"],
+         summary="Search captured knowledge",
+         description="""
+         Full-text search over item titles and processed text. `q` accepts web search
+         syntax: quoted phrases, `OR` and `-word`. Results are ranked with title matches
+         above body matches and carry a snippet with matched terms wrapped in `<b></b>`.
+         """,
+         response_description="Matching items, best match first")
+@log_execution_time
+async def search_knowledge_items(
+    q: str = Query(..., min_length=1, max_length=256),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+    source_type: Optional[Literal["webpage", "video", "audio", "voicememo", "note"]] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Search knowledge items
+    """
+    try:
+        results = await search_items(db, q, limit, offset, source_type, content_store=content_store)
+        logger.info(f"Search for {q!r} returned {len(results)} results")
+        return SearchResponse(query=q, results=[SearchResult.model_validate(result) for result in results])
+    except Exception as e:
+        logger.error(f"Error searching knowledge items for {q!r}: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {str(e)}"
+        )
+
+@app.get("/api/v1/knowledge-items/{item_id}/similar",
+         response_model=SimilarItemsResponse,
+         tags=["Knowledge Items"],
+         summary="Find similar knowledge items",
+         description="""
+         Items whose embeddings are nearest to this item's, by cosine similarity.
+         Embeddings are computed by the worker after an item is ready_for_distillation;
+         an item without one yet returns 409.
+         """,
+         response_description="Nearest items, most similar first")
+@log_execution_time
+async def get_similar_items(item_id: str, limit: int = Query(10, ge=1, le=50), db: AsyncSession = Depends(get_db)):
+    """
+    Get items similar to a knowledge item
+    """
+    try:
+        try:
+            item_uuid = uuid.UUID(item_id)
+        except ValueError:
+            raise HTTPException(status_code=404, detail="Knowledge item not found")
+        model = await embedding_model(db, item_uuid)
+        if model is None:
+            if await db.get(models_KnowledgeItem, item_uuid) is None:
+                raise HTTPException(status_code=404, detail="Knowledge item not found")
+            raise HTTPException(status_code=409, detail="Knowledge item has not been embedded yet")
+        rows = await similar_items(db, item_uuid, model, limit)
+        logger.info(f"Found {len(rows)} items similar to {item_id}")
+        return SimilarItemsResponse(item_id=item_id, model=model, results=[SimilarItem.model_validate(row) for row in rows])
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logger.error(f"Error finding items similar to {item_id}: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Internal server error: {str(e)}"
+        )
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
@@ -1,19 +1,39 @@
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey
-from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Integer, BigInteger, DDL, event
+from sqlalchemy.dialects.postgresql import TSVECTOR, UUID as PG_UUID
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql import func
+from pgvector.sqlalchemy import Vector
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from database import Base
 import uuid
 
+@compiles(PG_UUID, "sqlite")
+def _uuid_on_sqlite(type_, compiler, **kw):
+    # SQLite databases (search stand-in, tests) keep UUIDs as 32-char hex strings
+    return "CHAR(32)"
+
 class KnowledgeItem(Base):
     __tablename__ = "knowledge_items"
 
     id = Column(PG_UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(PG_UUID(as_uuid=True), nullable=False)
-    processed_text_content = Column(Text, nullable=True)
-    processed_html_content = Column(Text, nullable=True)
+    # Bodies can run to megabytes: they are only loaded by endpoints that return
+    # them (undefer_group("content")); listings read the length columns instead.
+    # Writers go through content_store, which keeps lengths and pointers in step
+    processed_text_content = deferred(Column(Text, nullable=True), group="content")
+    processed_html_content = deferred(Column(Text, nullable=True), group="content")
+    text_content_length = Column(Integer, nullable=True)  # NULL when there is no text
+    html_content_length = Column(Integer, nullable=True)
+    # Storage keys of bodies offloaded to object storage (content_store); the
+    # inline column is NULL while a key is set
+    text_content_key = Column(Text, nullable=True)
+    html_content_key = Column(Text, nullable=True)
+    # Weighted title + body lexemes for /api/v1/search (GIN indexed), written by
+    # the worker with the content; SQLite databases use an FTS5 table instead
+    search_vector = deferred(Column(TSVECTOR().with_variant(Text(), "sqlite"), nullable=True))
     title = Column(Text, nullable=True)
     source_url = Column(Text, nullable=True, unique=True)  # Ensure each URL is only captured once
     author = Column(Text, nullable=True)
@@ -32,4 +52,55 @@ class ImageAsset(Base):
     storage_key = Column(Text, nullable=False)
     original_url = Column(Text, nullable=True)
     mime_type = Column(String(50), nullable=True)
+    content_hash = Column(String(64), ForeignKey('image_blobs.content_hash'), nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, default=func.now())
+
+class ImageBlob(Base):
+    __tablename__ = "image_blobs"
+
+    content_hash = Column(String(64), primary_key=True)  # sha256 hex digest of the image bytes
+    storage_key = Column(Text, nullable=False)
+    size_bytes = Column(BigInteger, nullable=False)
+    mime_type = Column(String(50), nullable=True)
+    ref_count = Column(Integer, nullable=False, default=0)  # number of image_assets rows pointing here
+    created_at = Column(DateTime(timezone=True), nullable=False, default=func.now())
+
+# Dimension of stored item embeddings (the hashing embedder and all-MiniLM-L6-v2)
+EMBEDDING_DIM = 384
+
+class KnowledgeItemEmbedding(Base):
+    __tablename__ = "knowledge_item_embeddings"
+
+    knowledge_item_id = Column(PG_UUID(as_uuid=True), ForeignKey('knowledge_items.id', ondelete='CASCADE'), primary_key=True)
+    model = Column(String(100), nullable=False)  # vectors are only compared within one model
+    chunk_count = Column(Integer, nullable=False)
+    embedding = Column(Vector(EMBEDDING_DIM), nullable=False)  # float32, HNSW indexed for cosine distance
     created_at = Column(DateTime(timezone=True), nullable=False, default=func.now())
+
+# create_all needs the pgvector extension before it can create the table
+event.listen(
+    KnowledgeItemEmbedding.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS vector").execute_if(dialect="postgresql"),
+)
+
+# Stages a processing task can time, each stored as <stage>_ms
+ITEM_STAGES = ("fetch", "extract", "images", "download", "transcribe", "commit")
+
+class KnowledgeItemStats(Base):
+    __tablename__ = "knowledge_item_stats"
+
+    # One row per item, overwritten by each processing attempt; NULL stages did not run
+    knowledge_item_id = Column(PG_UUID(as_uuid=True), ForeignKey('knowledge_items.id', ondelete='CASCADE'), primary_key=True)
+    outcome = Column(String(20), nullable=False)  # success or error
+    total_ms = Column(Integer, nullable=False)
+    fetch_ms = Column(Integer, nullable=True)  # page download
+    extract_ms = Column(Integer, nullable=True)  # readability and metadata
+    images_ms = Column(Integer, nullable=True)  # image downloads and blob writes
+    download_ms = Column(Integer, nullable=True)  # yt-dlp
+    transcribe_ms = Column(Integer, nullable=True)  # STT service
+    commit_ms = Column(Integer, nullable=True)  # content offload and the final transaction
+    bytes_downloaded = Column(BigInteger, nullable=False, default=0)
+    images_found = Column(Integer, nullable=True)
+    images_stored = Column(Integer, nullable=True)
+    recorded_at = Column(DateTime(timezone=True), nullable=False, default=func.now())
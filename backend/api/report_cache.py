@@ -0,0 +1,80 @@
+"""
+A report that is expensive to produce (console health, Celery metrics),
+reused for a few seconds. Concurrent refreshes share one run: callers that
+arrive while a refresh is in progress wait for its result. SingleFlight,
+which does the sharing, also backs the knowledge item cache.
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterator, Optional
+
+
+class _FlightAbandoned(Exception):
+    """The request running a flight went away; waiters run it themselves"""
+
+
+class SingleFlight:
+    """At most one run per key: callers arriving during a run await its result"""
+
+    def __init__(self):
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._flights
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(list(self._flights))
+
+    async def run(self, key: Hashable, produce: Callable[[], Awaitable[Any]],
+                  on_result: Optional[Callable[[Any], None]] = None) -> Any:
+        """
+        The result of `produce()`, or of the run already in progress for `key`.
+        `on_result` is called with the result by the caller that produced it,
+        before any later caller can start a new run.
+        """
+        while key in self._flights:
+            try:
+                return await asyncio.shield(self._flights[key])
+            except _FlightAbandoned:
+                continue
+
+        flight = self._flights[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await produce()
+        except BaseException as exc:
+            flight.set_exception(exc if isinstance(exc, Exception) else _FlightAbandoned())
+            flight.exception()  # retrieved; waiters get their own copy
+            raise
+        else:
+            flight.set_result(result)
+            if on_result is not None:
+                on_result(result)
+            return result
+        finally:
+            del self._flights[key]
+
+
+class CachedReport:
+    def __init__(self, ttl: float, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self.clear()
+
+    def clear(self) -> None:
+        self.report: Optional[Dict[str, Any]] = None
+        self.expires_at = 0.0
+        self._refresh = SingleFlight()
+
+    async def get(self, collect: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """The report if it is fresh, otherwise the result of a refresh"""
+        if self.report is not None and self.clock() < self.expires_at:
+            return self.report
+        return await self.refresh(collect)
+
+    async def refresh(self, collect: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """A newly collected report, joining the refresh already in progress if there is one"""
+        return await self._refresh.run("report", collect, self._refreshed)
+
+    def _refreshed(self, report: Dict[str, Any]) -> None:
+        self.report, self.expires_at = report, self.clock() + self.ttl
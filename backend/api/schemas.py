@@ -2,8 +2,43 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from pydantic import BaseModel, Field, field_validator
-from typing import Literal, Optional
+from typing import Any, Dict, List, Literal, Optional
 import re
+from urllib.parse import urlsplit, urlunsplit
+
+# Query parameters that only identify the referring campaign or click;
+# they never change the content, so they are dropped from captured URLs
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "gbraid", "wbraid", "msclkid", "yclid",
+                   "mc_cid", "mc_eid", "igshid", "ref_src", "_ga", "_hsenc", "_hsmi"}
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+def canonicalize_url(url: str) -> str:
+    """
+    Canonical form used as the unique source_url of a capture.
+    Lowercases the scheme and host, drops default ports, fragments,
+    tracking parameters and trailing slashes. The remaining query string
+    is kept verbatim and in order, since its meaning is up to the site.
+    """
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    userinfo, _, hostport = parts.netloc.rpartition("@")
+    if ":" in hostport and not hostport.endswith("]"):  # "]" ends a bare IPv6 literal
+        host, _, port = hostport.rpartition(":")
+    else:
+        host, port = hostport, ""
+    netloc = host.lower() + (f":{port}" if port and port != DEFAULT_PORTS.get(scheme) else "")
+    if userinfo:
+        netloc = f"{userinfo}@{netloc}"
+    path = parts.path.rstrip("/")
+    query = "&".join(
+        param for param in parts.query.split("&")
+        if param and not _is_tracking_param(param.split("=", 1)[0])
+    )
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+def _is_tracking_param(name: str) -> bool:
+    name = name.lower()
+    return name.startswith("utm_") or name in TRACKING_PARAMS
 
 class CaptureRequest(BaseModel):
     source_type: Literal["webpage", "video", "audio", "voicememo", "note"]
@@ -27,7 +62,7 @@ class CaptureRequest(BaseModel):
             r'(?:/?|[/?]\S+)$', re.IGNORECASE)
         if not url_pattern.match(v):
             raise ValueError('Invalid URL format')
-        return v
+        return canonicalize_url(v)
 
 class CaptureResponse(BaseModel):
     item_id: str
@@ -36,10 +71,41 @@ class CaptureResponse(BaseModel):
     source_type: str
     source_url: str
 
+# Upper bound on one batch; keeps the multi-row INSERT well under the
+# 32767 bind parameter limit of the Postgres protocol
+CAPTURE_BATCH_MAX_ITEMS = 500
+
+class CaptureBatchRequest(BaseModel):
+    # Items are validated one by one against CaptureRequest so a single bad
+    # URL is reported in its result instead of rejecting the whole import
+    items: List[Dict[str, Any]] = Field(..., min_length=1, max_length=CAPTURE_BATCH_MAX_ITEMS)
+
+class CaptureBatchResult(BaseModel):
+    index: int
+    item_id: Optional[str] = None
+    status: Literal["processing", "duplicate", "rejected"]
+    source_type: Optional[str] = None
+    source_url: Optional[str] = None
+    error: Optional[str] = None
+
+class CaptureBatchResponse(BaseModel):
+    accepted: int
+    duplicates: int
+    rejected: int
+    results: List[CaptureBatchResult]
+
+def _as_string(v):
+    # ORM rows carry UUIDs and datetimes; the API returns them as strings
+    if v is None or isinstance(v, str):
+        return v
+    return v.isoformat() if hasattr(v, 'isoformat') else str(v)
+
 class KnowledgeItemBase(BaseModel):
     user_id: str
     processed_text_content: Optional[str] = None
     processed_html_content: Optional[str] = None
+    text_content_length: Optional[int] = None
+    html_content_length: Optional[int] = None
     title: Optional[str] = None
     source_url: Optional[str] = None
     author: Optional[str] = None
@@ -50,11 +116,57 @@ class KnowledgeItemBase(BaseModel):
     processed_at: Optional[str] = None
     last_error: Optional[str] = None
 
+    @field_validator('user_id', 'published_date', 'created_at', 'processed_at', mode='before')
+    def stringify(cls, v):
+        return _as_string(v)
+
 class KnowledgeItemCreate(KnowledgeItemBase):
     pass
 
 class KnowledgeItem(KnowledgeItemBase):
     id: str
 
+    @field_validator('id', mode='before')
+    def stringify_id(cls, v):
+        return _as_string(v)
+
     class Config:
         orm_mode = True
+
+class SearchResult(BaseModel):
+    id: str
+    title: Optional[str] = None
+    source_url: Optional[str] = None
+    source_type: str
+    status: str
+    created_at: Optional[str] = None
+    rank: float
+    # Matched terms are wrapped in <b></b>
+    snippet: Optional[str] = None
+
+    @field_validator('id', 'created_at', mode='before')
+    def stringify(cls, v):
+        return _as_string(v)
+
+class SearchResponse(BaseModel):
+    query: str
+    results: List[SearchResult]
+
+class SimilarItem(BaseModel):
+    id: str
+    title: Optional[str] = None
+    source_url: Optional[str] = None
+    source_type: str
+    status: str
+    created_at: Optional[str] = None
+    # Cosine similarity of the item embeddings, 1.0 for identical direction
+    similarity: float
+
+    @field_validator('id', 'created_at', mode='before')
+    def stringify(cls, v):
+        return _as_string(v)
+
+class SimilarItemsResponse(BaseModel):
+    item_id: str
+    model: str
+    results: List[SimilarItem]
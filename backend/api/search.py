@@ -0,0 +1,179 @@
+"""
+Full-text search over knowledge items.
+Postgres keeps a weighted tsvector per item in knowledge_items.search_vector
+(GIN indexed), written by the worker together with the processed content.
+SQLite databases (tests, local experiments) use an FTS5 table kept in step
+by triggers instead, so the endpoint works without Postgres.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import cast, func, text
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# Text search configuration; migration 007 backfilled existing rows with it too
+SEARCH_TEXT_CONFIG = 'english'
+# tsvector values are capped at 1 MB; index the head of very long bodies
+SEARCH_MAX_INDEXED_CHARS = 512 * 1024
+# Matches ranked per query. Terms found in a large share of all items would
+# otherwise rank the whole table; past this many, results come from the
+# first matches the index yields rather than the global best
+SEARCH_MAX_CANDIDATES = int(os.getenv('SEARCH_MAX_CANDIDATES', '5000'))
+# Snippets are built from the title and the start of the body only, so a result never
+# has to re-parse a whole multi-megabyte document. For offloaded bodies only this
+# much is read back from the content store, for the returned page of results
+SEARCH_SNIPPET_CHARS = 20000
+SNIPPET_START, SNIPPET_STOP, SNIPPET_ELLIPSIS = '<b>', '</b>', ' … '
+
+HEADLINE_OPTIONS = (f'StartSel={SNIPPET_START}, StopSel={SNIPPET_STOP}, MaxWords=30, MinWords=12, '
+                    f'MaxFragments=2, FragmentDelimiter="{SNIPPET_ELLIPSIS}"')
+
+
+def search_vector(title, body):
+    """tsvector expression for an item, with title matches ranked above body matches"""
+    config = cast(SEARCH_TEXT_CONFIG, REGCONFIG)
+    weighted_title = func.setweight(func.to_tsvector(config, func.coalesce(title, '')), 'A')
+    weighted_body = func.setweight(
+        func.to_tsvector(config, func.left(func.coalesce(body, ''), SEARCH_MAX_INDEXED_CHARS)), 'B')
+    return weighted_title.op('||')(weighted_body)
+
+
+_POSTGRES_SEARCH = """
+    WITH query AS (SELECT websearch_to_tsquery(CAST(:config AS regconfig), :q) AS q),
+    candidates AS (
+        SELECT k.id, k.search_vector
+        FROM knowledge_items k, query
+        WHERE k.search_vector @@ query.q {filters}
+        LIMIT :max_candidates
+    ),
+    matches AS (
+        SELECT c.id, ts_rank_cd(c.search_vector, query.q, 1) AS rank
+        FROM candidates c, query
+        ORDER BY rank DESC, c.id
+        LIMIT :limit OFFSET :offset
+    )
+    SELECT k.id, k.title, k.source_url, k.source_type, k.status, k.created_at, m.rank, k.text_content_key,
+           ts_headline(CAST(:config AS regconfig),
+                       left(concat_ws(' ', k.title, k.processed_text_content), :snippet_chars),
+                       query.q, :headline_options) AS snippet
+    FROM matches m JOIN knowledge_items k ON k.id = m.id, query
+    ORDER BY m.rank DESC, k.id
+"""
+
+# Highlights for bodies read back from the content store, one row per document
+_POSTGRES_HEADLINES = """
+    SELECT ts_headline(CAST(:config AS regconfig), d.doc,
+                       websearch_to_tsquery(CAST(:config AS regconfig), :q), :headline_options)
+    FROM unnest(CAST(:docs AS text[])) WITH ORDINALITY AS d(doc, n)
+    ORDER BY d.n
+"""
+
+_SQLITE_SEARCH = """
+    SELECT k.id, k.title, k.source_url, k.source_type, k.status, k.created_at,
+           -bm25(knowledge_items_fts, 10.0, 1.0) AS rank,
+           snippet(knowledge_items_fts, -1, :start, :stop, :ellipsis, 24) AS snippet
+    FROM knowledge_items_fts JOIN knowledge_items k ON k.rowid = knowledge_items_fts.rowid
+    WHERE knowledge_items_fts MATCH :q {filters}
+    ORDER BY rank DESC
+    LIMIT :limit OFFSET :offset
+"""
+
+# External-content FTS5 index over knowledge_items, maintained by triggers
+SQLITE_SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS knowledge_items_fts USING fts5(
+           title, processed_text_content, content='knowledge_items', content_rowid='rowid')""",
+    """CREATE TRIGGER IF NOT EXISTS knowledge_items_fts_insert AFTER INSERT ON knowledge_items BEGIN
+           INSERT INTO knowledge_items_fts(rowid, title, processed_text_content)
+           VALUES (new.rowid, new.title, new.processed_text_content);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS knowledge_items_fts_delete AFTER DELETE ON knowledge_items BEGIN
+           INSERT INTO knowledge_items_fts(knowledge_items_fts, rowid, title, processed_text_content)
+           VALUES ('delete', old.rowid, old.title, old.processed_text_content);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS knowledge_items_fts_update
+       AFTER UPDATE OF title, processed_text_content ON knowledge_items BEGIN
+           INSERT INTO knowledge_items_fts(knowledge_items_fts, rowid, title, processed_text_content)
+           VALUES ('delete', old.rowid, old.title, old.processed_text_content);
+           INSERT INTO knowledge_items_fts(rowid, title, processed_text_content)
+           VALUES (new.rowid, new.title, new.processed_text_content);
+       END""",
+]
+
+
+def install_sqlite_search(connection) -> None:
+    """Create the FTS5 stand-in for search_vector on a SQLite database"""
+    for statement in SQLITE_SEARCH_DDL:
+        connection.execute(text(statement))
+
+
+def fts5_query(q: str) -> str:
+    """
+    FTS5 MATCH expression requiring every word of `q`. Words are quoted so
+    user input is never parsed as FTS5 syntax; Postgres' websearch syntax
+    (quoted phrases, OR, -word) is not emulated by the stand-in.
+    """
+    return ' '.join('"' + word.replace('"', '""') + '"' for word in q.split())
+
+
+async def _offloaded_snippets(db: AsyncSession, q: str, results: List[Dict[str, Any]], content_store) -> None:
+    """
+    Re-highlight results whose body is offloaded: in the row their snippet
+    could only come from the title. Reads the head of each body, for this
+    page only, and keeps the title snippet if a read fails.
+    """
+    offloaded = [result for result in results if result["text_content_key"]]
+    if not offloaded:
+        return
+    heads = await asyncio.gather(
+        *(run_in_threadpool(content_store.read_head, result["text_content_key"], SEARCH_SNIPPET_CHARS)
+          for result in offloaded),
+        return_exceptions=True)
+    docs, targets = [], []
+    for result, head in zip(offloaded, heads):
+        if isinstance(head, Exception):
+            logger.warning(f"Could not read offloaded content {result['text_content_key']} for a snippet: {str(head)}")
+            continue
+        docs.append(' '.join(part for part in (result["title"], head) if part)[:SEARCH_SNIPPET_CHARS])
+        targets.append(result)
+    if not docs:
+        return
+    snippets = (await db.execute(text(_POSTGRES_HEADLINES), {
+        "config": SEARCH_TEXT_CONFIG, "q": q, "docs": docs, "headline_options": HEADLINE_OPTIONS})).scalars().all()
+    for result, snippet in zip(targets, snippets):
+        result["snippet"] = snippet
+
+
+async def search_items(db: AsyncSession, q: str, limit: int, offset: int = 0,
+                       source_type: Optional[str] = None, content_store=None) -> List[Dict[str, Any]]:
+    """
+    Best matches for `q`, highest rank first, each with a highlighted snippet.
+    With a content store, offloaded bodies contribute to their items' snippets.
+    """
+    params = {"limit": limit, "offset": offset}
+    filters = ""
+    if source_type:
+        filters = "AND k.source_type = :source_type"
+        params["source_type"] = source_type
+
+    if db.get_bind().dialect.name == "sqlite":
+        match = fts5_query(q)
+        if not match:
+            return []
+        params.update(q=match, start=SNIPPET_START, stop=SNIPPET_STOP, ellipsis=SNIPPET_ELLIPSIS)
+        statement = _SQLITE_SEARCH.format(filters=filters)
+        return [dict(row._mapping) for row in (await db.execute(text(statement), params)).all()]
+
+    params.update(q=q, config=SEARCH_TEXT_CONFIG, max_candidates=SEARCH_MAX_CANDIDATES,
+                  snippet_chars=SEARCH_SNIPPET_CHARS, headline_options=HEADLINE_OPTIONS)
+    statement = _POSTGRES_SEARCH.format(filters=filters)
+    results = [dict(row._mapping) for row in (await db.execute(text(statement), params)).all()]
+    if content_store is not None:
+        await _offloaded_snippets(db, q, results, content_store)
+    return results
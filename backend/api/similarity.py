@@ -0,0 +1,78 @@
+"""
+Items similar to a given one, by cosine distance between item embeddings.
+Postgres answers from the HNSW index on knowledge_item_embeddings (pgvector's
+<=> operator); SQLite databases compare the vectors with NumPy instead.
+"""
+
+import os
+import uuid
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import KnowledgeItem, KnowledgeItemEmbedding
+
+# Candidates the HNSW index examines per query (pgvector's hnsw.ef_search):
+# higher finds more of the exact nearest neighbours at some latency cost.
+# Raised for large limits so filtering out the item itself never leaves a page short
+HNSW_EF_SEARCH = int(os.getenv('HNSW_EF_SEARCH', '100'))
+
+_POSTGRES_SIMILAR = """
+    SELECT k.id, k.title, k.source_url, k.source_type, k.status, k.created_at,
+           1 - (e.embedding <=> (SELECT embedding FROM knowledge_item_embeddings WHERE knowledge_item_id = :item_id))
+               AS similarity
+    FROM knowledge_item_embeddings e JOIN knowledge_items k ON k.id = e.knowledge_item_id
+    WHERE e.model = :model AND e.knowledge_item_id <> :item_id
+    ORDER BY e.embedding <=> (SELECT embedding FROM knowledge_item_embeddings WHERE knowledge_item_id = :item_id)
+    LIMIT :limit
+"""
+
+
+async def embedding_model(db: AsyncSession, item_id: uuid.UUID) -> Optional[str]:
+    """Model of the item's embedding, or None if it has not been embedded"""
+    return (await db.execute(
+        select(KnowledgeItemEmbedding.model).where(KnowledgeItemEmbedding.knowledge_item_id == item_id)
+    )).scalar_one_or_none()
+
+
+async def similar_items(db: AsyncSession, item_id: uuid.UUID, model: str, limit: int) -> List[Dict[str, Any]]:
+    """The `limit` nearest items embedded with the same model, most similar first"""
+    if db.get_bind().dialect.name == "sqlite":
+        return await _similar_items_numpy(db, item_id, model, limit)
+    await db.execute(text("SELECT set_config('hnsw.ef_search', :ef_search, true)"),
+                     {"ef_search": str(max(HNSW_EF_SEARCH, 2 * limit))})
+    result = await db.execute(text(_POSTGRES_SIMILAR), {"item_id": item_id, "model": model, "limit": limit})
+    return [dict(row._mapping) for row in result]
+
+
+async def _similar_items_numpy(db: AsyncSession, item_id: uuid.UUID, model: str, limit: int) -> List[Dict[str, Any]]:
+    """Exact search over every vector of the model; only meant for small SQLite databases"""
+    rows = (await db.execute(
+        select(KnowledgeItemEmbedding.knowledge_item_id, KnowledgeItemEmbedding.embedding)
+        .where(KnowledgeItemEmbedding.model == model)
+    )).all()
+    target = next(np.asarray(row.embedding, dtype=np.float32) for row in rows if row.knowledge_item_id == item_id)
+    others = [row for row in rows if row.knowledge_item_id != item_id]
+    if not others:
+        return []
+    vectors = np.stack([np.asarray(row.embedding, dtype=np.float32) for row in others])
+    norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(target)
+    similarity = vectors @ target / np.where(norms == 0, 1, norms)
+    nearest = np.argsort(-similarity)[:limit]
+
+    ids = [others[i].knowledge_item_id for i in nearest]
+    items = {
+        item.id: item
+        for item in (await db.execute(
+            select(KnowledgeItem.id, KnowledgeItem.title, KnowledgeItem.source_url, KnowledgeItem.source_type,
+                   KnowledgeItem.status, KnowledgeItem.created_at)
+            .where(KnowledgeItem.id.in_(ids))
+        )).all()
+    }
+    return [
+        dict(items[others[i].knowledge_item_id]._mapping, similarity=float(similarity[i]))
+        for i in nearest
+        if others[i].knowledge_item_id in items
+    ]
@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+from typing import BinaryIO, Optional
+
+
+class LocalStorage:
+    """Object storage rooted at a local directory (STORAGE_ROOT)"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path_for(key))
+
+    def _write_atomically(self, key: str, write) -> None:
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a sibling temp file and rename so readers never see a partial object
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    def put_bytes(self, key: str, data: bytes, content_type: Optional[str] = None) -> None:
+        self._write_atomically(key, lambda f: f.write(data))
+
+    def put_file(self, key: str, source_path: str, content_type: Optional[str] = None) -> None:
+        """Copy a local file into storage in chunks"""
+        def copy(f):
+            with open(source_path, 'rb') as source:
+                shutil.copyfileobj(source, f)
+        self._write_atomically(key, copy)
+
+    def get_bytes(self, key: str) -> bytes:
+        with open(self.path_for(key), 'rb') as f:
+            return f.read()
+
+    def open(self, key: str) -> BinaryIO:
+        """Binary file object for reading an object incrementally"""
+        return open(self.path_for(key), 'rb')
+
+    def delete(self, key: str) -> None:
+        path = self.path_for(key)
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+class S3Storage:
+    """Object storage in a MinIO/S3 bucket"""
+
+    def __init__(self, client, bucket: str):
+        self.client = client
+        self.bucket = bucket
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except self.client.exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def put_bytes(self, key: str, data: bytes, content_type: Optional[str] = None) -> None:
+        extra = {'ContentType': content_type} if content_type else {}
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data, **extra)
+
+    def put_file(self, key: str, source_path: str, content_type: Optional[str] = None) -> None:
+        """Upload a local file; boto3 streams large files as multipart uploads"""
+        extra = {'ContentType': content_type} if content_type else None
+        self.client.upload_file(source_path, self.bucket, key, ExtraArgs=extra)
+
+    def get_bytes(self, key: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+
+    def open(self, key: str) -> BinaryIO:
+        """Streaming body of the object; read() pulls it from the bucket incrementally"""
+        return self.client.get_object(Bucket=self.bucket, Key=key)['Body']
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+
+def storage_from_env():
+    """
+    Storage backend named by STORAGE_BACKEND: "local" (STORAGE_ROOT) or "s3" (MINIO_*).
+    Processes that read what the worker wrote must be configured like the worker.
+    """
+    if os.getenv('STORAGE_BACKEND', 'local') == 's3':
+        import boto3
+        client = boto3.client(
+            's3',
+            endpoint_url=os.getenv('MINIO_ENDPOINT', 'http://localhost:9000'),
+            aws_access_key_id=os.getenv('MINIO_ACCESS_KEY', 'minioadmin'),
+            aws_secret_access_key=os.getenv('MINIO_SECRET_KEY', 'minioadmin'),
+            region_name='us-east-1',
+        )
+        return S3Storage(client, os.getenv('MINIO_BUCKET', 'synapse'))
+    default_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'storage')
+    return LocalStorage(os.getenv('STORAGE_ROOT', os.path.normpath(default_root)))
@@ -10,19 +10,60 @@ from pathlib import Path
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from main import app
-from models import KnowledgeItem
-from schemas import KnowledgeItemCreate, KnowledgeItemBase
-from database import get_db
+from models import KnowledgeItem, KnowledgeItemStats
+from schemas import KnowledgeItemCreate, KnowledgeItemBase, canonicalize_url
+from database import get_db, engine_options
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Insert
+from sqlalchemy.dialects import postgresql
+from celery_app import celery_app, send_tasks
+from item_events import RESYNC_STATUS, encode_item_event
+import json
 import uuid
 
 client = TestClient(app)
 
+def _fake_execute(stmt, *args, **kwargs):
+    """
+    Stand-in for AsyncSession.execute on an empty table: lookups find
+    nothing and every INSERT ... RETURNING id reports its rows as inserted.
+    """
+    result = MagicMock()
+    result.first.return_value = None
+    result.all.return_value = []
+    result.scalars.return_value = []
+    if isinstance(stmt, Insert):
+        params = stmt.compile(dialect=postgresql.dialect()).params
+        ids = [value for key, value in params.items() if key == "id" or key.startswith("id_m")]
+        result.scalar.return_value = ids[0]
+        result.scalars.return_value = ids
+    return result
+
 @pytest.fixture
 def mock_db_session():
-    """Mock database session for testing"""
-    session = MagicMock()
+    """Mock async database session for testing; awaited methods are AsyncMocks"""
+    session = MagicMock(spec=AsyncSession)
+    session.execute.side_effect = _fake_execute
     yield session
 
+@pytest.fixture(autouse=True)
+def mock_item_events():
+    """Console edits publish item events; keep them off Redis"""
+    with patch('console_routes.publish_item_event') as publish:
+        yield publish
+
+@pytest.fixture(autouse=True)
+def reset_console_reports():
+    """Health and metrics reports and the clients behind them are cached across requests"""
+    import console_routes
+    from celery_metrics import celery_metrics
+    yield
+    console_routes._health_report.clear()
+    celery_metrics.report.clear()
+    for client_factory in (console_routes._redis_client, console_routes._s3_client, console_routes._stt_session,
+                           console_routes._content_store):
+        client_factory.cache_clear()
+
 @pytest.fixture
 def mock_celery_task():
     """Mock Celery task for testing"""
@@ -45,7 +86,7 @@ def test_capture_webpage_success(mock_db_session, mock_celery_task):
         "url": "https://example.com"
     }
     
-    with patch('main.SessionLocal', return_value=mock_db_session):
+    with patch.dict(app.dependency_overrides, {get_db: lambda: mock_db_session}):
         response = client.post("/api/v1/capture", json=capture_data)
         
     assert response.status_code == 202
@@ -63,7 +104,7 @@ def test_capture_media_success(mock_db_session, mock_celery_task):
         "url": "https://youtube.com/watch?v=123"
     }
     
-    with patch('main.SessionLocal', return_value=mock_db_session):
+    with patch.dict(app.dependency_overrides, {get_db: lambda: mock_db_session}):
         response = client.post("/api/v1/capture", json=capture_data)
         
     assert response.status_code == 202
@@ -101,7 +142,7 @@ def test_capture_voicememo_success(mock_db_session, mock_celery_task):
         "url": "https://example.com/audio.mp3"
     }
     
-    with patch('main.SessionLocal', return_value=mock_db_session):
+    with patch.dict(app.dependency_overrides, {get_db: lambda: mock_db_session}):
         response = client.post("/api/v1/capture", json=capture_data)
         
     assert response.status_code == 202
@@ -145,8 +186,8 @@ def test_get_knowledge_item_server_error(mock_db_session):
     """Test server error when getting knowledge item"""
     item_id = str(uuid.uuid4())
     
-    with patch('main.SessionLocal', return_value=mock_db_session):
-        mock_db_session.query().filter().first.side_effect = Exception("Database error")
+    with patch.dict(app.dependency_overrides, {get_db: lambda: mock_db_session}):
+        mock_db_session.get.side_effect = Exception("Database error")
         response = client.get(f"/api/v1/knowledge-items/{item_id}")
         
     assert response.status_code == 500
@@ -156,8 +197,8 @@ def test_get_knowledge_item_not_found(mock_db_session):
     """Test getting non-existent knowledge item"""
     item_id = str(uuid.uuid4())
     
-    with patch('main.SessionLocal', return_value=mock_db_session):
-        mock_db_session.query().filter().first.return_value = None
+    with patch.dict(app.dependency_overrides, {get_db: lambda: mock_db_session}):
+        mock_db_session.get.return_value = None
         response = client.get(f"/api/v1/knowledge-items/{item_id}")
         
     assert response.status_code == 404
@@ -176,8 +217,8 @@ def test_get_knowledge_item_success(mock_db_session):
         processed_text_content="Test content"
     )
     
-    with patch('main.SessionLocal', return_value=mock_db_session):
-        mock_db_session.query().filter().first.return_value = mock_item
+    with patch.dict(app.dependency_overrides, {get_db: lambda: mock_db_session}):
+        mock_db_session.get.return_value = mock_item
         response = client.get(f"/api/v1/knowledge-items/{item_id}")
         
     assert response.status_code == 200
@@ -186,6 +227,400 @@ def test_get_knowledge_item_success(mock_db_session):
     assert data["source_type"] == "webpage"
     assert data["source_url"] == "https://example.com"
     assert data["status"] == "ready_for_distillation"
+    assert data["processed_text_content"] == "Test content"
+    # Content columns are deferred on the model; this endpoint asks for them
+    from sqlalchemy import select
+    options = mock_db_session.get.await_args.kwargs["options"]
+    assert "processed_html_content" in str(select(KnowledgeItem).options(*options))
+
+def test_get_knowledge_item_streams_offloaded_content(mock_db_session, tmp_path):
+    """Bodies offloaded to object storage are decompressed into the response"""
+    from content_store import ContentStore
+    from storage import LocalStorage
+    item_id = str(uuid.uuid4())
+    text = "Långt innehåll \"quoted\"\n" * 5000
+    store = ContentStore(LocalStorage(str(tmp_path)), threshold=1000)
+    values = store.offload(item_id, {"processed_text_content": text, "processed_html_content": "<p>short</p>"})
+    mock_item = KnowledgeItem(id=item_id, user_id="default_user", source_type="webpage",
+                              status="ready_for_distillation", **values)
+
+    with patch.dict(app.dependency_overrides, {get_db: lambda: mock_db_session}), \
+         patch('main.content_store', store):
+        mock_db_session.get.return_value = mock_item
+        response = client.get(f"/api/v1/knowledge-items/{item_id}")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["processed_text_content"] == text
+    assert data["processed_html_content"] == "<p>short</p>"
+    assert data["text_content_length"] == len(text)
+
+def test_offloaded_item_etag_changes_with_each_attempt(mock_db_session, tmp_path):
+    """Each attempt uploads under a new key, so the tag changes even when nothing else in the row does"""
+    import asyncio
+    from content_store import ContentStore
+    from storage import LocalStorage
+    from main import _load_cached_item
+    item_id = str(uuid.uuid4())
+    store = ContentStore(LocalStorage(str(tmp_path)), threshold=10)
+    etags = []
+    for _ in range(2):
+        values = store.offload(item_id, {"processed_text_content": "the same long body"})
+        mock_db_session.get.return_value = KnowledgeItem(
+            id=item_id, user_id="default_user", source_type="webpage", status="ready_for_distillation",
+            processed_at=datetime(2024, 1, 1, 12), **values)
+        etags.append(asyncio.run(_load_cached_item(mock_db_session, item_id)).etag)
+
+    assert etags[0] != etags[1]
+
+def test_get_knowledge_item_etag_and_cache(mock_db_session):
+    """Polls revalidate with If-None-Match and are answered from the cache until the item changes"""
+    from item_cache import item_cache
+    item_id = str(uuid.uuid4())
+    mock_item = KnowledgeItem(id=item_id, user_id="default_user", source_type="webpage",
+                              status="processing", title="Polled")
+    mock_db_session.get.return_value = mock_item
+
+    item_cache.set_live(True)
+    try:
+        with patch.dict(app.dependency_overrides, {get_db: lambda: mock_db_session}):
+            first = client.get(f"/api/v1/knowledge-items/{item_id}")
+            etag = first.headers["etag"]
+            polled = client.get(f"/api/v1/knowledge-items/{item_id}", headers={"If-None-Match": etag})
+            assert polled.status_code == 304 and polled.headers["etag"] == etag
+            # Hits are served without any query
+            assert mock_db_session.get.await_count == 1 and mock_db_session.execute.await_count == 0
+
+            # The worker's status change arrives as an item event
+            mock_item.status = "ready_for_distillation"
+            item_cache.invalidate(item_id)
+            changed = client.get(f"/api/v1/knowledge-items/{item_id}", headers={"If-None-Match": etag})
+            assert mock_db_session.get.await_count == 2
+
+            # A publisher that lost events resyncs once Redis is back, emptying the cache
+            mock_item.status = "error"
+            item_cache.item_event(json.loads(encode_item_event(None, RESYNC_STATUS)))
+            missed = client.get(f"/api/v1/knowledge-items/{item_id}", headers={"If-None-Match": changed.headers["etag"]})
+    finally:
+        item_cache.set_live(False)
+
+    assert first.status_code == 200 and first.json()["status"] == "processing"
+    assert changed.status_code == 200 and changed.json()["status"] == "ready_for_distillation"
+    assert changed.headers["etag"] != etag
+    assert missed.status_code == 200 and missed.json()["status"] == "error"
+    assert mock_db_session.get.await_count == 3
+
+def test_item_event_publisher_owes_a_resync_after_losing_events():
+    """Events skipped during an outage are followed by a resync, retried until Redis takes it"""
+    import redis
+    from item_events import ItemEventPublisher, decode_item_event, is_resync
+    redis_client = MagicMock()
+    redis_client.publish.side_effect = redis.ConnectionError("down")
+    now, scheduled = [100.0], []
+    publisher = ItemEventPublisher(redis_client, clock=lambda: now[0],
+                                   schedule=lambda delay, callback: scheduled.append(callback))
+
+    assert not publisher.publish("a", "processing")
+    assert not publisher.publish("b", "processing")  # skipped while backing off
+    assert redis_client.publish.call_count == 1 and len(scheduled) == 1
+
+    now[0] += 10
+    redis_client.publish.side_effect = None
+    scheduled.pop()()
+    [(channel, message)] = [call.args for call in redis_client.publish.call_args_list[1:]]
+    assert is_resync(decode_item_event(message)) and not scheduled
+
+    assert publisher.publish("c", "ready_for_distillation")
+    assert decode_item_event(redis_client.publish.call_args.args[1])["item_id"] == "c"
+    assert redis_client.publish.call_count == 3
+
+def test_item_cache_single_flight_and_eviction():
+    """Concurrent misses share one load; loads overtaken by a change are not kept"""
+    import asyncio
+    from item_cache import CachedItem, ItemCache
+    cache = ItemCache(max_entries=2, max_bytes=1 << 20, ttl=60)
+    cache.set_live(True)
+    loads = []
+
+    async def load(item_id):
+        loads.append(item_id)
+        await asyncio.sleep(0.01)
+        return CachedItem(etag=f'"{item_id}"', payload={}, body=item_id.encode())
+
+    async def scenario():
+        results = await asyncio.gather(*(cache.get_or_load("a", lambda: load("a")) for _ in range(5)))
+        assert len({id(result) for result in results}) == 1 and loads == ["a"]
+
+        pending = asyncio.ensure_future(cache.get_or_load("b", lambda: load("b")))
+        await asyncio.sleep(0)
+        cache.invalidate("b")
+        await pending
+        assert cache.get("b") is None
+
+        for item_id in ("b", "c"):
+            await cache.get_or_load(item_id, lambda item_id=item_id: load(item_id))
+        assert cache.get("a") is None and len(cache) == 2
+
+    asyncio.run(scenario())
+    cache.set_live(False)
+    assert len(cache) == 0
+
+def test_single_flight_waiters_take_over_an_abandoned_run():
+    """A cancelled run hands over to a waiter; errors reach every waiter"""
+    import asyncio
+    from report_cache import SingleFlight
+    flights = SingleFlight()
+    runs, results = [], []
+
+    async def produce(value):
+        runs.append(value)
+        await asyncio.sleep(0.01)
+        return value
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValueError("collect failed")
+
+    async def scenario():
+        leader = asyncio.ensure_future(flights.run("k", lambda: produce("leader")))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(flights.run("k", lambda: produce("waiter"), results.append))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await waiter == "waiter" and runs == ["leader", "waiter"] and results == ["waiter"]
+        assert "k" not in flights
+
+        outcomes = await asyncio.gather(flights.run("k", failing), flights.run("k", failing),
+                                        return_exceptions=True)
+        assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+
+    asyncio.run(scenario())
+
+def test_item_event_hub_routes_by_item_and_user():
+    """Events reach streams watching the item or its user; laggards and outages close streams"""
+    import asyncio
+    from item_stream import ItemEventHub
+    hub = ItemEventHub(queue_size=2)
+    item, user = str(uuid.uuid4()), str(uuid.uuid4())
+
+    async def scenario():
+        by_item = hub.subscribe([item])
+        by_user = hub.subscribe([], user)
+        other = hub.subscribe([str(uuid.uuid4())])
+        event = {"item_id": item, "user_id": user, "status": "processing"}
+        hub.item_event(event)
+        assert await by_item.next_event(1) == event and await by_user.next_event(1) == event
+        with pytest.raises(asyncio.TimeoutError):
+            await other.next_event(0.01)
+
+        for _ in range(3):
+            hub.item_event(event)  # by_user stops reading, so it overflows
+            assert await by_item.next_event(1) == event
+        assert by_user.closed and not by_item.closed and len(hub) == 2
+        hub.set_live(False)
+        assert await by_item.next_event(1) is None and len(hub) == 0
+
+        # Lost events end the streams too, so clients reconnect to a fresh snapshot
+        resubscribed = hub.subscribe([item])
+        hub.item_event(json.loads(encode_item_event(None, RESYNC_STATUS)))
+        assert resubscribed.closed and len(hub) == 0
+
+    asyncio.run(scenario())
+
+def test_stream_item_events(mock_db_session):
+    """The stream opens with the current status, then relays published changes"""
+    from item_stream import ItemEventHub
+    hub = ItemEventHub()
+    item_id, user_id = uuid.uuid4(), uuid.uuid4()
+    change = {"item_id": str(item_id), "user_id": str(user_id), "status": "ready_for_distillation"}
+
+    def snapshot(stmt, *args, **kwargs):
+        # Runs after the stream subscribed: the worker finishes, then the hub goes away
+        hub.item_event(change)
+        hub.set_live(False)
+        result = MagicMock()
+        result.all.return_value = [MagicMock(id=item_id, user_id=user_id, status="processing")]
+        return result
+    mock_db_session.execute.side_effect = snapshot
+
+    with patch.dict(app.dependency_overrides, {get_db: lambda: mock_db_session}), \
+         patch('main.item_hub', hub):
+        assert client.get("/api/v1/item-events").status_code == 400
+        assert client.get("/api/v1/item-events", params={"item_id": "not-a-uuid"}).status_code == 400
+        assert client.get("/api/v1/item-events", params={"item_id": str(item_id)}).status_code == 503
+        hub.live = True
+        response = client.get("/api/v1/item-events", params={"item_id": str(item_id)})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [json.loads(line[len("data: "):]) for line in response.text.splitlines() if line.startswith("data: ")]
+    assert [event["status"] for event in events] == ["processing", "ready_for_distillation"]
+    assert events[0] == {"item_id": str(item_id), "user_id": str(user_id), "status": "processing"}
+    mock_db_session.close.assert_awaited()
+
+def test_knowledge_item_content_columns_deferred():
+    """Listing queries leave the large bodies out of the SELECT"""
+    from sqlalchemy import select
+    sql = str(select(KnowledgeItem))
+    assert "processed_text_content" not in sql
+    assert "processed_html_content" not in sql
+    assert "text_content_length" in sql
+
+@pytest.fixture
+def sqlite_search_db(tmp_path):
+    """File SQLite database with the FTS5 search stand-in and a few items"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from sqlalchemy.pool import NullPool
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from database import Base
+    from search import install_sqlite_search
+    path = tmp_path / "search.db"
+    sync_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(sync_engine)
+    with sync_engine.begin() as connection:
+        install_sqlite_search(connection)
+    user_id = uuid.uuid4()
+    with Session(sync_engine) as db:
+        db.add_all([
+            KnowledgeItem(user_id=user_id, source_type="webpage", status="ready_for_distillation",
+                          title="Sourdough starter guide",
+                          processed_text_content="Feed the starter with flour and water every day."),
+            KnowledgeItem(user_id=user_id, source_type="video", status="ready_for_distillation",
+                          title="Bread basics",
+                          processed_text_content="A long talk about ovens, hydration and sourdough loaves."),
+            KnowledgeItem(user_id=user_id, source_type="webpage", status="ready_for_distillation",
+                          title="Unrelated", processed_text_content="Nothing about baking here."),
+        ])
+        db.commit()
+        # Later edits reach the index through the update trigger
+        item = db.query(KnowledgeItem).filter_by(title="Unrelated").one()
+        item.processed_text_content = "Changed my mind: rye sourdough after all."
+        db.commit()
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+    sessions = async_sessionmaker(async_engine, expire_on_commit=False)
+
+    async def get_sqlite_db():
+        async with sessions() as db:
+            yield db
+
+    with patch.dict(app.dependency_overrides, {get_db: get_sqlite_db}):
+        yield sync_engine
+
+def test_search_ranks_matches_with_snippets(sqlite_search_db):
+    """Search runs on the FTS5 stand-in: title matches first, highlighted snippets"""
+    response = client.get("/api/v1/search", params={"q": "sourdough"})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["title"] for r in results][0] == "Sourdough starter guide"
+    assert {r["title"] for r in results} == {"Sourdough starter guide", "Bread basics", "Unrelated"}
+    assert all("<b>" in r["snippet"] for r in results)
+    assert results[0]["rank"] >= results[1]["rank"]
+
+    response = client.get("/api/v1/search", params={"q": "sourdough", "source_type": "video"})
+    assert [r["title"] for r in response.json()["results"]] == ["Bread basics"]
+    # Every word must match; FTS5 syntax in the query is treated as text
+    assert client.get("/api/v1/search", params={"q": "sourdough baking"}).json()["results"] == []
+    assert client.get("/api/v1/search", params={"q": 'flour" OR "x'}).status_code == 200
+
+def test_similar_items_on_sqlite(sqlite_search_db):
+    """Nearest items by embedding, excluding the item itself; 409 before embedding"""
+    import numpy as np
+    from sqlalchemy.orm import Session
+    from models import EMBEDDING_DIM, KnowledgeItemEmbedding
+    with Session(sqlite_search_db) as db:
+        items = {item.title: item.id for item in db.query(KnowledgeItem)}
+        base = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+        vectors = {"Sourdough starter guide": base.copy(), "Bread basics": base.copy()}
+        vectors["Sourdough starter guide"][:2] = [1.0, 0.0]
+        vectors["Bread basics"][:2] = [0.8, 0.6]
+        db.add_all([
+            KnowledgeItemEmbedding(knowledge_item_id=items[title], model="hashing-384", chunk_count=1,
+                                   embedding=vector)
+            for title, vector in vectors.items()
+        ])
+        db.commit()
+
+    response = client.get(f"/api/v1/knowledge-items/{items['Sourdough starter guide']}/similar")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["model"] == "hashing-384"
+    assert [r["title"] for r in data["results"]] == ["Bread basics"]
+    assert data["results"][0]["similarity"] == pytest.approx(0.8)
+
+    response = client.get(f"/api/v1/knowledge-items/{items['Unrelated']}/similar")
+    assert response.status_code == 409
+    assert client.get(f"/api/v1/knowledge-items/{uuid.uuid4()}/similar").status_code == 404
+    assert client.get("/api/v1/knowledge-items/not-a-uuid/similar").status_code == 404
+
+def test_similar_items_postgres_query(mock_db_session):
+    """Postgres orders by pgvector cosine distance so the HNSW index answers"""
+    item_id = uuid.uuid4()
+    mock_db_session.get_bind.return_value.dialect.name = "postgresql"
+
+    def execute(stmt, params=None):
+        result = MagicMock()
+        result.scalar_one_or_none.return_value = "hashing-384"
+        result.__iter__.return_value = iter([])
+        return result
+
+    mock_db_session.execute.side_effect = execute
+    with patch.dict(app.dependency_overrides, {get_db: lambda: mock_db_session}):
+        response = client.get(f"/api/v1/knowledge-items/{item_id}/similar", params={"limit": 50})
+    assert response.status_code == 200
+    assert response.json() == {"item_id": str(item_id), "model": "hashing-384", "results": []}
+    calls = mock_db_session.execute.await_args_list
+    assert calls[1].args[1] == {"ef_search": "100"}
+    stmt, params = calls[2].args
+    assert "ORDER BY e.embedding <=>" in str(stmt)
+    assert params == {"item_id": item_id, "model": "hashing-384", "limit": 50}
+
+def test_search_validates_query():
+    assert client.get("/api/v1/search").status_code == 422
+    assert client.get("/api/v1/search", params={"q": ""}).status_code == 422
+    assert client.get("/api/v1/search", params={"q": "x", "limit": 1000}).status_code == 422
+
+def test_search_postgres_query(mock_db_session):
+    """Postgres ranks on the search_vector column and highlights with ts_headline"""
+    mock_db_session.get_bind.return_value.dialect.name = "postgresql"
+    with patch.dict(app.dependency_overrides, {get_db: lambda: mock_db_session}):
+        response = client.get("/api/v1/search", params={"q": '"machine learning" -python', "limit": 5})
+    assert response.status_code == 200
+    assert response.json() == {"query": '"machine learning" -python', "results": []}
+    stmt, params = mock_db_session.execute.await_args.args
+    assert "websearch_to_tsquery" in str(stmt) and "search_vector @@" in str(stmt)
+    assert "ts_headline" in str(stmt)
+    assert params["q"] == '"machine learning" -python' and params["limit"] == 5
+
+def test_search_snippets_read_offloaded_bodies(mock_db_session, tmp_path):
+    """Offloaded items are re-highlighted from the head of their stored body, one query per page"""
+    from content_store import ContentStore
+    from storage import LocalStorage
+    store = ContentStore(LocalStorage(str(tmp_path)), threshold=10)
+    body = "intro " * 10000 + "the rare term is here"
+    key = store.offload("item-1", {"processed_text_content": body})["text_content_key"]
+    rows = [
+        MagicMock(_mapping={"id": "item-1", "title": "Offloaded", "source_type": "webpage", "status": "ready_for_distillation",
+                            "rank": 0.5, "snippet": "Offloaded", "text_content_key": key}),
+        MagicMock(_mapping={"id": "item-2", "title": "Inline", "source_type": "webpage", "status": "ready_for_distillation",
+                            "rank": 0.4, "snippet": "inline <b>rare</b> text", "text_content_key": None}),
+    ]
+    search_result, headline_result = MagicMock(), MagicMock()
+    search_result.all.return_value = rows
+    headline_result.scalars.return_value.all.return_value = ["body <b>rare</b> text"]
+    mock_db_session.get_bind.return_value.dialect.name = "postgresql"
+    mock_db_session.execute.side_effect = [search_result, headline_result]
+    with patch('main.content_store', store), patch.dict(app.dependency_overrides, {get_db: lambda: mock_db_session}):
+        response = client.get("/api/v1/search", params={"q": "rare"})
+
+    assert response.status_code == 200
+    assert [r["snippet"] for r in response.json()["results"]] == ["body <b>rare</b> text", "inline <b>rare</b> text"]
+    stmt, params = mock_db_session.execute.await_args.args
+    assert "ts_headline" in str(stmt) and "unnest" in str(stmt)
+    # Only the snippet window is read back, title first
+    from search import SEARCH_SNIPPET_CHARS
+    assert params["docs"] == [("Offloaded " + body)[:SEARCH_SNIPPET_CHARS]]
+    assert store.read_head(key, 12) == "intro intro "
 
 # Add integration test with real database
 @pytest.mark.integration
@@ -246,6 +681,42 @@ def test_error_handling_middleware():
     if route_index is not None:
         app.routes.pop(route_index)
 
+def test_request_log_record_is_structured(caplog):
+    """The middleware logs one record per request, with fields for the JSON log"""
+    with caplog.at_level(logging.INFO):
+        client.get("/health")
+    record = next(record for record in caplog.records if record.getMessage().startswith("Request: GET"))
+    assert (record.method, record.path, record.status) == ("GET", "/health", 200)
+    assert record.duration_ms >= 0 and record.sample is True
+
+def test_log_pipeline_formats_samples_and_never_blocks():
+    """JSON lines keep extra fields and tracebacks; sampled records thin out; a full queue drops"""
+    import queue
+    from log_pipeline import DroppingQueueHandler, JsonFormatter, RequestLogSampler
+    log_queue = queue.Queue(maxsize=2)
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(RequestLogSampler(rate=0.0))
+    pipeline_logger = logging.getLogger("test_log_pipeline")
+    pipeline_logger.propagate = False
+    pipeline_logger.addHandler(handler)
+    try:
+        pipeline_logger.warning("routine", extra={"sample": True, "path": "/health"})
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            pipeline_logger.exception("failed %s", "request", extra={"path": "/api/v1/capture"})
+        pipeline_logger.warning("kept")
+        pipeline_logger.warning("overflow")
+    finally:
+        pipeline_logger.removeHandler(handler)
+
+    assert log_queue.qsize() == 2 and handler.dropped == 1
+    entry = json.loads(JsonFormatter().format(log_queue.get_nowait()))
+    assert entry["message"] == "failed request" and entry["path"] == "/api/v1/capture"
+    assert entry["level"] == "ERROR" and "ValueError: boom" in entry["exc"]
+    assert "sample" not in entry
+    assert log_queue.get_nowait().getMessage() == "kept"
+
 # Test logging decorator
 def test_log_execution_time_decorator(mock_db_session, mock_celery_task, caplog):
     """Test the log_execution_time decorator"""
@@ -255,7 +726,7 @@ def test_log_execution_time_decorator(mock_db_session, mock_celery_task, caplog)
     }
     
     with caplog.at_level(logging.INFO):
-        with patch('main.SessionLocal', return_value=mock_db_session):
+        with patch.dict(app.dependency_overrides, {get_db: lambda: mock_db_session}):
             response = client.post("/api/v1/capture", json=capture_data)
         
     # Check if execution time was logged
@@ -273,24 +744,145 @@ def test_capture_url_edge_cases(mock_db_session, mock_celery_task):
         {"source_type": "webpage", "url": "https://example.com/path#fragment"},  # with fragment
     ]
     
-    with patch('main.SessionLocal', return_value=mock_db_session):
+    with patch.dict(app.dependency_overrides, {get_db: lambda: mock_db_session}):
         for case in edge_cases:
             response = client.post("/api/v1/capture", json=case)
             assert response.status_code == 202, f"Failed for URL: {case['url']}"
             data = response.json()
             assert "item_id" in data
             assert data["status"] == "processing"
-            # With our custom validator, URLs are not normalized
-            # We expect the exact URL that was sent
-            assert data["source_url"] == case["url"]
+            # Only the fragment is dropped by canonicalization here
+            assert data["source_url"] == case["url"].split("#")[0]
             mock_celery_task.assert_called()
             # Reset the mock for the next iteration
             mock_celery_task.reset_mock()
 
+def test_capture_batch_mixed_items(mock_db_session):
+    """Batch capture inserts valid items once and reports every item"""
+    items = [
+        {"source_type": "webpage", "url": "https://example.com/a"},
+        {"source_type": "video", "url": "https://example.com/b"},
+        {"source_type": "webpage", "url": "https://EXAMPLE.com/a/#top"},
+        {"source_type": "note", "url": "https://example.com/c"},
+        {"source_type": "webpage", "url": "ftp://example.com/d"},
+    ]
+
+    with patch.dict(app.dependency_overrides, {get_db: lambda: mock_db_session}), \
+            patch('main.send_tasks') as mock_send:
+        response = client.post("/api/v1/capture/batch", json={"items": items})
+
+    assert response.status_code == 202
+    data = response.json()
+    assert (data["accepted"], data["duplicates"], data["rejected"]) == (2, 1, 2)
+    results = data["results"]
+    assert [r["status"] for r in results] == ["processing", "processing", "duplicate", "rejected", "rejected"]
+    assert results[2]["item_id"] == results[0]["item_id"]
+    assert results[2]["source_url"] == "https://example.com/a"
+    assert "source_type" in results[3]["error"]
+
+    # One INSERT, one commit, one publish call for the whole batch
+    assert mock_db_session.execute.call_count == 1
+    mock_db_session.commit.assert_awaited_once()
+    mock_send.assert_called_once_with([
+        ("tasks.process_webpage", [results[0]["item_id"]]),
+        ("tasks.process_media", [results[1]["item_id"]]),
+    ])
+
+def test_capture_batch_existing_url_not_enqueued(mock_db_session):
+    """URLs skipped by ON CONFLICT come back as duplicates of the existing item"""
+    existing_id = uuid.uuid4()
+    insert_result = MagicMock()
+    insert_result.scalars.return_value = []
+    lookup_result = MagicMock()
+    lookup_result.all.return_value = [(existing_id, "https://example.com")]
+    mock_db_session.execute.side_effect = [insert_result, lookup_result]
+
+    with patch.dict(app.dependency_overrides, {get_db: lambda: mock_db_session}), \
+            patch('main.send_tasks') as mock_send:
+        response = client.post("/api/v1/capture/batch",
+                               json={"items": [{"source_type": "webpage", "url": "https://example.com"}]})
+
+    assert response.status_code == 202
+    result = response.json()["results"][0]
+    assert result["status"] == "duplicate"
+    assert result["item_id"] == str(existing_id)
+    mock_send.assert_not_called()
+
+def test_capture_batch_size_limits():
+    """Empty and oversized batches fail validation"""
+    assert client.post("/api/v1/capture/batch", json={"items": []}).status_code == 422
+    items = [{"source_type": "webpage", "url": f"https://example.com/{i}"} for i in range(501)]
+    assert client.post("/api/v1/capture/batch", json={"items": items}).status_code == 422
+
+def test_send_tasks_shares_one_producer():
+    """All publishes of a batch go through a single producer"""
+    with patch.object(celery_app, 'producer_or_acquire') as mock_acquire, \
+            patch.object(celery_app, 'send_task') as mock_task:
+        send_tasks([("tasks.process_webpage", ["1"]), ("tasks.process_media", ["2"])])
+
+    mock_acquire.assert_called_once()
+    producer = mock_acquire.return_value.__enter__.return_value
+    assert [c.kwargs["producer"] for c in mock_task.call_args_list] == [producer, producer]
+    mock_task.assert_any_call("tasks.process_media", args=["2"], producer=producer)
+
+def test_canonicalize_url():
+    """Trivially different URLs share one canonical form"""
+    canonical = "https://example.com/article?id=7"
+    for url in [
+        "https://example.com/article?id=7",
+        "HTTPS://Example.COM:443/article/?id=7",
+        "https://example.com/article?utm_source=news&id=7&fbclid=abc",
+        "https://example.com/article?id=7#comments",
+    ]:
+        assert canonicalize_url(url) == canonical
+    assert canonicalize_url("https://example.com/") == "https://example.com"
+    assert canonicalize_url("http://example.com:8080/a") == "http://example.com:8080/a"
+    assert canonicalize_url("https://example.com/?b=2&a=1") == "https://example.com?b=2&a=1"
+
+def test_capture_existing_url_returns_item(mock_db_session, mock_celery_task):
+    """A repeat capture returns the stored item after one lookup and queues nothing"""
+    existing_id = uuid.uuid4()
+    lookup = MagicMock()
+    lookup.first.return_value = MagicMock(id=existing_id, status="ready_for_distillation", source_type="webpage")
+    mock_db_session.execute.side_effect = None
+    mock_db_session.execute.return_value = lookup
+
+    with patch.dict(app.dependency_overrides, {get_db: lambda: mock_db_session}):
+        response = client.post("/api/v1/capture",
+                               json={"source_type": "webpage", "url": "https://example.com/?utm_medium=share"})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["item_id"] == str(existing_id)
+    assert data["status"] == "ready_for_distillation"
+    assert data["source_url"] == "https://example.com"
+    assert mock_db_session.execute.await_count == 1
+    mock_db_session.commit.assert_not_awaited()
+    mock_celery_task.assert_not_called()
+
+def test_capture_conflict_race_returns_winner(mock_db_session, mock_celery_task):
+    """Losing the INSERT race to a concurrent capture returns the winner's item"""
+    winner_id = uuid.uuid4()
+    miss, conflict, lookup = MagicMock(), MagicMock(), MagicMock()
+    miss.first.return_value = None
+    conflict.scalar.return_value = None
+    lookup.first.return_value = MagicMock(id=winner_id, status="pending", source_type="webpage")
+    mock_db_session.execute.side_effect = [miss, conflict, lookup]
+
+    with patch.dict(app.dependency_overrides, {get_db: lambda: mock_db_session}):
+        response = client.post("/api/v1/capture", json={"source_type": "webpage", "url": "https://example.com"})
+
+    assert response.status_code == 200
+    assert response.json()["item_id"] == str(winner_id)
+    mock_celery_task.assert_not_called()
+
 # Test database connection failure
 def test_database_connection_failure():
     """Test behavior when database connection fails"""
-    with patch('main.SessionLocal', side_effect=Exception("Database connection failed")):
+    def broken_db():
+        raise Exception("Database connection failed")
+
+    with patch.dict(app.dependency_overrides, {get_db: broken_db}):
         capture_data = {
             "source_type": "webpage",
             "url": "https://example.com"
@@ -307,7 +899,7 @@ def test_database_connection_failure():
 # Test Celery task failure
 def test_celery_task_failure(mock_db_session):
     """Test behavior when Celery task fails"""
-    with patch('main.SessionLocal', return_value=mock_db_session):
+    with patch.dict(app.dependency_overrides, {get_db: lambda: mock_db_session}):
         with patch('main.celery_app.send_task', side_effect=Exception("Celery task failed")):
             capture_data = {
                 "source_type": "webpage",
@@ -318,6 +910,24 @@ def test_celery_task_failure(mock_db_session):
             assert response.status_code == 500
             assert "Internal server error" in response.json()["detail"]
 
+    # The committed row is deleted again so a retry is not answered as a duplicate
+    deleted = [call.args[0] for call in mock_db_session.execute.await_args_list if call.args[0].is_delete]
+    assert len(deleted) == 1
+    assert "knowledge_items.status = " in str(deleted[0])
+
+def test_capture_batch_discards_rows_when_publish_fails(mock_db_session):
+    """Items that were inserted but never enqueued are removed again"""
+    items = [{"source_type": "webpage", "url": f"https://example.com/{i}"} for i in range(2)]
+    with patch.dict(app.dependency_overrides, {get_db: lambda: mock_db_session}), \
+            patch('main.send_tasks', side_effect=Exception("broker down")):
+        response = client.post("/api/v1/capture/batch", json={"items": items})
+
+    assert response.status_code == 500
+    [delete_stmt] = [call.args[0] for call in mock_db_session.execute.await_args_list if call.args[0].is_delete]
+    inserted = [value for key, value in mock_db_session.execute.await_args_list[0].args[0]
+                .compile(dialect=postgresql.dialect()).params.items() if key.startswith("id_m")]
+    assert set(delete_stmt.compile().params["id_1"]) == {str(item_id) for item_id in inserted}
+
 # Test middleware with different HTTP methods
 def test_middleware_different_methods():
     """Test middleware with different HTTP methods"""
@@ -346,6 +956,60 @@ def test_health_check_under_load():
         assert data["status"] == "healthy"
         assert "timestamp" in data
 
+def test_metrics_endpoint(mock_db_session, mock_celery_task):
+    """Request latency is labelled by route template; captures and publishes are counted"""
+    from prometheus_client import REGISTRY
+    from celery.signals import after_task_publish
+
+    def sample(name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    captured = sample("synapse_api_captures_total", source_type="webpage", outcome="processing")
+    enqueued = sample("synapse_api_tasks_enqueued_total", task="tasks.process_webpage")
+    item_id = str(uuid.uuid4())
+    with patch.dict(app.dependency_overrides, {get_db: lambda: mock_db_session}):
+        client.post("/api/v1/capture", json={"source_type": "webpage", "url": "https://example.com/metrics"})
+        mock_db_session.get.return_value = None
+        client.get(f"/api/v1/knowledge-items/{item_id}")
+    after_task_publish.send(sender="tasks.process_webpage", body=None, exchange="", routing_key="celery")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'synapse_api_request_duration_seconds_count{method="GET",route="/api/v1/knowledge-items/{item_id}",status="404"}' in body
+    assert item_id not in body
+    assert sample("synapse_api_captures_total", source_type="webpage", outcome="processing") == captured + 1
+    assert sample("synapse_api_tasks_enqueued_total", task="tasks.process_webpage") == enqueued + 1
+
+    # Client-chosen source types cannot create series
+    invalid = sample("synapse_api_captures_total", source_type="invalid", outcome="rejected")
+    with patch.dict(app.dependency_overrides, {get_db: lambda: mock_db_session}):
+        client.post("/api/v1/capture/batch", json={"items": [
+            {"source_type": f"attacker-{i}", "url": "https://example.com/x"} for i in range(3)]})
+    assert sample("synapse_api_captures_total", source_type="invalid", outcome="rejected") == invalid + 3
+    assert "attacker-" not in client.get("/metrics").text
+
+def test_db_query_timings():
+    """Statements run through an instrumented engine are timed by kind"""
+    from prometheus_client import REGISTRY
+    from sqlalchemy import create_engine, text
+    from api_metrics import instrument_engine, statement_kind
+
+    def count(kind):
+        return REGISTRY.get_sample_value("synapse_api_db_query_duration_seconds_count", {"statement": kind}) or 0
+
+    assert statement_kind("  select 1") == "SELECT"
+    assert statement_kind("WITH x AS (SELECT 1) SELECT * FROM x") == "other"
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    selects, others = count("SELECT"), count("other")
+    with engine.connect() as connection:
+        connection.execute(text("CREATE TABLE t (x INTEGER)"))
+        connection.execute(text("SELECT x FROM t"))
+    assert count("SELECT") == selects + 1
+    assert count("other") == others + 1
+
 # Test with invalid JSON
 def test_capture_invalid_json():
     """Test capture endpoint with invalid JSON"""
@@ -404,8 +1068,8 @@ def test_get_knowledge_item_special_characters(mock_db_session):
         processed_text_content="Content with special characters: áéíóúñ and emojis 🎉🌟"
     )
     
-    with patch('main.SessionLocal', return_value=mock_db_session):
-        mock_db_session.query().filter().first.return_value = mock_item
+    with patch.dict(app.dependency_overrides, {get_db: lambda: mock_db_session}):
+        mock_db_session.get.return_value = mock_item
         response = client.get(f"/api/v1/knowledge-items/{item_id}")
         
     assert response.status_code == 200
@@ -422,7 +1086,7 @@ def test_concurrent_captures(mock_db_session, mock_celery_task):
         "url": "https://example.com"
     }
     
-    with patch('main.SessionLocal', return_value=mock_db_session):
+    with patch.dict(app.dependency_overrides, {get_db: lambda: mock_db_session}):
         # Simulate 5 concurrent requests
         responses = []
         for i in range(5):
@@ -446,7 +1110,8 @@ def test_console_health_endpoint(mock_db_session, monkeypatch):
 
     with patch("console_routes.redis.from_url") as mock_redis, \
             patch("console_routes.boto3.client") as mock_boto, \
-            patch("console_routes.requests.get") as mock_requests_get, \
+            patch("console_routes.requests.Session") as mock_session, \
+            patch("console_routes.celery_app.connection_or_acquire"), \
             patch("console_routes.celery_app.control.inspect") as mock_inspect:
 
         redis_instance = MagicMock()
@@ -458,7 +1123,7 @@ def test_console_health_endpoint(mock_db_session, monkeypatch):
         mock_response = MagicMock()
         mock_response.json.return_value = {"model": "base"}
         mock_response.raise_for_status.return_value = None
-        mock_requests_get.return_value = mock_response
+        mock_session.return_value.get.return_value = mock_response
 
         inspect_instance = MagicMock()
         inspect_instance.ping.return_value = {"worker@1": {"ok": "pong"}}
@@ -469,6 +1134,44 @@ def test_console_health_endpoint(mock_db_session, monkeypatch):
         components = response.json()["components"]
         assert components["redis"]["status"] == "healthy"
         assert components["worker"]["status"] == "healthy"
+        assert components["stt_service"]["detail"] == "model=base"
+
+        # Polls within the TTL reuse the report; the clients are built once
+        assert client.get("/internal/console/health").json() == response.json()
+        assert redis_instance.ping.call_count == 1
+        mock_redis.assert_called_once()
+
+    app.dependency_overrides.pop(get_db, None)
+
+
+def test_console_health_checks_run_concurrently_with_deadlines(mock_db_session, monkeypatch):
+    """A hung dependency costs one deadline, not the sum of every check's timeout"""
+    import time
+    import console_routes
+    monkeypatch.setattr(console_routes, "HEALTH_CHECK_TIMEOUT", 0.3)
+    app.dependency_overrides[get_db] = lambda: mock_db_session
+
+    def slow_check():
+        time.sleep(0.25)
+        return console_routes._status_payload(True)
+
+    def hung_check():
+        time.sleep(1)
+        return console_routes._status_payload(True)
+
+    with patch("console_routes._check_redis", slow_check), \
+            patch("console_routes._check_minio", slow_check), \
+            patch("console_routes._check_stt", slow_check), \
+            patch("console_routes._check_worker", hung_check):
+        started = time.perf_counter()
+        response = client.get("/internal/console/health")
+        elapsed = time.perf_counter() - started
+
+    components = response.json()["components"]
+    assert components["redis"]["status"] == components["minio"]["status"] == "healthy"
+    assert components["worker"]["status"] == "unhealthy"
+    assert "within 0.3s" in components["worker"]["detail"]
+    assert elapsed < 0.75
 
     app.dependency_overrides.pop(get_db, None)
 
@@ -505,7 +1208,9 @@ def test_console_auth_token_required(mock_db_session, monkeypatch):
 
 def test_console_metrics_endpoint():
     """Console metrics endpoint returns Celery stats"""
-    with patch("console_routes.celery_app.control.inspect") as mock_inspect:
+    with patch("console_routes.celery_app.control.inspect") as mock_inspect, \
+            patch("celery_metrics.celery_app.connection_or_acquire"), \
+            patch("celery_metrics.queue_depths", return_value={"celery": 4}):
         inspect_instance = MagicMock()
         inspect_instance.stats.return_value = {
             "worker@1": {"total": {"tasks.process_webpage": 2}, "pid": 123, "uptime": 10, "loadavg": [0.1, 0.2, 0.3]}
@@ -520,54 +1225,138 @@ def test_console_metrics_endpoint():
         data = response.json()
         assert "workers" in data
         assert data["queued_tasks"]["default"] == 1
+        assert data["queued_tasks"]["celery"] == 4 and data["errors"] == []
 
+        # Served from the snapshot until the collector refreshes it
+        assert client.get("/internal/console/metrics").json() == data
+        assert inspect_instance.stats.call_count == 1
 
-def test_console_knowledge_items_list(mock_db_session):
-    """Console listing endpoint returns items filtered by status"""
-    app.dependency_overrides[get_db] = lambda: mock_db_session
-    query_mock = MagicMock()
-    mock_db_session.query.return_value = query_mock
-    query_mock.filter.return_value = query_mock
-    query_mock.count.return_value = 1
-    query_mock.order_by.return_value = query_mock
-    query_mock.offset.return_value = query_mock
-    query_mock.limit.return_value = query_mock
 
+def test_celery_metrics_collector_refreshes_only_while_watched():
+    """The background loop refreshes while the console polls, and stops once it goes idle"""
+    import asyncio
+    from celery_metrics import CeleryMetricsCollector
+    now = [1000.0]
+    collector = CeleryMetricsCollector(interval=0.01, idle_after=60, queues=["celery"], clock=lambda: now[0])
+    collections = []
+    collector.collect = lambda: collections.append(now[0]) or {"collected": len(collections)}
+
+    async def scenario():
+        loop = asyncio.ensure_future(collector.run())
+        await asyncio.sleep(0.05)
+        assert collections == []  # nobody has asked yet
+
+        assert await collector.get() == {"collected": 1}
+        await asyncio.sleep(0.05)
+        assert len(collections) > 1
+        assert (await collector.get())["collected"] > 1
+
+        now[0] += 61
+        await asyncio.sleep(0.02)
+        idle = len(collections)
+        await asyncio.sleep(0.05)
+        assert len(collections) == idle
+        loop.cancel()
+
+    asyncio.run(scenario())
+
+
+def _console_item(created_at=None):
     fake_item = MagicMock()
     fake_item.id = uuid.uuid4()
     fake_item.source_type = "webpage"
     fake_item.source_url = "https://example.com"
     fake_item.status = "error"
     fake_item.processed_at = datetime.now()
-    fake_item.created_at = datetime.now()
+    fake_item.created_at = created_at or datetime.now()
     fake_item.last_error = "Timeout"
     fake_item.title = "Example"
-    query_mock.all.return_value = [fake_item]
+    return fake_item
+
+def test_console_knowledge_items_list(mock_db_session):
+    """Console listing endpoint returns items filtered by status"""
+    app.dependency_overrides[get_db] = lambda: mock_db_session
+    items_result = MagicMock()
+    count_result = MagicMock()
+    count_result.scalar_one.return_value = 1
+    mock_db_session.execute.side_effect = [items_result, count_result]
+    stats = KnowledgeItemStats(outcome="error", total_ms=3120, fetch_ms=3000, extract_ms=None, commit_ms=20,
+                               bytes_downloaded=52_000, images_found=None, images_stored=None,
+                               recorded_at=datetime(2026, 1, 1, 12, 0))
+    items_result.all.return_value = [(_console_item(), stats)]
 
     response = client.get("/internal/console/knowledge-items?status=error&limit=1")
     assert response.status_code == 200
     payload = response.json()
     assert payload["total"] == 1
+    assert payload["total_is_estimate"] is False
+    assert payload["next_cursor"] is None
     assert payload["items"][0]["last_error"] == "Timeout"
+    # The last attempt's stage timings, leaving out the stages that did not run
+    assert payload["items"][0]["stats"] == {
+        "outcome": "error", "total_ms": 3120, "stages_ms": {"fetch": 3000, "commit": 20},
+        "bytes_downloaded": 52_000, "images_found": None, "images_stored": None,
+        "recorded_at": "2026-01-01T12:00:00",
+    }
+    query = mock_db_session.execute.await_args_list[0].args[0]
+    assert "LEFT OUTER JOIN knowledge_item_stats" in str(query)
+
+    app.dependency_overrides.pop(get_db, None)
+
+
+def test_console_knowledge_items_keyset_cursor(mock_db_session):
+    """A full page returns a cursor that resumes after its last row"""
+    app.dependency_overrides[get_db] = lambda: mock_db_session
+    page = [_console_item(datetime(2026, 1, 1, 12, 0, second)) for second in (3, 2, 1)]
+    first_result, second_result = MagicMock(), MagicMock()
+    first_result.all.return_value = [(item, None) for item in page]
+    second_result.all.return_value = [(item, None) for item in page[2:]]
+    mock_db_session.execute.side_effect = [first_result, second_result]
+
+    # limit + 1 rows came back, so there is a next page starting after row 2
+    payload = client.get("/internal/console/knowledge-items?limit=2&count=none").json()
+    assert [item["id"] for item in payload["items"]] == [str(page[0].id), str(page[1].id)]
+    assert payload["total"] is None
+    cursor = payload["next_cursor"]
+
+    payload = client.get(f"/internal/console/knowledge-items?limit=2&count=none&cursor={cursor}").json()
+    assert payload["next_cursor"] is None
+    query = mock_db_session.execute.await_args_list[1].args[0]
+    params = query.compile().params
+    assert page[1].created_at in params.values()
+    assert page[1].id in params.values()
+    assert "ORDER BY knowledge_items.created_at DESC, knowledge_items.id DESC" in str(query)
+
+    assert client.get("/internal/console/knowledge-items?cursor=not-a-cursor").status_code == 400
 
     app.dependency_overrides.pop(get_db, None)
 
 
-def test_console_retry_endpoint(mock_db_session):
+def test_console_retry_endpoint(mock_db_session, mock_item_events):
     """Console retry endpoint resets item and requeues task"""
     app.dependency_overrides[get_db] = lambda: mock_db_session
     mock_item = MagicMock()
     mock_item.id = str(uuid.uuid4())
     mock_item.source_type = "webpage"
-    mock_db_session.query().filter().first.return_value = mock_item
-
-    with patch("console_routes.celery_app.send_task") as mock_send_task:
+    mock_item.text_content_key = "content/ab/item/processed_text_content-1.gz"
+    mock_item.html_content_key = None
+    mock_db_session.get.return_value = mock_item
+    store = MagicMock()
+    # The offloaded body is deleted only once the reset no longer points at it
+    store.discard.side_effect = lambda keys: mock_db_session.commit.assert_awaited_once()
+
+    with patch("console_routes.celery_app.send_task") as mock_send_task, \
+         patch("console_routes._content_store", return_value=store):
         response = client.post(f"/internal/console/knowledge-items/{mock_item.id}/retry")
         assert response.status_code == 200
         data = response.json()
         assert data["status"] == "queued"
         mock_send_task.assert_called_once()
         assert mock_item.status == "pending"
+        assert mock_item.processed_text_content is None and mock_item.search_vector is None
+        store.discard.assert_called_once_with(["content/ab/item/processed_text_content-1.gz"])
+        assert mock_item.text_content_key is None
+        mock_item_events.assert_called_once_with(mock_item.id, "pending", str(mock_item.user_id))
 
     app.dependency_overrides.pop(get_db, None)
 
@@ -585,6 +1374,61 @@ def test_console_logs_endpoint(tmp_path, monkeypatch):
     monkeypatch.delenv("API_LOG_PATH", raising=False)
 
 
+def test_log_tail_reads_blocks_and_rotated_backups(tmp_path):
+    """The tail reads back from the end and continues into gzipped backups after a rotation"""
+    import logging
+    from log_files import CompressingRotatingFileHandler, tail_lines
+    path = str(tmp_path / "app.log")
+    handler = CompressingRotatingFileHandler(path, maxBytes=500, backupCount=3)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    record_logger = logging.getLogger("test_log_tail")
+    record_logger.propagate = False
+    record_logger.addHandler(handler)
+    try:
+        for number in range(200):
+            record_logger.warning(f"line {number:03d} ünïcode")
+    finally:
+        record_logger.removeHandler(handler)
+        handler.close()
+
+    assert sorted(os.listdir(tmp_path)) == ["app.log", "app.log.1.gz", "app.log.2.gz", "app.log.3.gz"]
+    expected = [f"line {number:03d} ünïcode" for number in range(200)]
+    # Small blocks force several backward reads; more lines than the live file spans the backups
+    assert tail_lines(path, 3, block_size=16) == expected[-3:]
+    assert tail_lines(path, 80, block_size=16) == expected[-80:]
+    assert tail_lines(str(tmp_path / "missing.log"), 5) == []
+
+
+def test_follow_lines_across_rotation(tmp_path):
+    """Following picks up appended lines and the new file after a rotation"""
+    import asyncio
+    from log_files import follow_lines, read_tail
+    path = tmp_path / "app.log"
+    path.write_text("old\n")
+
+    async def scenario():
+        backlog, end = read_tail(str(path), 5)
+        assert backlog == ["old"]
+        seen = []
+        follower = follow_lines(str(path), end, poll_interval=0.01)
+        with path.open("a") as log_file:
+            log_file.write("first\nsecond")
+        async for line in follower:
+            if line is not None:
+                seen.append(line)
+            if seen == ["first"]:
+                with path.open("a") as log_file:
+                    log_file.write(" half\n")
+                path.rename(tmp_path / "app.log.1")
+                path.write_text("after rotation\n")
+            if len(seen) == 3:
+                break
+        await follower.aclose()
+        return seen
+
+    assert asyncio.run(scenario()) == ["first", "second half", "after rotation"]
+
+
 def test_console_update_item_success(mock_db_session):
     """Console patch endpoint updates editable fields"""
     app.dependency_overrides[get_db] = lambda: mock_db_session
@@ -595,7 +1439,7 @@ def test_console_update_item_success(mock_db_session):
     mock_item.processed_at = None
     mock_item.created_at = datetime.now()
     mock_item.processed_text_content = "content"
-    mock_db_session.query().filter().first.return_value = mock_item
+    mock_db_session.get.return_value = mock_item
 
     payload = {"title": "Updated", "status": "processing", "last_error": "Timeout"}
     response = client.patch(f"/internal/console/knowledge-items/{mock_item.id}", json=payload)
@@ -607,7 +1451,7 @@ def test_console_update_item_success(mock_db_session):
     assert mock_item.title == "Updated"
     assert mock_item.status == "processing"
     assert mock_item.last_error == "Timeout"
-    mock_db_session.commit.assert_called_once()
+    mock_db_session.commit.assert_awaited_once()
 
     app.dependency_overrides.pop(get_db, None)
 
@@ -616,7 +1460,7 @@ def test_console_update_item_invalid_status(mock_db_session):
     """Console patch endpoint rejects invalid status"""
     app.dependency_overrides[get_db] = lambda: mock_db_session
     mock_item = MagicMock()
-    mock_db_session.query().filter().first.return_value = mock_item
+    mock_db_session.get.return_value = mock_item
 
     response = client.patch(
         "/internal/console/knowledge-items/123",
@@ -625,3 +1469,20 @@ def test_console_update_item_invalid_status(mock_db_session):
     assert response.status_code == 400
 
     app.dependency_overrides.pop(get_db, None)
+
+def test_engine_options_from_environment(monkeypatch):
+    """Pool settings come from DATABASE_*, overridable per process prefix"""
+    monkeypatch.setenv("DATABASE_POOL_SIZE", "20")
+    monkeypatch.setenv("DATABASE_MAX_OVERFLOW", "10")
+    monkeypatch.setenv("DATABASE_STATEMENT_TIMEOUT", "5000")
+    monkeypatch.setenv("WORKER_DATABASE_POOL_SIZE", "2")
+
+    api = engine_options("postgresql://synapse@db/synapse")
+    worker = engine_options("postgresql://synapse@db/synapse", env_prefix="WORKER_DATABASE_")
+
+    assert api["pool_size"] == 20
+    assert api["pool_pre_ping"] is True
+    assert api["connect_args"] == {"options": "-c statement_timeout=5000"}
+    assert worker["pool_size"] == 2
+    assert worker["max_overflow"] == 10
+    assert engine_options("sqlite:///:memory:") == {}
@@ -0,0 +1,53 @@
+"""add content-addressed image_blobs table
+
+Revision ID: 003_add_image_blobs
+Revises: 002_add_last_error_column
+Create Date: 2026-10-17 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "003_add_image_blobs"
+down_revision = "002_add_last_error_column"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "image_blobs",
+        sa.Column("content_hash", sa.VARCHAR(64), primary_key=True),
+        sa.Column("storage_key", sa.Text(), nullable=False),
+        sa.Column("size_bytes", sa.BigInteger(), nullable=False),
+        sa.Column("mime_type", sa.VARCHAR(50), nullable=True),
+        sa.Column("ref_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), nullable=False, server_default=sa.text("now()")),
+    )
+    # Partial index so garbage collection only ever scans unreferenced blobs
+    op.create_index(
+        "idx_image_blobs_unreferenced",
+        "image_blobs",
+        ["content_hash"],
+        postgresql_where=sa.text("ref_count <= 0"),
+    )
+
+    # Legacy rows keep their per-item storage keys and a NULL hash
+    op.add_column("image_assets", sa.Column("content_hash", sa.VARCHAR(64), nullable=True))
+    op.create_foreign_key(
+        "fk_image_assets_content_hash",
+        "image_assets",
+        "image_blobs",
+        ["content_hash"],
+        ["content_hash"],
+    )
+    op.create_index("idx_image_assets_content_hash", "image_assets", ["content_hash"])
+
+
+def downgrade() -> None:
+    op.drop_index("idx_image_assets_content_hash", table_name="image_assets")
+    op.drop_constraint("fk_image_assets_content_hash", "image_assets", type_="foreignkey")
+    op.drop_column("image_assets", "content_hash")
+    op.drop_index("idx_image_blobs_unreferenced", table_name="image_blobs")
+    op.drop_table("image_blobs")
@@ -0,0 +1,43 @@
+"""add keyset listing indexes on knowledge_items
+
+Revision ID: 004_add_listing_indexes
+Revises: 003_add_image_blobs
+Create Date: 2026-10-17 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "004_add_listing_indexes"
+down_revision = "003_add_image_blobs"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Built concurrently so a large table keeps accepting captures meanwhile
+    with op.get_context().autocommit_block():
+        # Console listing filtered by status, newest first; id breaks ties for the keyset cursor
+        op.create_index(
+            "idx_knowledge_items_status_created_at",
+            "knowledge_items",
+            ["status", sa.text("created_at DESC"), sa.text("id DESC")],
+            postgresql_concurrently=True,
+        )
+        # Unfiltered listing
+        op.create_index(
+            "idx_knowledge_items_created_at",
+            "knowledge_items",
+            [sa.text("created_at DESC"), sa.text("id DESC")],
+            postgresql_concurrently=True,
+        )
+        # The composite index leads with status, so the single-column one only costs writes
+        op.drop_index("idx_knowledge_items_status", table_name="knowledge_items", postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index("idx_knowledge_items_status", "knowledge_items", ["status"], postgresql_concurrently=True)
+        op.drop_index("idx_knowledge_items_created_at", table_name="knowledge_items", postgresql_concurrently=True)
+        op.drop_index("idx_knowledge_items_status_created_at", table_name="knowledge_items", postgresql_concurrently=True)
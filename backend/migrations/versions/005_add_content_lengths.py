@@ -0,0 +1,51 @@
+"""add maintained content length columns to knowledge_items
+
+Revision ID: 005_add_content_lengths
+Revises: 004_add_listing_indexes
+Create Date: 2026-10-17 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "005_add_content_lengths"
+down_revision = "004_add_listing_indexes"
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH = 5000
+
+
+def upgrade() -> None:
+    # Nullable without a default: adding them is a catalog-only change
+    op.add_column("knowledge_items", sa.Column("text_content_length", sa.Integer(), nullable=True))
+    op.add_column("knowledge_items", sa.Column("html_content_length", sa.Integer(), nullable=True))
+
+    # Backfill in short committed batches walking the primary key, so a large
+    # table is neither locked for long nor rescanned for every batch
+    backfill = sa.text(
+        """
+        WITH batch AS (
+            SELECT id FROM knowledge_items WHERE id > :after ORDER BY id LIMIT :batch
+        ), filled AS (
+            UPDATE knowledge_items AS k
+            SET text_content_length = NULLIF(char_length(k.processed_text_content), 0),
+                html_content_length = NULLIF(char_length(k.processed_html_content), 0)
+            FROM batch
+            WHERE k.id = batch.id
+              AND (k.processed_text_content IS NOT NULL OR k.processed_html_content IS NOT NULL)
+        )
+        SELECT id FROM batch ORDER BY id DESC LIMIT 1
+        """
+    )
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        after = "00000000-0000-0000-0000-000000000000"
+        while after is not None:
+            after = bind.execute(backfill, {"after": after, "batch": BACKFILL_BATCH}).scalar()
+
+
+def downgrade() -> None:
+    op.drop_column("knowledge_items", "html_content_length")
+    op.drop_column("knowledge_items", "text_content_length")
@@ -0,0 +1,27 @@
+"""add object storage keys for offloaded content bodies
+
+Revision ID: 006_add_content_keys
+Revises: 005_add_content_lengths
+Create Date: 2026-10-17 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "006_add_content_keys"
+down_revision = "005_add_content_lengths"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Nullable without a default: a catalog-only change, existing rows keep
+    # their bodies inline until they are next processed
+    op.add_column("knowledge_items", sa.Column("text_content_key", sa.Text(), nullable=True))
+    op.add_column("knowledge_items", sa.Column("html_content_key", sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("knowledge_items", "html_content_key")
+    op.drop_column("knowledge_items", "text_content_key")
@@ -0,0 +1,61 @@
+"""add full-text search vector to knowledge_items
+
+Revision ID: 007_add_search_vector
+Revises: 006_add_content_keys
+Create Date: 2026-10-17 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "007_add_search_vector"
+down_revision = "006_add_content_keys"
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH = 5000
+
+
+def upgrade() -> None:
+    op.add_column("knowledge_items", sa.Column("search_vector", postgresql.TSVECTOR(), nullable=True))
+
+    # Same weighting as api/search.py. Bodies already offloaded to object storage
+    # are indexed by title only until the worker next processes them
+    backfill = sa.text(
+        """
+        WITH batch AS (
+            SELECT id FROM knowledge_items WHERE id > :after ORDER BY id LIMIT :batch
+        ), filled AS (
+            UPDATE knowledge_items AS k
+            SET search_vector =
+                setweight(to_tsvector('english'::regconfig, coalesce(k.title, '')), 'A') ||
+                setweight(to_tsvector('english'::regconfig, left(coalesce(k.processed_text_content, ''), 524288)), 'B')
+            FROM batch
+            WHERE k.id = batch.id
+              AND (k.title IS NOT NULL OR k.processed_text_content IS NOT NULL)
+        )
+        SELECT id FROM batch ORDER BY id DESC LIMIT 1
+        """
+    )
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        after = "00000000-0000-0000-0000-000000000000"
+        while after is not None:
+            after = bind.execute(backfill, {"after": after, "batch": BACKFILL_BATCH}).scalar()
+
+        # Built after the backfill, and concurrently, so captures keep flowing
+        op.create_index(
+            "idx_knowledge_items_search_vector",
+            "knowledge_items",
+            ["search_vector"],
+            postgresql_using="gin",
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index("idx_knowledge_items_search_vector", table_name="knowledge_items", postgresql_concurrently=True)
+    op.drop_column("knowledge_items", "search_vector")
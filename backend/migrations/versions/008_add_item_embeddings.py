@@ -0,0 +1,43 @@
+"""add knowledge item embeddings with an HNSW index
+
+Revision ID: 008_add_item_embeddings
+Revises: 007_add_search_vector
+Create Date: 2026-10-17 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from pgvector.sqlalchemy import Vector
+
+
+# revision identifiers, used by Alembic.
+revision = "008_add_item_embeddings"
+down_revision = "007_add_search_vector"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    op.create_table(
+        "knowledge_item_embeddings",
+        sa.Column("knowledge_item_id", postgresql.UUID(as_uuid=True),
+                  sa.ForeignKey("knowledge_items.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("model", sa.String(length=100), nullable=False),
+        sa.Column("chunk_count", sa.Integer(), nullable=False),
+        sa.Column("embedding", Vector(384), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+    # Approximate nearest neighbours by cosine distance (the <=> operator)
+    op.create_index(
+        "idx_knowledge_item_embeddings_hnsw",
+        "knowledge_item_embeddings",
+        ["embedding"],
+        postgresql_using="hnsw",
+        postgresql_ops={"embedding": "vector_cosine_ops"},
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("idx_knowledge_item_embeddings_hnsw", table_name="knowledge_item_embeddings")
+    op.drop_table("knowledge_item_embeddings")
@@ -0,0 +1,41 @@
+"""add per-item processing stage timings
+
+Revision ID: 009_add_item_stats
+Revises: 008_add_item_embeddings
+Create Date: 2026-10-17 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "009_add_item_stats"
+down_revision = "008_add_item_embeddings"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # One narrow row per item (the latest attempt); stages that did not run stay NULL
+    op.create_table(
+        "knowledge_item_stats",
+        sa.Column("knowledge_item_id", postgresql.UUID(as_uuid=True),
+                  sa.ForeignKey("knowledge_items.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("outcome", sa.String(length=20), nullable=False),
+        sa.Column("total_ms", sa.Integer(), nullable=False),
+        sa.Column("fetch_ms", sa.Integer(), nullable=True),
+        sa.Column("extract_ms", sa.Integer(), nullable=True),
+        sa.Column("images_ms", sa.Integer(), nullable=True),
+        sa.Column("download_ms", sa.Integer(), nullable=True),
+        sa.Column("transcribe_ms", sa.Integer(), nullable=True),
+        sa.Column("commit_ms", sa.Integer(), nullable=True),
+        sa.Column("bytes_downloaded", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("images_found", sa.Integer(), nullable=True),
+        sa.Column("images_stored", sa.Integer(), nullable=True),
+        sa.Column("recorded_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("knowledge_item_stats")
@@ -0,0 +1,189 @@
+import hashlib
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, insert, select, bindparam
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from api.models import ImageAsset, ImageBlob
+
+logger = logging.getLogger(__name__)
+
+image_blobs = ImageBlob.__table__
+
+
+@dataclass
+class StoredBlob:
+    content_hash: str
+    storage_key: str
+    size_bytes: int
+    mime_type: Optional[str]
+    written: bool
+    source_path: Optional[str] = None  # local copy of the bytes, kept until the reference is committed
+
+
+def blob_key(content_hash: str) -> str:
+    """Storage key for a blob; fanned out so no directory grows unbounded"""
+    return f"blobs/sha256/{content_hash[:2]}/{content_hash[2:4]}/{content_hash}"
+
+
+class BlobStore:
+    """
+    Content-addressed image store on top of a storage backend.
+    Identical bytes always map to the same key, so a logo shared by many
+    pages is written once and later writes are skipped.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def put(self, data: bytes, mime_type: Optional[str] = None) -> StoredBlob:
+        content_hash = hashlib.sha256(data).hexdigest()
+        storage_key = blob_key(content_hash)
+        written = False
+        if not self.storage.exists(storage_key):
+            self.storage.put_bytes(storage_key, data, mime_type)
+            written = True
+        return StoredBlob(
+            content_hash=content_hash,
+            storage_key=storage_key,
+            size_bytes=len(data),
+            mime_type=mime_type,
+            written=written,
+        )
+
+    def put_file(self, path: str, content_hash: str, size_bytes: int,
+                 mime_type: Optional[str] = None) -> StoredBlob:
+        """Store a file whose hash was computed while it was downloaded"""
+        storage_key = blob_key(content_hash)
+        written = False
+        if not self.storage.exists(storage_key):
+            self.storage.put_file(storage_key, path, mime_type)
+            written = True
+        return StoredBlob(
+            content_hash=content_hash,
+            storage_key=storage_key,
+            size_bytes=size_bytes,
+            mime_type=mime_type,
+            written=written,
+            source_path=path,
+        )
+
+    def restore(self, blobs: Iterable[StoredBlob]) -> int:
+        """
+        Re-upload blobs whose objects garbage collection deleted between put
+        and acquire (put skips the upload when the object exists, and the
+        reference is only taken at commit). Call with the blobs acquire
+        returned, once their references have committed: from then on the
+        collector leaves them alone. Never raises.
+        """
+        restored = 0
+        for blob in blobs:
+            try:
+                if self.storage.exists(blob.storage_key):
+                    continue
+                if blob.source_path is None:
+                    logger.error(f"Blob {blob.storage_key} is missing and has no local copy to restore")
+                    continue
+                self.storage.put_file(blob.storage_key, blob.source_path, blob.mime_type)
+                restored += 1
+                logger.warning(f"Restored blob {blob.storage_key} removed by garbage collection")
+            except Exception as e:
+                logger.error(f"Error restoring blob {blob.storage_key}: {str(e)}")
+        return restored
+
+    def collect_garbage(self, db: Session, limit: int = 500) -> int:
+        """
+        Delete up to `limit` blobs that no image asset references any more.
+        The objects are deleted while the rows are still locked, before the
+        commit: a task acquiring one of these blobs meanwhile waits, then
+        inserts a fresh row and restores the object (see restore). After a
+        crash, rows left at zero may point at deleted objects; acquire treats
+        every unreferenced row as unverified, so they are restored the same way.
+        """
+        unreferenced = (
+            select(ImageBlob.content_hash)
+            .where(ImageBlob.ref_count <= 0)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        removed = db.execute(
+            delete(ImageBlob)
+            .where(ImageBlob.content_hash.in_(unreferenced), ImageBlob.ref_count <= 0)
+            .returning(ImageBlob.storage_key)
+        ).scalars().all()
+
+        for storage_key in removed:
+            try:
+                self.storage.delete(storage_key)
+            except Exception as e:
+                logger.error(f"Error deleting blob {storage_key}: {str(e)}")
+        db.commit()
+        return len(removed)
+
+
+def acquire(db: Session, blobs: Iterable[StoredBlob]) -> List[StoredBlob]:
+    """
+    Register blobs and add one reference per use, in a single upsert.
+    Returns the blobs whose rows are new or were unreferenced: garbage
+    collection may have deleted their objects since put, so pass them to
+    BlobStore.restore once the transaction has committed.
+    """
+    blobs = list(blobs)
+    if not blobs:
+        return []
+    counts = Counter(blob.content_hash for blob in blobs)
+    first_seen = {}
+    for blob in blobs:
+        first_seen.setdefault(blob.content_hash, blob)
+    stmt = pg_insert(image_blobs).values([
+        {
+            "content_hash": content_hash,
+            "storage_key": blob.storage_key,
+            "size_bytes": blob.size_bytes,
+            "mime_type": blob.mime_type,
+            "ref_count": counts[content_hash],
+        }
+        for content_hash, blob in first_seen.items()
+    ])
+    rows = db.execute(stmt.on_conflict_do_update(
+        index_elements=[image_blobs.c.content_hash],
+        set_={"ref_count": image_blobs.c.ref_count + stmt.excluded.ref_count},
+    ).returning(image_blobs.c.content_hash, image_blobs.c.ref_count)).all()
+    # No references beyond the ones just added: inserted, or unreferenced until now
+    return [first_seen[content_hash] for content_hash, ref_count in rows if ref_count <= counts[content_hash]]
+
+
+def release(db: Session, content_hashes: Iterable[str]) -> None:
+    """Drop one reference per hash; blobs reaching zero are left for collect_garbage"""
+    counts = Counter(h for h in content_hashes if h)
+    if not counts:
+        return
+    db.execute(
+        image_blobs.update()
+        .where(image_blobs.c.content_hash == bindparam("hash"))
+        .values(ref_count=image_blobs.c.ref_count - bindparam("count")),
+        [{"hash": h, "count": n} for h, n in counts.items()],
+    )
+
+
+def release_item_images(db: Session, item_id: str) -> List[str]:
+    """Remove an item's previous image assets (e.g. before a retry) and their references"""
+    content_hashes = db.execute(
+        delete(ImageAsset)
+        .where(ImageAsset.knowledge_item_id == item_id)
+        .returning(ImageAsset.content_hash)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    release(db, content_hashes)
+    return content_hashes
+
+
+def add_image_assets(db: Session, rows: List[Dict[str, Any]]) -> None:
+    """Insert image asset rows in one multi-row INSERT rather than as ORM objects"""
+    if rows:
+        db.execute(insert(ImageAsset), rows)
@@ -0,0 +1,174 @@
+"""
+Embeddings for knowledge items.
+Processed text is split into overlapping word windows, the windows of a whole
+batch of items are embedded together, and each item's vector is the
+normalised mean of its windows. The model is pluggable (EMBEDDING_MODEL):
+"hashing" is a deterministic feature-hashing embedder with no model files,
+anything else names a sentence-transformers model run locally on the CPU.
+"""
+
+import logging
+import os
+import re
+import zlib
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from api.models import EMBEDDING_DIM, KnowledgeItem, KnowledgeItemEmbedding
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'hashing')
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '64'))
+EMBEDDING_CHUNK_WORDS = int(os.getenv('EMBEDDING_CHUNK_WORDS', '200'))
+EMBEDDING_CHUNK_OVERLAP = int(os.getenv('EMBEDDING_CHUNK_OVERLAP', '40'))
+# Very long items are represented by their first windows
+EMBEDDING_MAX_CHUNKS = int(os.getenv('EMBEDDING_MAX_CHUNKS', '64'))
+
+_WORD = re.compile(r'\w+')
+
+
+def chunk_text(text: Optional[str], words: int = EMBEDDING_CHUNK_WORDS,
+               overlap: int = EMBEDDING_CHUNK_OVERLAP, max_chunks: int = EMBEDDING_MAX_CHUNKS) -> List[str]:
+    """Overlapping windows of `words` words; consecutive windows share `overlap` words"""
+    tokens = (text or '').split()
+    if not tokens:
+        return []
+    step = max(1, words - overlap)
+    starts = range(0, max(1, len(tokens) - overlap), step)
+    return [' '.join(tokens[start:start + words]) for start in starts][:max_chunks]
+
+
+@lru_cache(maxsize=1 << 17)
+def _token_hash(token: str) -> int:
+    return zlib.crc32(token.encode('utf-8'))
+
+
+class HashingEmbedder:
+    """
+    Signed feature hashing of lower-cased words into `dim` buckets.
+    Deterministic across processes and needs no model download, so it backs
+    the tests and deployments without a local model; similarity reflects
+    shared vocabulary rather than meaning.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self.name = f'hashing-{dim}'
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        rows, hashes = [], []
+        for row, text in enumerate(texts):
+            tokens = _WORD.findall(text.lower())
+            rows.extend([row] * len(tokens))
+            hashes.extend(_token_hash(token) for token in tokens)
+        rows = np.asarray(rows, dtype=np.int64)
+        hashes = np.asarray(hashes, dtype=np.int64)
+        # Bucket from the low bits, sign from the next bit; one bincount per batch
+        buckets = rows * self.dim + hashes % self.dim
+        signs = np.where((hashes // self.dim) & 1, -1.0, 1.0)
+        counts = np.bincount(buckets, weights=signs, minlength=len(texts) * self.dim)
+        return normalize(counts.reshape(len(texts), self.dim).astype(np.float32))
+
+
+class SentenceTransformerEmbedder:
+    """A sentence-transformers model on the CPU (optional dependency)"""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device='cpu')
+        self.name = model_name
+        self.dim = self.model.get_sentence_embedding_dimension()
+        if self.dim != EMBEDDING_DIM:
+            raise ValueError(f"{model_name} produces {self.dim}-dimensional vectors, expected {EMBEDDING_DIM}")
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        return self.model.encode(list(texts), batch_size=EMBEDDING_BATCH_SIZE, convert_to_numpy=True,
+                                 normalize_embeddings=True).astype(np.float32)
+
+
+@lru_cache(maxsize=None)
+def embedder_from_env():
+    """The process-wide embedder named by EMBEDDING_MODEL, loaded once"""
+    if EMBEDDING_MODEL == 'hashing':
+        return HashingEmbedder()
+    logger.info(f"Loading embedding model {EMBEDDING_MODEL}")
+    return SentenceTransformerEmbedder(EMBEDDING_MODEL)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length (all-zero rows stay zero)"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def embed_documents(texts: Sequence[Optional[str]], embedder) -> Tuple[np.ndarray, List[int]]:
+    """
+    One float32 vector per document, the normalised mean of its chunk vectors,
+    plus the number of chunks of each. Chunks of all documents are embedded
+    together in EMBEDDING_BATCH_SIZE batches. Empty documents get a zero
+    vector and a chunk count of 0.
+    """
+    chunks_per_doc = [chunk_text(text) for text in texts]
+    counts = [len(chunks) for chunks in chunks_per_doc]
+    chunks = [chunk for doc_chunks in chunks_per_doc for chunk in doc_chunks]
+    vectors = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+    if not chunks:
+        return vectors, counts
+
+    chunk_vectors = np.concatenate([
+        embedder.embed(chunks[start:start + EMBEDDING_BATCH_SIZE])
+        for start in range(0, len(chunks), EMBEDDING_BATCH_SIZE)
+    ])
+    # Sum each document's consecutive run of chunk rows in one pass
+    embedded = [i for i, count in enumerate(counts) if count]
+    offsets = np.cumsum([0] + [counts[i] for i in embedded])[:-1]
+    vectors[embedded] = np.add.reduceat(chunk_vectors, offsets, axis=0)
+    return normalize(vectors), counts
+
+
+def load_items_to_embed(db: Session, item_ids: Sequence[str]) -> List:
+    """Title, inline text and offload key of the ids that are ready_for_distillation"""
+    return db.execute(
+        select(KnowledgeItem.id, KnowledgeItem.title,
+               KnowledgeItem.processed_text_content, KnowledgeItem.text_content_key)
+        .where(KnowledgeItem.id.in_(item_ids), KnowledgeItem.status == 'ready_for_distillation')
+    ).all()
+
+
+def store_embeddings(db: Session, rows: List[dict]) -> int:
+    """
+    Upsert item embeddings in one batched statement. If an item was deleted
+    since it was read, the rows of the items that still exist are written instead.
+    Returns the number of rows written; the caller commits.
+    """
+    if not rows:
+        return 0
+    stmt = pg_insert(KnowledgeItemEmbedding)
+    upsert = stmt.on_conflict_do_update(
+        index_elements=[KnowledgeItemEmbedding.knowledge_item_id],
+        set_={
+            "model": stmt.excluded.model,
+            "chunk_count": stmt.excluded.chunk_count,
+            "embedding": stmt.excluded.embedding,
+            "created_at": stmt.excluded.created_at,
+        },
+    )
+    try:
+        with db.begin_nested():
+            db.execute(upsert, rows)
+        return len(rows)
+    except IntegrityError:
+        existing = set(db.execute(
+            select(KnowledgeItem.id).where(KnowledgeItem.id.in_([row["knowledge_item_id"] for row in rows]))
+        ).scalars())
+        rows = [row for row in rows if row["knowledge_item_id"] in existing]
+        if rows:
+            db.execute(upsert, rows)
+        return len(rows)
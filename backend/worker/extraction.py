@@ -0,0 +1,88 @@
+import copy
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import lxml.html
+from readability import Document
+from readability.cleaners import html_cleaner
+from readability.htmls import get_title
+
+_utf8_parser = lxml.html.HTMLParser(encoding='utf-8')
+_display_none_re = re.compile(r"display\s*:\s*none", re.IGNORECASE)
+
+AUTHOR_META = (('name', 'author'), ('property', 'article:author'))
+PUBLISHED_META = (('property', 'article:published_time'), ('name', 'date'))
+
+
+@dataclass
+class ExtractedPage:
+    title: str
+    html: str  # readable article HTML
+    text: str  # plain text of the readable article
+    author: Optional[str]
+    published_date: Optional[str]
+    image_sources: List[str]  # every <img src> on the page, in document order
+
+
+class _TreeDocument(Document):
+    """
+    Readability document fed from an already-cleaned lxml tree.
+    Readability re-parses its input on every scoring pass; here each pass
+    gets a copy of the tree instead, which is far cheaper than parsing.
+    _parse is readability's private hook, so the worker and API pin the same
+    release and the extraction tests fail if it is ever bypassed.
+    """
+
+    def __init__(self, template: lxml.html.HtmlElement):
+        super().__init__(None)
+        self._template = template
+
+    def _parse(self, input):
+        return copy.deepcopy(self._template)
+
+
+def _meta_content(tree: lxml.html.HtmlElement, selectors: Tuple[Tuple[str, str], ...]) -> Optional[str]:
+    """Content of the first <meta> matching any selector, tried in order"""
+    for attr, value in selectors:
+        for meta in tree.iter('meta'):
+            if meta.get(attr) == value:
+                return meta.get('content')
+    return None
+
+
+def extract_page(text: str) -> ExtractedPage:
+    """
+    Parse a decoded HTML page once and derive everything the worker stores:
+    readable HTML, its plain text, title, author/date metadata and images.
+    """
+    # Round-trip through UTF-8 so invalid characters never reach libxml2
+    tree = lxml.html.document_fromstring(text.encode('utf-8', 'replace'), parser=_utf8_parser)
+
+    # Read everything needed from the untouched document before readability mutates it
+    title = get_title(tree)
+    author = _meta_content(tree, AUTHOR_META)
+    published_date = _meta_content(tree, PUBLISHED_META)
+    image_sources = [img.get('src') for img in tree.iter('img') if img.get('src')]
+
+    # Same pre-cleaning readability applies to its input, done once
+    for element in tree.xpath('//*[@hidden]'):
+        element.drop_tree()
+    for element in tree.xpath('//*[@style]'):
+        if _display_none_re.search(element.get('style')):
+            element.drop_tree()
+    template = html_cleaner.clean_html(tree)
+
+    doc = _TreeDocument(template)
+    html = doc.summary()
+    # After summary() readability holds the sanitized article node
+    text_content = doc.html.text_content()
+
+    return ExtractedPage(
+        title=title,
+        html=html,
+        text=text_content,
+        author=author,
+        published_date=published_date,
+        image_sources=image_sources,
+    )
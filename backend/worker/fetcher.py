@@ -0,0 +1,326 @@
+import os
+import re
+import codecs
+import hashlib
+import tempfile
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+import requests
+
+from http_cache import HttpCache
+from http_client import get_session
+
+logger = logging.getLogger(__name__)
+
+# Image download tuning
+IMAGE_FETCH_CONCURRENCY = int(os.getenv('IMAGE_FETCH_CONCURRENCY', '8'))
+IMAGE_FETCH_PER_HOST = int(os.getenv('IMAGE_FETCH_PER_HOST', '4'))
+IMAGE_FETCH_TIMEOUT = float(os.getenv('IMAGE_FETCH_TIMEOUT', '30'))
+IMAGE_FETCH_DEADLINE = float(os.getenv('IMAGE_FETCH_DEADLINE', '120'))
+
+# Byte budgets: per page, per image, and for everything one item downloads
+PAGE_FETCH_TIMEOUT = float(os.getenv('PAGE_FETCH_TIMEOUT', '30'))
+MAX_PAGE_BYTES = int(os.getenv('MAX_PAGE_BYTES', str(10 * 1024 * 1024)))
+MAX_IMAGE_BYTES = int(os.getenv('MAX_IMAGE_BYTES', str(20 * 1024 * 1024)))
+MAX_ITEM_BYTES = int(os.getenv('MAX_ITEM_BYTES', str(100 * 1024 * 1024)))
+FETCH_CHUNK_SIZE = 64 * 1024
+FETCH_TEMP_DIR = os.getenv('FETCH_TEMP_DIR') or None
+
+# How far into a document to look for a <meta charset>
+CHARSET_SNIFF_BYTES = 4096
+_META_CHARSET_RE = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([a-zA-Z0-9_.:\-]+)', re.IGNORECASE)
+_HEADER_CHARSET_RE = re.compile(r'charset\s*=\s*["\']?([^"\';\s]+)', re.IGNORECASE)
+_BOMS = (
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+
+class ResourceTooLarge(Exception):
+    """A download exceeded its per-resource or per-item byte budget"""
+
+
+class ByteBudget:
+    """Thread-safe byte allowance shared by every download of one item"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def consume(self, size: int) -> None:
+        with self._lock:
+            if self.used + size > self.limit:
+                raise ResourceTooLarge(f"Item download budget of {self.limit} bytes exhausted")
+            self.used += size
+
+
+@dataclass
+class FetchedPage:
+    url: str
+    content: bytes
+    encoding: str
+    content_type: str
+    from_cache: bool = False  # served from the HTTP cache after a 304
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding, errors='replace')
+
+
+@dataclass
+class FetchedImage:
+    url: str
+    path: str  # temporary file holding the body; removed by discard_images
+    content_hash: str
+    size: int
+    content_type: str
+    from_cache: bool = False
+
+
+def _normalize_charset(name: Optional[str]) -> Optional[str]:
+    if not name:
+        return None
+    try:
+        return codecs.lookup(name.strip()).name
+    except LookupError:
+        return None
+
+
+def detect_charset(content_type: Optional[str], head: bytes) -> str:
+    """
+    Pick the document encoding the way browsers do: byte order mark first,
+    then the Content-Type charset, then a <meta> declaration near the top,
+    falling back to UTF-8.
+    """
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+
+    match = _HEADER_CHARSET_RE.search(content_type or '')
+    encoding = _normalize_charset(match.group(1)) if match else None
+    if encoding:
+        return encoding
+
+    match = _META_CHARSET_RE.search(head[:CHARSET_SNIFF_BYTES])
+    encoding = _normalize_charset(match.group(1).decode('ascii', 'ignore')) if match else None
+    return encoding or 'utf-8'
+
+
+def _stream_body(response, limit: int, budget: Optional[ByteBudget],
+                 sink: Callable[[bytes], None]) -> int:
+    """Feed the response body to `sink` chunk by chunk, enforcing the byte caps"""
+    declared = response.headers.get('content-length')
+    if declared and declared.isdigit() and int(declared) > limit:
+        raise ResourceTooLarge(f"{response.url} declares {declared} bytes, limit is {limit}")
+
+    received = 0
+    for chunk in response.iter_content(chunk_size=FETCH_CHUNK_SIZE):
+        if not chunk:
+            continue
+        received += len(chunk)
+        if received > limit:
+            raise ResourceTooLarge(f"{response.url} exceeded the {limit} byte limit")
+        if budget is not None:
+            budget.consume(len(chunk))
+        sink(chunk)
+    return received
+
+
+def fetch_page(url: str, budget: Optional[ByteBudget] = None,
+               cache: Optional[HttpCache] = None) -> FetchedPage:
+    """
+    Download an HTML page, capped at MAX_PAGE_BYTES, and detect its charset.
+    With a cache, a previously seen page is revalidated with a conditional
+    GET and a 304 is answered from the cached body.
+    """
+    entry = cache.lookup(url) if cache is not None else None
+    response = get_session().get(url, timeout=PAGE_FETCH_TIMEOUT, stream=True,
+                                 headers=HttpCache.conditional_headers(entry))
+    try:
+        if entry is not None and response.status_code == 304:
+            content = cache.read_body(entry)
+            if content is not None:
+                cache.touch(url)
+                content_type = entry.content_type or 'text/html'
+                logger.info(f"Page {url} not modified, using cached body")
+                return FetchedPage(
+                    url=url,
+                    content=content,
+                    encoding=detect_charset(content_type, content[:CHARSET_SNIFF_BYTES]),
+                    content_type=content_type,
+                    from_cache=True,
+                )
+            # Evicted since the lookup: a miss, so fetch the page without validators
+            response.close()
+            response = get_session().get(url, timeout=PAGE_FETCH_TIMEOUT, stream=True)
+
+        response.raise_for_status()
+        body = bytearray()
+        _stream_body(response, MAX_PAGE_BYTES, budget, body.extend)
+    finally:
+        response.close()
+
+    content = bytes(body)
+    content_type = response.headers.get('content-type', 'text/html')
+    if cache is not None:
+        _store_in_cache(cache, url, response, content_type, hashlib.sha256(content).hexdigest(),
+                        len(content), data=content)
+    return FetchedPage(
+        url=url,
+        content=content,
+        encoding=detect_charset(content_type, content[:CHARSET_SNIFF_BYTES]),
+        content_type=content_type,
+    )
+
+
+def _store_in_cache(cache: HttpCache, url: str, response, content_type: str, body_hash: str,
+                    size: int, data: Optional[bytes] = None, source_path: Optional[str] = None) -> None:
+    # A broken cache must never fail the download it is caching
+    try:
+        cache.store(url, response.headers.get('etag'), response.headers.get('last-modified'),
+                    content_type, body_hash, size, data=data, source_path=source_path)
+    except Exception as e:
+        logger.error(f"Error caching {url}: {str(e)}")
+
+
+def _fetch_one(session: requests.Session, url: str, host_slot: threading.Semaphore,
+               deadline: float, budget: Optional[ByteBudget],
+               cache: Optional[HttpCache] = None) -> Optional[FetchedImage]:
+    remaining = deadline - time.monotonic()
+    if remaining <= 0 or not host_slot.acquire(timeout=remaining):
+        logger.warning(f"Image fetch deadline reached before downloading {url}")
+        return None
+
+    temp_path = None
+    try:
+        timeout = min(IMAGE_FETCH_TIMEOUT, max(deadline - time.monotonic(), 0.1))
+        entry = cache.lookup(url) if cache is not None else None
+        response = session.get(url, timeout=timeout, stream=True,
+                               headers=HttpCache.conditional_headers(entry))
+        try:
+            if entry is not None and response.status_code == 304:
+                fd, temp_path = tempfile.mkstemp(prefix='synapse-img-', dir=FETCH_TEMP_DIR)
+                os.close(fd)
+                if cache.copy_body(entry, temp_path):
+                    cache.touch(url)
+                    fetched = FetchedImage(
+                        url=url,
+                        path=temp_path,
+                        content_hash=entry.body_hash,
+                        size=entry.size,
+                        content_type=entry.content_type or 'image/jpeg',
+                        from_cache=True,
+                    )
+                    temp_path = None
+                    return fetched
+                # Evicted since the lookup: a miss, so fetch the image without validators
+                os.unlink(temp_path)
+                temp_path = None
+                response.close()
+                response = session.get(url, timeout=timeout, stream=True)
+
+            if response.status_code != 200:
+                logger.warning(f"Skipping image {url}: HTTP {response.status_code}")
+                return None
+
+            # Spool to disk while hashing so image bytes never sit in memory
+            digest = hashlib.sha256()
+            fd, temp_path = tempfile.mkstemp(prefix='synapse-img-', dir=FETCH_TEMP_DIR)
+            with os.fdopen(fd, 'wb') as temp_file:
+                def sink(chunk: bytes) -> None:
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+                size = _stream_body(response, MAX_IMAGE_BYTES, budget, sink)
+        finally:
+            response.close()
+
+        fetched = FetchedImage(
+            url=url,
+            path=temp_path,
+            content_hash=digest.hexdigest(),
+            size=size,
+            content_type=response.headers.get('content-type', 'image/jpeg'),
+        )
+        temp_path = None
+        if cache is not None:
+            _store_in_cache(cache, url, response, fetched.content_type, fetched.content_hash,
+                            fetched.size, source_path=fetched.path)
+        return fetched
+    except ResourceTooLarge as e:
+        logger.warning(f"Skipping image {url}: {str(e)}")
+        return None
+    except Exception as e:
+        logger.error(f"Error downloading image {url}: {str(e)}")
+        return None
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.unlink(temp_path)
+        host_slot.release()
+
+
+def _discard_late_result(future) -> None:
+    if not future.cancelled() and future.result() is not None:
+        discard_images([future.result()])
+
+
+def fetch_images(urls: List[str], deadline: Optional[float] = None,
+                 budget: Optional[ByteBudget] = None,
+                 cache: Optional[HttpCache] = None) -> List[Optional[FetchedImage]]:
+    """
+    Download images concurrently over the shared session.
+    Concurrency is bounded overall and per host, and the whole batch is cut
+    off after IMAGE_FETCH_DEADLINE seconds. Bodies are streamed to temporary
+    files, each capped at MAX_IMAGE_BYTES and all drawing on `budget`.
+    Results line up with `urls`; failed, skipped or timed-out downloads are
+    None. Repeated URLs are only fetched once, and with a cache unchanged
+    images are revalidated instead of downloaded. Callers must pass the
+    results to discard_images when done.
+    """
+    if not urls:
+        return []
+
+    deadline_at = time.monotonic() + (IMAGE_FETCH_DEADLINE if deadline is None else deadline)
+    unique_urls = list(dict.fromkeys(urls))
+    host_slots: Dict[str, threading.Semaphore] = {}
+    for url in unique_urls:
+        host = urlparse(url).netloc
+        if host not in host_slots:
+            host_slots[host] = threading.BoundedSemaphore(IMAGE_FETCH_PER_HOST)
+
+    session = get_session()
+    executor = ThreadPoolExecutor(max_workers=min(IMAGE_FETCH_CONCURRENCY, len(unique_urls)),
+                                  thread_name_prefix='image-fetch')
+    try:
+        futures = {
+            url: executor.submit(_fetch_one, session, url, host_slots[urlparse(url).netloc],
+                                 deadline_at, budget, cache)
+            for url in unique_urls
+        }
+        done, not_done = wait(futures.values(), timeout=max(deadline_at - time.monotonic(), 0))
+        if not_done:
+            logger.warning(f"Image fetch deadline reached with {len(not_done)} downloads outstanding")
+            # Stragglers may still finish; make sure their temp files are removed
+            for future in not_done:
+                future.add_done_callback(_discard_late_result)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    results: Dict[str, Optional[FetchedImage]] = {}
+    for url, future in futures.items():
+        results[url] = future.result() if future in done else None
+    return [results[url] for url in urls]
+
+
+def discard_images(images: Iterable[Optional[FetchedImage]]) -> None:
+    """Remove the temporary files behind fetched images"""
+    for image in images:
+        if image is not None and os.path.exists(image.path):
+            os.unlink(image.path)
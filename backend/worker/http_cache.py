@@ -0,0 +1,197 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import logging
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+HTTP_CACHE_ENABLED = os.getenv('HTTP_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+HTTP_CACHE_MAX_BYTES = int(os.getenv('HTTP_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+HTTP_CACHE_MAX_ENTRIES = int(os.getenv('HTTP_CACHE_MAX_ENTRIES', '10000'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    content_type TEXT,
+    body_hash TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    last_used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_last_used_at ON entries (last_used_at);
+CREATE INDEX IF NOT EXISTS idx_entries_body_hash ON entries (body_hash);
+"""
+
+
+@dataclass
+class CacheEntry:
+    url: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content_type: Optional[str]
+    body_hash: str
+    size: int
+
+
+class HttpCache:
+    """
+    Validator cache for conditional GETs, shared by the worker processes on a host.
+    For every URL it remembers the ETag, Last-Modified and the sha256 of
+    the body, and keeps the body on disk so a 304 can be served locally.
+    Entries are evicted least-recently-used first once the cache exceeds
+    max_bytes of bodies or max_entries URLs.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = HTTP_CACHE_MAX_BYTES,
+                 max_entries: int = HTTP_CACHE_MAX_ENTRIES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            os.makedirs(os.path.join(self.directory, 'bodies'), exist_ok=True)
+        conn = sqlite3.connect(os.path.join(self.directory, 'index.sqlite3'), timeout=30)
+        if not self._initialized:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(_SCHEMA)
+            self._initialized = True
+        return conn
+
+    def body_path(self, body_hash: str) -> str:
+        return os.path.join(self.directory, 'bodies', body_hash[:2], body_hash)
+
+    def lookup(self, url: str) -> Optional[CacheEntry]:
+        """Return the entry for `url` if its body is still on disk"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                'SELECT url, etag, last_modified, content_type, body_hash, size FROM entries WHERE url = ?',
+                (url,),
+            ).fetchone()
+        if row is None:
+            return None
+        entry = CacheEntry(*row)
+        return entry if os.path.exists(self.body_path(entry.body_hash)) else None
+
+    @staticmethod
+    def conditional_headers(entry: Optional[CacheEntry]) -> Dict[str, str]:
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def touch(self, url: str) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.execute('UPDATE entries SET last_used_at = ? WHERE url = ?', (time.time(), url))
+
+    def read_body(self, entry: CacheEntry) -> Optional[bytes]:
+        """The cached body, or None if it was evicted since lookup() (a miss)"""
+        try:
+            with open(self.body_path(entry.body_hash), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def copy_body(self, entry: CacheEntry, target_path: str) -> bool:
+        """
+        Materialize a cached body at `target_path`, hard-linking when possible.
+        Returns False if the body was evicted since lookup() (a miss).
+        """
+        source = self.body_path(entry.body_hash)
+        if os.path.exists(target_path):
+            os.unlink(target_path)
+        try:
+            try:
+                os.link(source, target_path)
+            except FileNotFoundError:
+                raise
+            except OSError:
+                shutil.copyfile(source, target_path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def store(self, url: str, etag: Optional[str], last_modified: Optional[str],
+              content_type: Optional[str], body_hash: str, size: int,
+              data: Optional[bytes] = None, source_path: Optional[str] = None) -> None:
+        """Remember the validators and body for `url`; bodies come from `data` or a file"""
+        if not etag and not last_modified:
+            return  # nothing to revalidate with
+        if size > self.max_bytes:
+            return
+
+        body_path = self.body_path(body_hash)
+        if not os.path.exists(body_path):
+            os.makedirs(os.path.dirname(body_path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(body_path), prefix='.tmp-')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    if data is not None:
+                        f.write(data)
+                    else:
+                        with open(source_path, 'rb') as source:
+                            shutil.copyfileobj(source, f)
+                os.replace(temp_path, body_path)
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+                raise
+
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO entries '
+                '(url, etag, last_modified, content_type, body_hash, size, stored_at, last_used_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (url, etag, last_modified, content_type, body_hash, size, now, now),
+            )
+        self.evict()
+
+    def evict(self) -> int:
+        """
+        Drop least-recently-used entries until the cache is within its limits.
+        Only the bodies of the evicted entries are removed, and only those no
+        remaining entry shares; a lookup that loses the race reads a miss.
+        """
+        with closing(self._connect()) as conn:
+            with conn:
+                count, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+                if count <= self.max_entries and total <= self.max_bytes:
+                    return 0
+
+                # Read the oldest entries only as far as needed, then delete them
+                victims = []
+                for url, size, body_hash in conn.execute(
+                        'SELECT url, size, body_hash FROM entries ORDER BY last_used_at'):
+                    if count <= self.max_entries and total <= self.max_bytes:
+                        break
+                    victims.append((url, body_hash))
+                    count -= 1
+                    total -= size
+                conn.executemany('DELETE FROM entries WHERE url = ?', [(url,) for url, _ in victims])
+                evicted = len(victims)
+                evicted_hashes = {body_hash for _, body_hash in victims}
+
+            # Bodies can be shared by several URLs; only remove the unreferenced ones
+            unreferenced = [
+                body_hash for body_hash in evicted_hashes
+                if conn.execute('SELECT 1 FROM entries WHERE body_hash = ? LIMIT 1', (body_hash,)).fetchone() is None
+            ]
+        for body_hash in unreferenced:
+            try:
+                os.unlink(self.body_path(body_hash))
+            except FileNotFoundError:
+                pass
+        logger.info(f"Evicted {evicted} HTTP cache entries")
+        return evicted
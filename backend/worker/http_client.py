@@ -0,0 +1,279 @@
+import os
+import socket
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import redis
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError
+
+logger = logging.getLogger(__name__)
+
+# Connection pooling: hosts kept alive, and sockets per host
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '32'))
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', os.getenv('IMAGE_FETCH_CONCURRENCY', '8')))
+DNS_CACHE_TTL = float(os.getenv('DNS_CACHE_TTL', '300'))
+DNS_CACHE_MAX_ENTRIES = int(os.getenv('DNS_CACHE_MAX_ENTRIES', '4096'))
+
+# Per-domain politeness: sustained requests per second, burst size, and how
+# long a request may queue for a token before it is given up
+HTTP_DOMAIN_RATE = float(os.getenv('HTTP_DOMAIN_RATE', '5'))
+HTTP_DOMAIN_BURST = float(os.getenv('HTTP_DOMAIN_BURST', '10'))
+HTTP_RATE_LIMIT_MAX_WAIT = float(os.getenv('HTTP_RATE_LIMIT_MAX_WAIT', '30'))
+RATE_LIMIT_REDIS_URL = os.getenv('RATE_LIMIT_REDIS_URL', os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+RATE_LIMIT_KEY_PREFIX = 'synapse:ratelimit:'
+# After a Redis error, use the local buckets for this many seconds instead of
+# paying the connect timeout again on every request
+RATE_LIMIT_REDIS_RETRY_AFTER = 5.0
+
+# Reserve one token from a bucket shared by every worker process.
+# Tokens may go negative: the caller then sleeps until its reservation
+# matures, which queues concurrent callers fairly with one round trip each.
+# Reservations that would wait longer than max_wait are refused untaken.
+_RESERVE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local max_wait = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(now - ts, 0) * rate) - 1
+local wait = 0
+if tokens < 0 then
+    wait = -tokens / rate
+end
+if wait <= max_wait then
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil((burst + max_wait * rate) / rate) + 1)
+end
+return tostring(wait)
+"""
+
+
+class RateLimitExceeded(requests.RequestException):
+    """A domain's request rate would have kept us waiting too long"""
+
+
+class LocalTokenBucket:
+    """In-process token buckets, used when Redis is unreachable"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._state: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, domain: str, max_wait: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            tokens, ts = self._state.get(domain, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - ts) * self.rate) - 1
+            wait = -tokens / self.rate if tokens < 0 else 0.0
+            if wait <= max_wait:
+                self._state[domain] = (tokens, now)
+            return wait
+
+
+class RedisTokenBucket:
+    """Token buckets kept in Redis so every worker process shares one budget per domain"""
+
+    def __init__(self, client: redis.Redis, rate: float, burst: float):
+        self.client = client
+        self.rate = rate
+        self.burst = burst
+        self._script = client.register_script(_RESERVE_SCRIPT)
+
+    def reserve(self, domain: str, max_wait: float) -> float:
+        return float(self._script(keys=[RATE_LIMIT_KEY_PREFIX + domain],
+                                  args=[self.rate, self.burst, max_wait]))
+
+
+class DomainRateLimiter:
+    """
+    Blocks each request until its domain has a token to spare.
+    Falls back to per-process buckets while Redis is unavailable, so an
+    outage degrades politeness rather than failing captures.
+    """
+
+    def __init__(self, bucket, fallback: LocalTokenBucket, max_wait: float = HTTP_RATE_LIMIT_MAX_WAIT,
+                 clock=time.monotonic):
+        self.bucket = bucket
+        self.fallback = fallback
+        self.max_wait = max_wait
+        self.clock = clock
+        self._down_until = 0.0
+
+    def acquire(self, url: str) -> float:
+        domain = (urlparse(url).hostname or '').lower()
+        if not domain:
+            return 0.0
+        if self.clock() < self._down_until:
+            wait = self.fallback.reserve(domain, self.max_wait)
+        else:
+            try:
+                wait = self.bucket.reserve(domain, self.max_wait)
+            except redis.RedisError as e:
+                self._down_until = self.clock() + RATE_LIMIT_REDIS_RETRY_AFTER
+                logger.warning(f"Rate limiter falling back to local buckets: {str(e)}")
+                wait = self.fallback.reserve(domain, self.max_wait)
+
+        if wait > self.max_wait:
+            raise RateLimitExceeded(f"Rate limit for {domain} would delay the request by {wait:.1f}s")
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class PoliteSession(requests.Session):
+    """Keep-alive session that takes a domain token before every request, redirects included"""
+
+    def __init__(self, limiter: Optional[DomainRateLimiter]):
+        super().__init__()
+        self.limiter = limiter
+        self._unlimited = threading.local()
+
+    def request(self, method, url, *args, rate_limit: bool = True, **kwargs):
+        # Internal services (e.g. STT) pass rate_limit=False
+        self._unlimited.active = not rate_limit
+        try:
+            return super().request(method, url, *args, **kwargs)
+        finally:
+            self._unlimited.active = False
+
+    def send(self, request, **kwargs):
+        # Runs for the first request and again for each redirect hop it follows
+        if self.limiter is not None and not getattr(self._unlimited, 'active', False):
+            self.limiter.acquire(request.url)
+        return super().send(request, **kwargs)
+
+
+class DnsCache:
+    """
+    TTL cache in front of socket.getaddrinfo; repeat lookups skip the resolver.
+    Holds at most max_entries lookups, dropping expired ones first and then
+    the least recently used.
+    """
+
+    def __init__(self, resolve, ttl: float, max_entries: int = DNS_CACHE_MAX_ENTRIES):
+        self.resolve = resolve
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, Tuple[float, list]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def getaddrinfo(self, *args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[0] > now:
+                self._entries.move_to_end(key)
+                return cached[1]
+        result = self.resolve(*args, **kwargs)
+        with self._lock:
+            self._entries[key] = (now + self.ttl, result)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                for stale in [k for k, (expires_at, _) in self._entries.items() if expires_at <= now]:
+                    del self._entries[stale]
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return result
+
+    def addresses(self, host: str, port: int) -> List[str]:
+        """The host's addresses for a TCP connection, in resolver order"""
+        infos = self.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        return list(dict.fromkeys(info[4][0] for info in infos))
+
+
+class _CachedDnsConnection:
+    """urllib3 connection mixin that resolves its host through the class's dns_cache"""
+
+    dns_cache: DnsCache
+
+    def _new_conn(self):
+        # _dns_host is only what urllib3 connects to; TLS still verifies self.host,
+        # which is restored before the handshake
+        host = self._dns_host
+        try:
+            addresses = self.dns_cache.addresses(host, self.port)
+        except socket.gaierror:
+            return super()._new_conn()  # let urllib3 report the lookup failure
+        error = None
+        for address in addresses:
+            self._dns_host = address
+            try:
+                return super()._new_conn()
+            except NewConnectionError as e:
+                error = e
+            finally:
+                self._dns_host = host
+        raise error
+
+
+class CachedDnsAdapter(HTTPAdapter):
+    """Transport adapter whose connections look names up through `dns_cache`, and nothing else's do"""
+
+    def __init__(self, dns_cache: DnsCache, **kwargs):
+        self.dns_cache = dns_cache
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        attrs = {'dns_cache': self.dns_cache}
+        http = type('CachedDnsHTTPConnection', (_CachedDnsConnection, HTTPConnection), attrs)
+        https = type('CachedDnsHTTPSConnection', (_CachedDnsConnection, HTTPSConnection), attrs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': type('CachedDnsHTTPConnectionPool', (HTTPConnectionPool,), {'ConnectionCls': http}),
+            'https': type('CachedDnsHTTPSConnectionPool', (HTTPSConnectionPool,), {'ConnectionCls': https}),
+        }
+
+
+_session: Optional[PoliteSession] = None
+_session_pid: Optional[int] = None
+_session_lock = threading.Lock()
+
+
+def _build_limiter() -> Optional[DomainRateLimiter]:
+    if HTTP_DOMAIN_RATE <= 0:
+        return None
+    client = redis.Redis.from_url(RATE_LIMIT_REDIS_URL, socket_timeout=1, socket_connect_timeout=1)
+    return DomainRateLimiter(
+        RedisTokenBucket(client, HTTP_DOMAIN_RATE, HTTP_DOMAIN_BURST),
+        LocalTokenBucket(HTTP_DOMAIN_RATE, HTTP_DOMAIN_BURST),
+    )
+
+
+def get_session() -> PoliteSession:
+    """
+    Return the process-wide keep-alive session.
+    A new session is built after a fork so pooled sockets are never shared
+    between Celery worker processes.
+    """
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            session = PoliteSession(_build_limiter())
+            pool_options = dict(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+            if DNS_CACHE_TTL > 0:
+                # Only fetches use the cache; Redis, Postgres and S3 resolve as usual
+                adapter = CachedDnsAdapter(DnsCache(socket.getaddrinfo, DNS_CACHE_TTL), **pool_options)
+            else:
+                adapter = HTTPAdapter(**pool_options)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+            _session_pid = os.getpid()
+        return _session
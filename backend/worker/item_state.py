@@ -0,0 +1,134 @@
+"""
+Short transactions that move a KnowledgeItem through its processing states.
+Tasks run as claim -> work -> commit: the claim and commit phases each use
+their own brief session, and the work phase (page and image downloads,
+yt-dlp, STT) holds no database connection at all. Each committed status
+change is published as an item event so API processes drop cached copies.
+"""
+
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from sqlalchemy import Row, select, update
+from sqlalchemy.orm import Session
+
+from api.content_store import with_content_lengths
+from api.item_events import publish_item_event
+from api.search import search_vector
+from api.models import KnowledgeItem
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def session_scope(session_factory) -> Iterator[Session]:
+    """A session that lives for one phase and always goes back to the pool"""
+    db = session_factory()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def claim_item(session_factory, item_id: str) -> Optional[Row]:
+    """
+    Mark the item as processing with a single UPDATE ... RETURNING.
+    Returns a row with the item's id, user_id and source_url, or None if it does not exist.
+    """
+    with session_scope(session_factory) as db:
+        claimed = db.execute(
+            update(KnowledgeItem)
+            .where(KnowledgeItem.id == item_id)
+            .values(status='processing', processed_at=datetime.now(), last_error=None)
+            .returning(KnowledgeItem.id, KnowledgeItem.user_id, KnowledgeItem.source_url)
+            .execution_options(synchronize_session=False)
+        ).first()
+        db.commit()
+    if claimed is not None:
+        publish_item_event(item_id, 'processing', claimed.user_id)
+    return claimed
+
+
+def complete_item(session_factory, item_id: str, values: Dict[str, Any],
+                  write_related: Optional[Callable[[Session], None]] = None,
+                  content_store=None) -> bool:
+    """
+    Store the results of the work phase and mark the item ready, in one transaction.
+    `values` are written to the item's columns with a targeted UPDATE (content
+    columns bring their length columns along), and
+    `write_related` adds dependent rows (e.g. image assets) in the same
+    transaction. With a `content_store`, oversized bodies are uploaded first
+    under fresh keys and only their pointers are written; the objects the row
+    pointed to before are deleted once it commits, and this attempt's objects
+    if it does not. New text also refreshes the search vector.
+    Returns False if the item was deleted while it was being processed.
+    """
+    if 'processed_text_content' in values:
+        # Built from the full text, so offloaded bodies stay searchable
+        values = dict(values, search_vector=search_vector(
+            values.get('title', KnowledgeItem.title), values['processed_text_content']))
+    if content_store is not None:
+        # Upload before the transaction starts so no connection waits on storage
+        values = content_store.offload(item_id, values)
+    # The row as it was before this UPDATE, locked, so RETURNING can report the keys it replaces
+    previous = (
+        select(KnowledgeItem.id, KnowledgeItem.text_content_key, KnowledgeItem.html_content_key)
+        .where(KnowledgeItem.id == item_id)
+        .with_for_update()
+        .subquery()
+    )
+    try:
+        with session_scope(session_factory) as db:
+            updated = db.execute(
+                update(KnowledgeItem)
+                .where(KnowledgeItem.id == previous.c.id)
+                .values(**with_content_lengths(values), status='ready_for_distillation', last_error=None)
+                .returning(KnowledgeItem.user_id, previous.c.text_content_key, previous.c.html_content_key)
+                .execution_options(synchronize_session=False)
+            ).first()
+            if updated is None:
+                db.rollback()
+                logger.warning(f"Item {item_id} was deleted during processing")
+            else:
+                if write_related is not None:
+                    write_related(db)
+                db.commit()
+    except Exception:
+        if content_store is not None:
+            content_store.discard(content_store.uploaded_keys(values))
+        raise
+    if updated is None:
+        if content_store is not None:
+            content_store.discard(content_store.uploaded_keys(values))
+        return False
+    publish_item_event(item_id, 'ready_for_distillation', updated.user_id)
+    if content_store is not None:
+        # The committed row no longer points at the previous attempt's objects
+        content_store.discard(content_store.stale_keys(updated._mapping, values))
+    return True
+
+
+def fail_item(session_factory, item_id: str, error: Exception,
+              write_related: Optional[Callable[[Session], None]] = None) -> None:
+    """
+    Record a processing error; never raises so the task can still report it.
+    `write_related` adds dependent rows (e.g. the attempt's stats) in the same transaction.
+    """
+    try:
+        with session_scope(session_factory) as db:
+            failed = db.execute(
+                update(KnowledgeItem)
+                .where(KnowledgeItem.id == item_id)
+                .values(status='error', last_error=str(error))
+                .returning(KnowledgeItem.user_id)
+                .execution_options(synchronize_session=False)
+            ).first()
+            if failed is not None and write_related is not None:
+                write_related(db)
+            db.commit()
+        if failed is not None:
+            publish_item_event(item_id, 'error', failed.user_id)
+    except Exception as e:
+        logger.error(f"Error recording failure for item {item_id}: {str(e)}")
@@ -0,0 +1,84 @@
+"""
+Where a processing attempt spent its time. Tasks wrap each stage (page
+fetch, extraction, image downloads, yt-dlp, STT, the commit) in
+ItemStats.stage, and the item's knowledge_item_stats row, with bytes
+downloaded and image counts, is written in the same transaction that
+stores the attempt's outcome.
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from api.models import ITEM_STAGES, KnowledgeItemStats
+
+logger = logging.getLogger(__name__)
+
+
+class ItemStats:
+    """Stage timings and download counts for one processing attempt"""
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.started = clock()
+        self.stage_ms: Dict[str, int] = {}
+        self._running: Dict[str, float] = {}
+        self.bytes_downloaded = 0
+        self.images_found: Optional[int] = None
+        self.images_stored: Optional[int] = None
+
+    def _elapsed_ms(self, started: float) -> int:
+        return round((self.clock() - started) * 1000)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the block as `name`; a stage that raises is still timed up to the error"""
+        started = self._running[name] = self.clock()
+        try:
+            yield
+        finally:
+            del self._running[name]
+            self.stage_ms[name] = self.stage_ms.get(name, 0) + self._elapsed_ms(started)
+
+    def values(self, outcome: str) -> Dict[str, Any]:
+        """Column values of the item's stats row; stages still running count up to now"""
+        stage_ms = dict(self.stage_ms)
+        for name, started in self._running.items():
+            stage_ms[name] = stage_ms.get(name, 0) + self._elapsed_ms(started)
+        row = {f"{stage}_ms": stage_ms.get(stage) for stage in ITEM_STAGES}
+        row.update(
+            outcome=outcome,
+            total_ms=self._elapsed_ms(self.started),
+            bytes_downloaded=self.bytes_downloaded,
+            images_found=self.images_found,
+            images_stored=self.images_stored,
+            recorded_at=datetime.now(),
+        )
+        return row
+
+
+def write_stats(db: Session, item_id: str, stats: ItemStats, outcome: str) -> None:
+    """
+    Upsert the item's stats row inside the caller's transaction. It runs in
+    a savepoint and never raises: timings are diagnostics, and losing them
+    must not lose the outcome they describe.
+    """
+    values = stats.values(outcome)
+    stages = ", ".join(f"{stage} {values[f'{stage}_ms']} ms" for stage in ITEM_STAGES
+                       if values[f"{stage}_ms"] is not None)
+    logger.info(f"Item {item_id} {outcome} in {values['total_ms']} ms ({stages}), "
+                f"{values['bytes_downloaded']} bytes downloaded")
+    stmt = pg_insert(KnowledgeItemStats).values(knowledge_item_id=item_id, **values)
+    try:
+        with db.begin_nested():
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=[KnowledgeItemStats.knowledge_item_id],
+                set_={column: stmt.excluded[column] for column in values},
+            ))
+    except Exception as e:
+        logger.error(f"Error recording stats for item {item_id}: {str(e)}")
@@ -0,0 +1,85 @@
+"""
+Prometheus metrics for Celery workers: per-task duration, outcome and the
+time a task waited in the queue, fed by Celery's task signals. The worker's
+main process serves them on WORKER_METRICS_PORT (0 disables). With the
+prefork pool the tasks run in child processes, so PROMETHEUS_MULTIPROC_DIR
+must point at an empty directory for their samples to reach the server.
+"""
+
+import logging
+import os
+import time
+from typing import Any, Dict
+
+from celery.signals import before_task_publish, task_postrun, task_prerun, worker_init
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, multiprocess, start_http_server
+
+logger = logging.getLogger(__name__)
+
+WORKER_METRICS_PORT = int(os.getenv('WORKER_METRICS_PORT', '9540'))
+# Seconds; tasks range from sub-second embeds to hour-long media transcriptions
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+
+TASK_DURATION = Histogram(
+    'synapse_worker_task_duration_seconds', 'Time a task took to run', ['task', 'outcome'],
+    buckets=DURATION_BUCKETS,
+)
+TASKS = Counter('synapse_worker_tasks_total', 'Tasks run by outcome', ['task', 'outcome'])
+QUEUE_WAIT = Histogram(
+    'synapse_worker_task_queue_wait_seconds', 'Time from publish to the start of the task', ['task'],
+    buckets=WAIT_BUCKETS,
+)
+
+# Start times of the tasks running in this process, by task id
+_started: Dict[str, float] = {}
+
+
+def task_outcome(retval: Any, state: str) -> str:
+    """The tasks report failures in their result ({"status": "error"}) rather than by raising"""
+    if isinstance(retval, dict) and isinstance(retval.get('status'), str):
+        return retval['status']
+    return (state or 'unknown').lower()
+
+
+@before_task_publish.connect
+def _stamp_sent_at(headers=None, **kwargs):
+    # Tasks the worker enqueues itself (embeddings); the API stamps its own
+    if headers is not None:
+        headers.setdefault('sent_at', time.time())
+
+
+@task_prerun.connect
+def _task_started(task_id=None, task=None, **kwargs):
+    now = time.time()
+    _started[task_id] = time.perf_counter()
+    sent_at = getattr(task.request, 'sent_at', None)
+    if isinstance(sent_at, (int, float)):
+        # Publisher and worker clocks can disagree by a little
+        QUEUE_WAIT.labels(task.name).observe(max(0.0, now - sent_at))
+
+
+@task_postrun.connect
+def _task_finished(task_id=None, task=None, retval=None, state=None, **kwargs):
+    started = _started.pop(task_id, None)
+    outcome = task_outcome(retval, state)
+    TASKS.labels(task.name, outcome).inc()
+    if started is not None:
+        TASK_DURATION.labels(task.name, outcome).observe(time.perf_counter() - started)
+
+
+@worker_init.connect
+def _serve_metrics(**kwargs):
+    if not WORKER_METRICS_PORT:
+        return
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    try:
+        start_http_server(WORKER_METRICS_PORT, registry=registry)
+        logger.info(f"Serving worker metrics on port {WORKER_METRICS_PORT}")
+    except OSError as e:
+        # Another worker on this host has the port; this one runs unscraped
+        logger.warning(f"Worker metrics not served on port {WORKER_METRICS_PORT}: {str(e)}")
@@ -3,8 +3,30 @@ from unittest.mock import patch, MagicMock
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from app import process_webpage, process_media
+from app import embed_items, process_webpage, process_media, process_voicememo
+from embeddings import EMBEDDING_DIM, HashingEmbedder, chunk_text, embed_documents
+from fetcher import ByteBudget, FetchedImage, ResourceTooLarge, detect_charset, discard_images, fetch_images, fetch_page
+from blobstore import BlobStore, StoredBlob, acquire, blob_key
+from extraction import extract_page
+from api.storage import LocalStorage
+from api.content_store import ContentStore
+from item_state import complete_item
+from http_cache import HttpCache
+from http_client import CachedDnsAdapter, DnsCache, DomainRateLimiter, LocalTokenBucket, PoliteSession, RateLimitExceeded
+import redis
+import codecs
+import io
+import requests
+import socket
+import hashlib
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql.dml import Insert, Update
+import threading
+import time
 import uuid
+import numpy as np
+
+FIXTURE_PAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'pages')
 
 @pytest.fixture
 def mock_db_session():
@@ -12,16 +34,54 @@ def mock_db_session():
     session = MagicMock()
     yield session
 
+def _fake_response(content=b"", status_code=200, headers=None):
+    """Streaming response double; the body is read from `.content` when iterated"""
+    response = MagicMock()
+    response.content = content
+    response.status_code = status_code
+    response.headers = headers if headers is not None else {}
+    response.iter_content.side_effect = lambda chunk_size: iter([response.content])
+    return response
+
+@pytest.fixture(autouse=True)
+def mock_embedding_queue():
+    """Processing tasks enqueue the embedding stage last; keep that off the broker"""
+    with patch('app.embed_items.delay') as delay:
+        yield delay
+
+@pytest.fixture(autouse=True)
+def mock_item_events():
+    """State transitions publish item events; keep them off Redis"""
+    with patch('item_state.publish_item_event') as publish:
+        yield publish
+
 @pytest.fixture
 def mock_requests():
-    """Mock requests for testing"""
-    with patch('app.requests') as mock_req:
-        mock_response = MagicMock()
-        mock_response.content = b"<html><title>Test</title><body><p>Test content</p></body></html>"
-        mock_response.text = "<html><title>Test</title><body><p>Test content</p></body></html>"
-        mock_response.status_code = 200
-        mock_req.get.return_value = mock_response
-        yield mock_req
+    """Mock the worker's shared HTTP session for testing"""
+    with patch('fetcher.get_session') as mock_get_session, patch('app.http_cache', None):
+        mock_session = MagicMock()
+        mock_session.get.return_value = _fake_response(
+            b"<html><title>Test</title><body><p>Test content</p></body></html>",
+            headers={"content-type": "text/html; charset=utf-8"},
+        )
+        mock_get_session.return_value = mock_session
+        yield mock_session
+
+def _item_updates(session):
+    """Column values of each UPDATE knowledge_items the task executed, in order"""
+    return [
+        call.args[0].compile().params
+        for call in session.execute.call_args_list
+        if isinstance(call.args[0], Update) and call.args[0].table.name == 'knowledge_items'
+    ]
+
+def _item_stats(session):
+    """Column values of the stats rows the task upserted, in order"""
+    return [
+        call.args[0].compile(dialect=postgresql.dialect()).params
+        for call in session.execute.call_args_list
+        if isinstance(call.args[0], Insert) and call.args[0].table.name == 'knowledge_item_stats'
+    ]
 
 @pytest.fixture
 def mock_s3_client():
@@ -29,33 +89,39 @@ def mock_s3_client():
     with patch('app.s3_client') as mock_s3:
         yield mock_s3
 
-def test_process_webpage_success(mock_db_session, mock_requests):
+def test_process_webpage_success(mock_db_session, mock_requests, mock_embedding_queue, mock_item_events):
     """Test successful webpage processing"""
     item_id = str(uuid.uuid4())
     
-    # Mock database query
+    # Row returned by the claim's UPDATE ... RETURNING
     mock_item = MagicMock()
     mock_item.id = item_id
     mock_item.source_url = "https://example.com"
     mock_item.status = "processing"
     
     with patch('app.SessionLocal', return_value=mock_db_session):
-        mock_db_session.query().filter().first.return_value = mock_item
+        mock_db_session.execute.return_value.first.return_value = mock_item
         
         result = process_webpage(item_id)
         
     assert result["status"] == "success"
     assert result["item_id"] == item_id
-    assert mock_item.status == "ready_for_distillation"
-    assert mock_item.last_error is None
-    mock_db_session.commit.assert_called_once()
+    assert _item_updates(mock_db_session)[-1]["status"] == "ready_for_distillation"
+    assert _item_updates(mock_db_session)[-1]["last_error"] is None
+    # One short transaction to claim the item and one to store the outcome
+    assert mock_db_session.commit.call_count == 2
+    # The embedding stage follows once the item is ready
+    mock_embedding_queue.assert_called_once_with([item_id])
+    # API processes hear about each transition after it is committed
+    assert [c.args for c in mock_item_events.call_args_list] == [
+        (item_id, "processing", mock_item.user_id), (item_id, "ready_for_distillation", mock_item.user_id)]
 
 def test_process_webpage_not_found(mock_db_session):
     """Test webpage processing when item not found"""
     item_id = str(uuid.uuid4())
     
     with patch('app.SessionLocal', return_value=mock_db_session):
-        mock_db_session.query().filter().first.return_value = None
+        mock_db_session.execute.return_value.first.return_value = None
         
         result = process_webpage(item_id)
         
@@ -63,7 +129,7 @@ def test_process_webpage_not_found(mock_db_session):
     assert result["item_id"] == item_id
     assert "not found" in result["message"]
 
-def test_process_webpage_error(mock_db_session, mock_requests):
+def test_process_webpage_error(mock_db_session, mock_requests, mock_item_events):
     """Test webpage processing with error"""
     item_id = str(uuid.uuid4())
     
@@ -76,15 +142,17 @@ def test_process_webpage_error(mock_db_session, mock_requests):
     mock_requests.get.side_effect = Exception("Network error")
     
     with patch('app.SessionLocal', return_value=mock_db_session):
-        mock_db_session.query().filter().first.return_value = mock_item
+        mock_db_session.execute.return_value.first.return_value = mock_item
         
         result = process_webpage(item_id)
         
     assert result["status"] == "error"
     assert result["item_id"] == item_id
-    assert mock_item.status == "error"
-    assert mock_item.last_error == "Network error"
-    mock_db_session.commit.assert_called_once()
+    assert _item_updates(mock_db_session)[-1]["status"] == "error"
+    assert _item_updates(mock_db_session)[-1]["last_error"] == "Network error"
+    # One short transaction to claim the item and one to store the outcome
+    assert mock_db_session.commit.call_count == 2
+    mock_item_events.assert_called_with(item_id, "error", mock_item.user_id)
 
 def test_process_media_success(mock_db_session):
     """Test successful media processing"""
@@ -97,7 +165,8 @@ def test_process_media_success(mock_db_session):
     
     with patch('app.SessionLocal', return_value=mock_db_session):
         with patch('app.subprocess.run') as mock_subprocess:
-            with patch('app.requests.post') as mock_post:
+            with patch('app.get_session') as mock_get_session:
+                mock_post = mock_get_session.return_value.post
                 mock_subprocess.return_value.returncode = 0
                 mock_subprocess.return_value.stderr = ""
                 
@@ -106,22 +175,112 @@ def test_process_media_success(mock_db_session):
                 mock_response.status_code = 200
                 mock_post.return_value = mock_response
                 
-                mock_db_session.query().filter().first.return_value = mock_item
+                mock_db_session.execute.return_value.first.return_value = mock_item
                 
                 result = process_media(item_id, "video")
                 
     assert result["status"] == "success"
     assert result["item_id"] == item_id
-    assert mock_item.status == "ready_for_distillation"
-    assert mock_item.last_error is None
-    mock_db_session.commit.assert_called_once()
+    assert _item_updates(mock_db_session)[-1]["status"] == "ready_for_distillation"
+    assert _item_updates(mock_db_session)[-1]["last_error"] is None
+    # The transcript's length column is written with it; html is left untouched
+    assert _item_updates(mock_db_session)[-1]["text_content_length"] == len("Test transcript")
+    assert "html_content_length" not in _item_updates(mock_db_session)[-1]
+    # One short transaction to claim the item and one to store the outcome
+    assert mock_db_session.commit.call_count == 2
+
+def test_s3_worker_enqueues_embedding_after_completing(mock_db_session):
+    """The S3 worker's tasks hand finished items to the embedding stage too"""
+    import tasks
+    item_id = str(uuid.uuid4())
+    mock_db_session.execute.return_value.first.return_value = MagicMock(id=item_id, source_url="https://youtube.com/watch?v=123")
+
+    with patch('tasks.SessionLocal', return_value=mock_db_session), \
+         patch('tasks.subprocess.run') as mock_subprocess, \
+         patch('tasks.get_session') as mock_get_session, \
+         patch('tasks.celery_app.send_task') as send_task:
+        mock_subprocess.return_value.returncode = 0
+        mock_get_session.return_value.post.return_value.json.return_value = {"transcript": "Test transcript"}
+        tasks.process_media(item_id)
+        send_task.assert_called_once_with('tasks.embed_items', args=[[item_id]])
+
+        # A broker outage is logged, not raised
+        send_task.side_effect = ConnectionError("broker down")
+        tasks.enqueue_embedding(item_id)
+
+def test_complete_item_never_overwrites_committed_content(mock_db_session, tmp_path):
+    """Each attempt uploads under a new key; the replaced object goes after the commit, a lost one at once"""
+    item_id = str(uuid.uuid4())
+    storage = LocalStorage(str(tmp_path))
+    store = ContentStore(storage, threshold=10)
+    old_key = store.offload(item_id, {"processed_text_content": "an earlier attempt's body"})["text_content_key"]
+    row = MagicMock(user_id=uuid.uuid4())
+    row._mapping = {"user_id": row.user_id, "text_content_key": old_key, "html_content_key": None}
+    mock_db_session.execute.return_value.first.return_value = row
+    mock_db_session.commit.side_effect = lambda: seen.append(storage.exists(old_key))
+    seen = []
+
+    assert complete_item(lambda: mock_db_session, item_id, {"processed_text_content": "this attempt's longer body"},
+                         content_store=store)
+    new_key = _item_updates(mock_db_session)[-1]["text_content_key"]
+    assert new_key != old_key and seen == [True]
+    assert not storage.exists(old_key) and store.read_text(new_key) == "this attempt's longer body"
+    assert "FOR UPDATE" in str(mock_db_session.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+
+    # The item was deleted meanwhile: nothing references this attempt's upload
+    mock_db_session.execute.return_value.first.return_value = None
+    assert not complete_item(lambda: mock_db_session, item_id, {"processed_text_content": "a body nobody keeps"},
+                             content_store=store)
+    assert not storage.exists(_item_updates(mock_db_session)[-1]["text_content_key"])
+
+def test_process_voicememo_records_stats(mock_db_session):
+    """Voice memos get a stats row with their outcome and commit time"""
+    item_id = str(uuid.uuid4())
+    with patch('app.SessionLocal', return_value=mock_db_session):
+        mock_db_session.execute.return_value.first.return_value = MagicMock(id=item_id)
+        result = process_voicememo(item_id)
+
+    assert result["status"] == "success"
+    [stats] = _item_stats(mock_db_session)
+    assert stats["outcome"] == "success" and stats["fetch_ms"] is None
+    assert mock_db_session.commit.call_count == 2
+
+def test_process_media_offloads_long_transcript(mock_db_session, tmp_path):
+    """Transcripts over the threshold are stored gzipped with a pointer in the row"""
+    item_id = str(uuid.uuid4())
+    transcript = "word " * 100
+    mock_item = MagicMock(id=item_id, source_url="https://youtube.com/watch?v=123", status="processing")
+    store = ContentStore(LocalStorage(str(tmp_path)), threshold=10)
+
+    with patch('app.SessionLocal', return_value=mock_db_session), \
+         patch('app.content_store', store), \
+         patch('app.subprocess.run') as mock_subprocess, \
+         patch('app.get_session') as mock_get_session:
+        mock_subprocess.return_value.returncode = 0
+        mock_subprocess.return_value.stderr = ""
+        mock_get_session.return_value.post.return_value.json.return_value = {"transcript": transcript}
+        mock_get_session.return_value.post.return_value.status_code = 200
+        mock_db_session.execute.return_value.first.return_value = mock_item
+        result = process_media(item_id, "video")
+
+    assert result["status"] == "success"
+    update = _item_updates(mock_db_session)[-1]
+    assert update["processed_text_content"] is None
+    assert update["text_content_length"] == len(transcript)
+    assert update["text_content_key"].startswith(f"content/{item_id[:2]}/{item_id}/processed_text_content-")
+    assert store.read_text(update["text_content_key"]) == transcript
+    # The search vector is built from the full transcript, not the NULL column
+    stmt = [c.args[0] for c in mock_db_session.execute.call_args_list if isinstance(c.args[0], Update)][-1]
+    compiled = stmt.compile(dialect=postgresql.dialect())
+    assert "search_vector=(setweight(to_tsvector(" in str(compiled)
+    assert transcript in compiled.params.values()
 
 def test_process_media_not_found(mock_db_session):
     """Test media processing when item not found"""
     item_id = str(uuid.uuid4())
     
     with patch('app.SessionLocal', return_value=mock_db_session):
-        mock_db_session.query().filter().first.return_value = None
+        mock_db_session.execute.return_value.first.return_value = None
         
         result = process_media(item_id, "video")
         
@@ -142,12 +301,631 @@ def test_process_media_error(mock_db_session):
         with patch('app.subprocess.run') as mock_subprocess:
             mock_subprocess.side_effect = Exception("yt-dlp failed")
             
-            mock_db_session.query().filter().first.return_value = mock_item
+            mock_db_session.execute.return_value.first.return_value = mock_item
             
             result = process_media(item_id, "video")
             
     assert result["status"] == "error"
     assert result["item_id"] == item_id
-    assert mock_item.status == "error"
-    assert mock_item.last_error == "yt-dlp failed"
-    mock_db_session.commit.assert_called_once()
+    assert _item_updates(mock_db_session)[-1]["status"] == "error"
+    assert _item_updates(mock_db_session)[-1]["last_error"] == "yt-dlp failed"
+    # One short transaction to claim the item and one to store the outcome
+    assert mock_db_session.commit.call_count == 2
+
+def test_process_webpage_holds_no_connection_during_fetch(mock_db_session, mock_requests):
+    """The claim is committed and its session closed before any network I/O"""
+    item_id = str(uuid.uuid4())
+    mock_item = MagicMock()
+    mock_item.source_url = "https://example.com"
+    seen = {}
+
+    def fake_get(url, **kwargs):
+        seen["commits"] = mock_db_session.commit.call_count
+        seen["closes"] = mock_db_session.close.call_count
+        return _fake_response(b"<html><title>T</title><body><p>Body</p></body></html>")
+
+    mock_requests.get.side_effect = fake_get
+    with patch('app.SessionLocal', return_value=mock_db_session):
+        mock_db_session.execute.return_value.first.return_value = mock_item
+        result = process_webpage(item_id)
+
+    assert result["status"] == "success"
+    assert seen == {"commits": 1, "closes": 1}
+    assert mock_db_session.close.call_count == 2
+
+def test_process_webpage_downloads_images(mock_db_session, mock_requests, tmp_path):
+    """Images are fetched concurrently and stored under the item's image prefix"""
+    item_id = str(uuid.uuid4())
+    mock_requests.get.return_value.content = (
+        b"<html><title>Test</title><body><p>Test content</p>"
+        b"<img src='/a.png'><img src='https://cdn.example.com/b.gif'><img src='/missing.png'></body></html>"
+    )
+
+    mock_item = MagicMock()
+    mock_item.id = item_id
+    mock_item.source_url = "https://example.com/post"
+
+    def fake_fetch(urls, budget, cache):
+        results = []
+        for url in urls:
+            if "missing" in url:
+                results.append(None)
+                continue
+            path = tmp_path / f"download-{len(results)}"
+            path.write_bytes(b"img")
+            results.append(FetchedImage(url=url, path=str(path), content_hash=hashlib.sha256(b"img").hexdigest(),
+                                        size=3, content_type="image/png"))
+        return results
+
+    with patch('app.SessionLocal', return_value=mock_db_session), \
+            patch('app.blob_store', BlobStore(LocalStorage(str(tmp_path)))), \
+            patch('app.fetch_images', side_effect=fake_fetch) as mock_fetch:
+        mock_db_session.execute.return_value.first.return_value = mock_item
+        result = process_webpage(item_id)
+
+    assert result["status"] == "success"
+    assert mock_fetch.call_args.args[0] == [
+        "https://example.com/a.png",
+        "https://cdn.example.com/b.gif",
+        "https://example.com/missing.png",
+    ]
+    # All asset rows go to the database in one bulk INSERT
+    inserts = [call.args for call in mock_db_session.execute.call_args_list if isinstance(call.args[0], Insert)
+               and call.args[0].table.name == 'image_assets']
+    assert len(inserts) == 1
+    assets = inserts[0][1]
+    assert [asset["original_url"] for asset in assets] == ["/a.png", "https://cdn.example.com/b.gif"]
+    # Both images have identical bytes, so they share one content-addressed blob
+    digest = hashlib.sha256(b"img").hexdigest()
+    for asset in assets:
+        assert asset["knowledge_item_id"] == item_id
+        assert asset["content_hash"] == digest
+        assert asset["storage_key"] == blob_key(digest)
+        assert (tmp_path / asset["storage_key"]).read_bytes() == b"img"
+    # Temporary download files are cleaned up once stored
+    assert not list(tmp_path.glob("download-*"))
+    # The stats row goes into the completing transaction, under a savepoint
+    [stats] = _item_stats(mock_db_session)
+    assert stats["outcome"] == "success"
+    assert (stats["images_found"], stats["images_stored"]) == (3, 2)
+    assert stats["bytes_downloaded"] == len(mock_requests.get.return_value.content)
+    assert all(stats[f"{stage}_ms"] is not None for stage in ("fetch", "extract", "images", "commit"))
+    assert stats["download_ms"] is None and stats["transcribe_ms"] is None
+    assert mock_db_session.begin_nested.call_count == 1
+
+def _slow_session(delay, statuses=None):
+    """Session double whose GETs take `delay` seconds"""
+    session = MagicMock()
+
+    def fake_get(url, timeout, stream, headers=None):
+        time.sleep(delay)
+        return _fake_response(url.encode(), (statuses or {}).get(url, 200), {"content-type": "image/png"})
+
+    session.get.side_effect = fake_get
+    return session
+
+def test_fetch_images_runs_concurrently():
+    """Batch time tracks the slowest image, not the sum of all of them"""
+    urls = [f"https://img{i}.example.com/{i}.png" for i in range(8)]
+    with patch('fetcher.get_session', return_value=_slow_session(0.2)):
+        started = time.monotonic()
+        results = fetch_images(urls)
+        elapsed = time.monotonic() - started
+
+    assert elapsed < 0.2 * len(urls) / 2
+    assert [open(result.path, 'rb').read() for result in results] == [url.encode() for url in urls]
+    discard_images(results)
+
+def test_fetch_images_preserves_order_and_skips_failures():
+    """Results line up with the input and repeated URLs are fetched once"""
+    urls = ["https://example.com/a.png", "https://example.com/404.png", "https://example.com/a.png"]
+    session = _slow_session(0, statuses={"https://example.com/404.png": 404})
+    with patch('fetcher.get_session', return_value=session):
+        results = fetch_images(urls)
+
+    assert results[0].content_hash == hashlib.sha256(b"https://example.com/a.png").hexdigest()
+    assert results[1] is None
+    assert results[2] is results[0]
+    assert session.get.call_count == 2
+    discard_images(results)
+    assert not os.path.exists(results[0].path)
+
+def test_fetch_images_respects_deadline():
+    """Downloads still running at the deadline are dropped"""
+    with patch('fetcher.get_session', return_value=_slow_session(0.5)):
+        started = time.monotonic()
+        results = fetch_images(["https://example.com/slow.png"], deadline=0.1)
+        elapsed = time.monotonic() - started
+
+    assert results == [None]
+    assert elapsed < 0.4
+
+def test_fetch_images_limits_per_host_concurrency():
+    """No more than IMAGE_FETCH_PER_HOST requests hit one host at once"""
+    in_flight = {"now": 0, "peak": 0}
+    lock = threading.Lock()
+    session = MagicMock()
+
+    def fake_get(url, timeout, stream, headers=None):
+        with lock:
+            in_flight["now"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+        time.sleep(0.05)
+        with lock:
+            in_flight["now"] -= 1
+        return _fake_response()
+
+    session.get.side_effect = fake_get
+    with patch('fetcher.get_session', return_value=session), \
+            patch('fetcher.IMAGE_FETCH_PER_HOST', 2):
+        discard_images(fetch_images([f"https://example.com/{i}.png" for i in range(6)]))
+
+    assert in_flight["peak"] == 2
+
+def test_fetch_images_enforces_byte_caps():
+    """Oversized images are skipped and the item budget bounds the batch"""
+    session = MagicMock()
+    bodies = {
+        "https://example.com/huge.png": b"x" * 64,
+        "https://example.com/ok.png": b"y" * 16,
+        "https://example.com/declared.png": b"",
+    }
+    session.get.side_effect = lambda url, timeout, stream, headers=None: _fake_response(
+        bodies[url], headers={"content-length": "999"} if "declared" in url else {}
+    )
+    with patch('fetcher.get_session', return_value=session), \
+            patch('fetcher.MAX_IMAGE_BYTES', 32):
+        results = fetch_images(list(bodies))
+    assert results[0] is None
+    assert results[1].size == 16
+    assert results[2] is None
+    discard_images(results)
+
+    budget = ByteBudget(20)
+    with patch('fetcher.get_session', return_value=session):
+        results = fetch_images(["https://example.com/ok.png", "https://example.com/huge.png"], budget=budget)
+    assert [result is not None for result in results] == [True, False]
+    discard_images(results)
+
+def test_fetch_page_caps_size(mock_requests):
+    """Pages larger than MAX_PAGE_BYTES fail instead of being buffered"""
+    with patch('fetcher.MAX_PAGE_BYTES', 10):
+        with pytest.raises(ResourceTooLarge):
+            fetch_page("https://example.com")
+
+def _revalidating_session(body, response_headers):
+    """Session double that answers conditional GETs with 304"""
+    session = MagicMock()
+
+    def fake_get(url, timeout, stream, headers=None):
+        if headers and headers.get("If-None-Match") == '"v1"':
+            return _fake_response(status_code=304)
+        return _fake_response(body, headers=dict(response_headers))
+
+    session.get.side_effect = fake_get
+    return session
+
+def test_fetch_page_revalidates_cached_page(tmp_path):
+    """A 304 is answered from the cache with the original body"""
+    cache = HttpCache(str(tmp_path))
+    body = "<html><p>caf\u00e9</p></html>".encode("cp1252")
+    session = _revalidating_session(body, {"content-type": "text/html; charset=windows-1252", "etag": '"v1"'})
+
+    with patch('fetcher.get_session', return_value=session):
+        first = fetch_page("https://example.com/post", cache=cache)
+        second = fetch_page("https://example.com/post", cache=cache)
+
+    assert first.from_cache is False
+    assert second.from_cache is True
+    assert second.content == body
+    assert "caf\u00e9" in second.text
+    assert session.get.call_args.kwargs["headers"] == {"If-None-Match": '"v1"'}
+
+def test_fetch_images_revalidates_cached_images(tmp_path):
+    """Unchanged images cost a round trip and keep their content hash"""
+    cache = HttpCache(str(tmp_path / "cache"))
+    session = _revalidating_session(b"png-bytes", {"content-type": "image/png", "etag": '"v1"'})
+
+    with patch('fetcher.get_session', return_value=session):
+        first = fetch_images(["https://example.com/a.png"], cache=cache)
+        second = fetch_images(["https://example.com/a.png"], cache=cache)
+
+    assert second[0].from_cache is True
+    assert second[0].content_hash == first[0].content_hash == hashlib.sha256(b"png-bytes").hexdigest()
+    assert open(second[0].path, 'rb').read() == b"png-bytes"
+    discard_images(first + second)
+    # Discarding the download must not remove the cached body
+    assert cache.lookup("https://example.com/a.png") is not None
+
+def test_fetch_page_refetches_body_evicted_after_lookup(tmp_path):
+    """A body evicted between the lookup and the 304 is a miss, not an error"""
+    cache = HttpCache(str(tmp_path))
+    body = b"<html><p>fresh</p></html>"
+    session = _revalidating_session(body, {"content-type": "text/html", "etag": '"v1"'})
+    revalidate = session.get.side_effect
+
+    def evicting_get(url, timeout, stream, headers=None):
+        if headers:
+            os.unlink(cache.body_path(hashlib.sha256(body).hexdigest()))
+        return revalidate(url, timeout, stream, headers)
+
+    with patch('fetcher.get_session', return_value=session):
+        fetch_page("https://example.com/post", cache=cache)
+        session.get.side_effect = evicting_get
+        page = fetch_page("https://example.com/post", cache=cache)
+
+    assert page.content == body and page.from_cache is False
+    assert session.get.call_count == 3
+
+def test_http_cache_evicts_least_recently_used(tmp_path):
+    """Entries beyond the configured limits are evicted oldest-use first"""
+    cache = HttpCache(str(tmp_path), max_bytes=10, max_entries=2)
+    for name in ("a", "b"):
+        cache.store(f"https://example.com/{name}", '"x"', None, "text/html",
+                    hashlib.sha256(name.encode()).hexdigest(), 4, data=name.encode() * 4)
+    cache.touch("https://example.com/a")
+    cache.store("https://example.com/c", None, "Mon, 01 Jan 2024 00:00:00 GMT", "text/html",
+                hashlib.sha256(b"c").hexdigest(), 4, data=b"cccc")
+
+    assert cache.lookup("https://example.com/b") is None
+    assert cache.lookup("https://example.com/a") is not None
+    assert cache.lookup("https://example.com/c").last_modified == "Mon, 01 Jan 2024 00:00:00 GMT"
+    assert not os.path.exists(cache.body_path(hashlib.sha256(b"b").hexdigest()))
+    # Bodies nobody indexed yet (another process is mid-store) are left alone
+    pending = cache.body_path("e" * 64)
+    os.makedirs(os.path.dirname(pending), exist_ok=True)
+    open(pending, 'wb').close()
+    cache.store("https://example.com/f", '"x"', None, "text/html", hashlib.sha256(b"f").hexdigest(), 4, data=b"ffff")
+    assert os.path.exists(pending)
+    # Responses without validators are never cached
+    cache.store("https://example.com/d", None, None, "text/html", "d" * 64, 1, data=b"d")
+    assert cache.lookup("https://example.com/d") is None
+
+@pytest.mark.parametrize("content_type, body, expected", [
+    ("text/html; charset=ISO-8859-1", b"<html></html>", "iso8859-1"),
+    ("text/html", b'<html><head><meta charset="windows-1252"></head>', "cp1252"),
+    ("text/html", b'<meta http-equiv="Content-Type" content="text/html; charset=Shift_JIS">', "shift_jis"),
+    ("text/html; charset=bogus", b'<meta charset="utf-8">', "utf-8"),
+    ("text/html; charset=latin-1", codecs.BOM_UTF8 + b"<html>", "utf-8"),
+    ("text/html", b"<html></html>", "utf-8"),
+])
+def test_detect_charset(content_type, body, expected):
+    """Charset comes from the BOM, then headers, then meta tags"""
+    assert detect_charset(content_type, body) == expected
+
+def test_process_webpage_decodes_declared_charset(mock_db_session, mock_requests):
+    """Pages are decoded with their declared charset rather than forced UTF-8"""
+    mock_requests.get.return_value = _fake_response(
+        '<html><head><meta charset="windows-1252"><title>Caf\u00e9</title></head>'
+        '<body><p>Caf\u00e9 cr\u00e8me</p></body></html>'.encode('cp1252'),
+        headers={"content-type": "text/html"},
+    )
+    mock_item = MagicMock()
+    mock_item.source_url = "https://example.com"
+
+    with patch('app.SessionLocal', return_value=mock_db_session):
+        mock_db_session.execute.return_value.first.return_value = mock_item
+        result = process_webpage(str(uuid.uuid4()))
+
+    assert result["status"] == "success"
+    stored = _item_updates(mock_db_session)[-1]
+    assert stored["title"] == "Caf\u00e9"
+    assert "Caf\u00e9 cr\u00e8me" in stored["processed_text_content"]
+
+def test_blob_store_skips_existing_content(tmp_path):
+    """Identical bytes are written once and map to the same key"""
+    storage = LocalStorage(str(tmp_path))
+    store = BlobStore(storage)
+
+    first = store.put(b"logo", "image/png")
+    with patch.object(storage, 'put_bytes') as mock_put:
+        second = store.put(b"logo", "image/png")
+
+    assert first.written is True
+    assert second.written is False
+    mock_put.assert_not_called()
+    assert first.storage_key == second.storage_key == blob_key(hashlib.sha256(b"logo").hexdigest())
+    assert (tmp_path / first.storage_key).read_bytes() == b"logo"
+
+def test_acquire_counts_references_per_blob(mock_db_session):
+    """acquire upserts one row per distinct blob with a reference per use"""
+    logo = StoredBlob("a" * 64, blob_key("a" * 64), 4, "image/png", True)
+    photo = StoredBlob("b" * 64, blob_key("b" * 64), 9, "image/jpeg", False)
+
+    acquire(mock_db_session, [logo, photo, logo])
+
+    stmt = mock_db_session.execute.call_args.args[0]
+    params = stmt.compile().params
+    assert params["ref_count_m0"] == 2
+    assert params["ref_count_m1"] == 1
+    assert "ON CONFLICT (content_hash) DO UPDATE" in str(stmt.compile(dialect=postgresql.dialect()))
+
+def test_acquire_returns_blobs_garbage_collection_may_have_removed(mock_db_session, tmp_path):
+    """Rows that are new or were unreferenced are verified, and restored, after the commit"""
+    storage = LocalStorage(str(tmp_path))
+    store = BlobStore(storage)
+    source = tmp_path / "download"
+    source.write_bytes(b"logo")
+    logo = store.put_file(str(source), hashlib.sha256(b"logo").hexdigest(), 4, "image/png")
+    shared = StoredBlob("b" * 64, blob_key("b" * 64), 9, "image/jpeg", False)
+    # The upsert returns each row's new ref_count: logo was inserted (or at zero), shared was in use
+    mock_db_session.execute.return_value.all.return_value = [(logo.content_hash, 2), ("b" * 64, 5)]
+
+    unverified = acquire(mock_db_session, [logo, shared, logo])
+    assert unverified == [logo]
+
+    # The collector deleted the object after put skipped the upload
+    storage.delete(logo.storage_key)
+    assert store.restore(unverified) == 1
+    assert (tmp_path / logo.storage_key).read_bytes() == b"logo"
+    assert store.restore(unverified) == 0
+
+def test_collect_garbage_deletes_objects_before_commit(mock_db_session, tmp_path):
+    """Rows stay locked until their objects are gone, so a concurrent acquire sees a fresh row"""
+    storage = LocalStorage(str(tmp_path))
+    store = BlobStore(storage)
+    blob = store.put(b"orphan")
+    mock_db_session.execute.return_value.scalars.return_value.all.return_value = [blob.storage_key]
+    mock_db_session.commit.side_effect = lambda: seen.append(storage.exists(blob.storage_key))
+    seen = []
+
+    assert store.collect_garbage(mock_db_session) == 1
+    assert seen == [False]
+    stmt = mock_db_session.execute.call_args.args[0]
+    assert "FOR UPDATE SKIP LOCKED" in str(stmt.compile(dialect=postgresql.dialect()))
+
+def test_extract_page_derives_everything_from_one_parse():
+    """Readable HTML, text, metadata and images all come from a single parse"""
+    # Readability must score copies of our tree rather than parse the page again
+    with open(os.path.join(FIXTURE_PAGES, 'news_article.html'), encoding='utf-8') as f, \
+         patch('readability.readability.build_doc', side_effect=AssertionError("page parsed twice")):
+        extracted = extract_page(f.read())
+
+    assert extracted.title == "Queue depth climbs as capture traffic doubles | Example News"
+    assert extracted.author == "Dana Reporter"
+    assert extracted.published_date == "2025-09-14T08:30:00Z"
+    # Images come from the whole page, not just the readable article
+    assert extracted.image_sources[0] == "/static/logo.svg"
+    assert "/media/hero.jpg" in extracted.image_sources
+    assert "https://pixel.example-tracker.com/p.gif?id=1" in extracted.image_sources
+    assert "Queue depth climbs" in extracted.text
+    assert "Related story" not in extracted.text
+    assert "<script" not in extracted.html
+    assert "window.__cfg_" not in extracted.text
+
+def test_extract_page_handles_short_pages():
+    """Pages too short for the strict pass still produce content"""
+    with open(os.path.join(FIXTURE_PAGES, 'short_note.html'), encoding='utf-8') as f:
+        extracted = extract_page(f.read())
+
+    assert extracted.title == "Short note"
+    assert extracted.author is None
+    assert extracted.image_sources == ["/n.png"]
+    assert "quick note about the deploy" in extracted.text
+
+def test_local_token_bucket_allows_burst_then_spaces_requests():
+    """A domain gets its burst immediately, then one request per 1/rate seconds"""
+    bucket = LocalTokenBucket(rate=10, burst=3)
+    waits = [bucket.reserve("example.com", max_wait=5) for _ in range(5)]
+
+    assert waits[:3] == [0, 0, 0]
+    assert waits[3] == pytest.approx(0.1, abs=0.01)
+    assert waits[4] == pytest.approx(0.2, abs=0.01)
+    # Other domains have their own bucket
+    assert bucket.reserve("other.example.org", max_wait=5) == 0
+
+def test_rate_limiter_falls_back_when_redis_is_down():
+    """Redis outages degrade to per-process buckets and long waits are refused"""
+    shared = MagicMock()
+    shared.reserve.side_effect = redis.ConnectionError("down")
+    now = [100.0]
+    limiter = DomainRateLimiter(shared, LocalTokenBucket(rate=1, burst=1), max_wait=0.5, clock=lambda: now[0])
+
+    assert limiter.acquire("https://Example.com/a") == 0
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire("https://example.com/b")
+    # Redis is not retried on every request while it is down
+    assert shared.reserve.call_count == 1
+
+    now[0] += 10
+    shared.reserve.side_effect = None
+    shared.reserve.return_value = 0.0
+    assert limiter.acquire("https://example.org/c") == 0
+    assert shared.reserve.call_count == 2
+
+def _adapter_response(request, status=200, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    response.url = request.url
+    response.request = request
+    response.raw = io.BytesIO(b"")
+    return response
+
+def test_polite_session_skips_limiter_for_internal_calls():
+    """Requests take a domain token unless they opt out"""
+    limiter = MagicMock()
+    session = PoliteSession(limiter)
+    with patch('requests.adapters.HTTPAdapter.send', side_effect=lambda request, **kw: _adapter_response(request)) as mock_send:
+        session.get("https://example.com/page")
+        session.post("http://stt:5000/transcribe", rate_limit=False)
+
+    limiter.acquire.assert_called_once_with("https://example.com/page")
+    assert mock_send.call_count == 2
+
+def test_polite_session_rate_limits_every_redirect_hop():
+    """A redirect to another domain takes that domain's token too"""
+    limiter = MagicMock()
+    session = PoliteSession(limiter)
+
+    def send(request, **kwargs):
+        if request.url.startswith("https://short.example/"):
+            return _adapter_response(request, 302, {"Location": "https://target.example/article"})
+        return _adapter_response(request)
+
+    with patch('requests.adapters.HTTPAdapter.send', side_effect=send):
+        response = session.get("https://short.example/abc")
+
+    assert response.url == "https://target.example/article"
+    assert [c.args[0] for c in limiter.acquire.call_args_list] == [
+        "https://short.example/abc", "https://target.example/article"]
+
+def test_dns_cache_reuses_lookups_until_ttl():
+    """Repeated lookups within the TTL skip the resolver"""
+    resolve = MagicMock(return_value=[("addr",)])
+    cache = DnsCache(resolve, ttl=60)
+
+    assert cache.getaddrinfo("example.com", 443) == [("addr",)]
+    assert cache.getaddrinfo("example.com", 443) == [("addr",)]
+    cache.getaddrinfo("example.org", 443)
+    assert resolve.call_count == 2
+
+def test_dns_cache_is_bounded_and_drops_expired_entries():
+    now = [0.0]
+    resolve = MagicMock(side_effect=lambda host, port: [(host,)])
+    cache = DnsCache(resolve, ttl=60, max_entries=2)
+    with patch('http_client.time.monotonic', side_effect=lambda: now[0]):
+        cache.getaddrinfo("a.example", 443)
+        cache.getaddrinfo("b.example", 443)
+        cache.getaddrinfo("a.example", 443)  # a is now the most recently used
+        cache.getaddrinfo("c.example", 443)
+        assert len(cache) == 2
+        cache.getaddrinfo("a.example", 443)
+        assert resolve.call_count == 3  # b was evicted, a was not
+
+        now[0] += 61
+        cache.getaddrinfo("d.example", 443)
+        assert len(cache) == 1  # a and c had expired
+        cache.getaddrinfo("a.example", 443)
+        assert resolve.call_count == 5
+
+def test_cached_dns_adapter_leaves_socket_getaddrinfo_alone():
+    """Only connections made through the fetch adapter use the cache"""
+    original = socket.getaddrinfo
+    cache = DnsCache(MagicMock(return_value=[(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("203.0.113.7", 80))]), ttl=60)
+    adapter = CachedDnsAdapter(cache)
+    assert socket.getaddrinfo is original
+
+    pool = adapter.poolmanager.connection_from_url("http://example.com/")
+    conn = pool._new_conn()
+    with patch('urllib3.connection.connection.create_connection', return_value=MagicMock()) as create:
+        conn.connect()
+    assert create.call_args.args[0] == ("203.0.113.7", 80)
+    assert conn.host == "example.com"
+    cache.resolve.assert_called_once_with("example.com", 80, 0, socket.SOCK_STREAM)
+
+def test_chunk_text_overlapping_windows():
+    words = [f"w{i}" for i in range(450)]
+    chunks = chunk_text(" ".join(words), words=200, overlap=40)
+    assert [c.split()[0] for c in chunks] == ["w0", "w160", "w320"]
+    assert chunks[-1].split()[-1] == "w449"
+    assert chunk_text("short text", words=200, overlap=40) == ["short text"]
+    assert chunk_text("", words=200, overlap=40) == []
+    assert len(chunk_text(" ".join(words), words=10, overlap=0, max_chunks=5)) == 5
+
+def test_hashing_embedder_is_deterministic_float32_unit_vectors():
+    embedder = HashingEmbedder()
+    vectors = embedder.embed(["Sourdough bread baking", "sourdough BREAD baking!", "tax law"])
+    assert vectors.dtype == np.float32 and vectors.shape == (3, EMBEDDING_DIM)
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0)
+    assert np.allclose(vectors[0], vectors[1])
+    assert vectors[0] @ vectors[2] < 0.5
+    assert np.array_equal(HashingEmbedder().embed(["tax law"])[0], vectors[2])
+
+def test_embed_documents_pools_chunks_across_batches():
+    embedder = MagicMock(wraps=HashingEmbedder())
+    long_doc = " ".join(f"word{i % 300}" for i in range(5000))
+    with patch('embeddings.EMBEDDING_BATCH_SIZE', 4):
+        vectors, counts = embed_documents([long_doc, None, "a short note about bread"], embedder)
+    assert counts[0] > 4 and counts[1:] == [0, 1]
+    # Chunks of all documents share batches of at most 4
+    assert sum(len(call.args[0]) for call in embedder.embed.call_args_list) == counts[0] + 1
+    assert all(len(call.args[0]) <= 4 for call in embedder.embed.call_args_list)
+    assert np.allclose(np.linalg.norm(vectors[[0, 2]], axis=1), 1.0)
+    assert not vectors[1].any()
+
+def test_embed_items_upserts_vectors(mock_db_session):
+    item_id = uuid.uuid4()
+    empty_id = uuid.uuid4()
+    mock_db_session.execute.return_value.all.return_value = [
+        MagicMock(id=item_id, title="Bread", processed_text_content="Sourdough starter notes", text_content_key=None),
+        MagicMock(id=empty_id, title=None, processed_text_content=None, text_content_key=None),
+    ]
+    with patch('app.SessionLocal', return_value=mock_db_session):
+        result = embed_items([str(item_id), str(empty_id)])
+
+    assert result == {"status": "success", "embedded": 1}
+    stmt, rows = mock_db_session.execute.call_args_list[-1].args
+    assert "ON CONFLICT (knowledge_item_id) DO UPDATE" in str(stmt.compile(dialect=postgresql.dialect()))
+    assert [row["knowledge_item_id"] for row in rows] == [item_id]
+    assert rows[0]["model"] == "hashing-384" and rows[0]["embedding"].dtype == np.float32
+    assert mock_db_session.commit.call_count == 1
+
+def test_task_metrics_record_duration_outcome_and_queue_wait(mock_db_session):
+    from prometheus_client import REGISTRY
+    import metrics
+
+    def sample(name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    errors = sample('synapse_worker_tasks_total', task='tasks.embed_items', outcome='error')
+    mock_db_session.execute.side_effect = Exception("database is down")
+    with patch('app.SessionLocal', return_value=mock_db_session):
+        embed_items.apply(args=[[str(uuid.uuid4())]])
+    # The task caught the error and returned it, so the outcome comes from its result
+    assert sample('synapse_worker_tasks_total', task='tasks.embed_items', outcome='error') == errors + 1
+    assert sample('synapse_worker_task_duration_seconds_count', task='tasks.embed_items', outcome='error') >= 1
+
+    task = MagicMock()
+    task.name = 'tasks.process_webpage'
+    task.request.sent_at = time.time() - 3
+    waited = sample('synapse_worker_task_queue_wait_seconds_sum', task='tasks.process_webpage')
+    metrics._task_started(task_id='t1', task=task)
+    metrics._task_finished(task_id='t1', task=task, retval=None, state='FAILURE')
+    assert 3 <= sample('synapse_worker_task_queue_wait_seconds_sum', task='tasks.process_webpage') - waited < 4
+    assert sample('synapse_worker_tasks_total', task='tasks.process_webpage', outcome='failure') >= 1
+    assert 't1' not in metrics._started
+
+def test_item_stats_times_stages():
+    from item_stats import ItemStats
+    now = [0.0]
+    stats = ItemStats(clock=lambda: now[0])
+    with stats.stage('fetch'):
+        now[0] += 0.25
+    with pytest.raises(ValueError):
+        with stats.stage('extract'):
+            now[0] += 0.5
+            raise ValueError("bad markup")
+    with stats.stage('commit'):
+        now[0] += 0.125
+        # Written from inside the commit stage, which counts up to that point
+        values = stats.values('error')
+    assert (values['fetch_ms'], values['extract_ms'], values['commit_ms']) == (250, 500, 125)
+    assert values['total_ms'] == 875 and values['images_ms'] is None
+    assert stats.stage_ms['commit'] == 125
+
+def test_process_media_failure_records_stats(mock_db_session):
+    """A failed attempt keeps the timings of the stages that ran"""
+    item_id = str(uuid.uuid4())
+    mock_item = MagicMock(id=item_id, source_url="https://youtube.com/watch?v=123", status="processing")
+    with patch('app.SessionLocal', return_value=mock_db_session), \
+            patch('app.subprocess.run') as mock_subprocess:
+        mock_subprocess.return_value.returncode = 1
+        mock_subprocess.return_value.stderr = "Video unavailable"
+        mock_db_session.execute.return_value.first.return_value = mock_item
+        result = process_media(item_id, "video")
+
+    assert result["status"] == "error"
+    [stats] = _item_stats(mock_db_session)
+    assert stats["outcome"] == "error"
+    assert stats["download_ms"] is not None and stats["transcribe_ms"] is None
+    # Still one transaction for the claim and one for the outcome
+    assert mock_db_session.commit.call_count == 2
+
+def test_worker_imports_without_asyncpg():
+    """The worker shares api/database.py but not the API's asyncpg dependency"""
+    import subprocess
+    code = "import sys; sys.modules['asyncpg'] = None; import app, database; assert not database.get_async_engine.cache_info().currsize"
+    result = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
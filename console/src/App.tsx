@@ -2,6 +2,7 @@ import React, { useCallback, useEffect, useMemo, useState } from "react";
 import { API_BASE_URL, API_TOKEN } from "./config";
 import {
   HealthResponse,
+  ItemStats,
   KnowledgeItemRow,
   KnowledgeListResponse,
   QueueMetrics,
@@ -42,6 +43,23 @@ function formatDate(value?: string | null) {
   return new Date(value).toLocaleString();
 }
 
+function formatDuration(ms?: number | null) {
+  if (ms === null || ms === undefined) return "—";
+  return ms < 1000 ? `${ms} ms` : `${(ms / 1000).toFixed(1)} s`;
+}
+
+function formatBytes(bytes: number) {
+  if (bytes < 1024) return `${bytes} B`;
+  if (bytes < 1024 * 1024) return `${(bytes / 1024).toFixed(1)} KB`;
+  return `${(bytes / (1024 * 1024)).toFixed(1)} MB`;
+}
+
+function slowestStage(stats: ItemStats) {
+  const stages = Object.entries(stats.stages_ms);
+  if (!stages.length) return null;
+  return stages.reduce((slowest, stage) => (stage[1] > slowest[1] ? stage : slowest));
+}
+
 function statusBadge(status: string) {
   const normalized = status.toLowerCase();
   const label = normalized.replace(/_/g, " ");
@@ -94,15 +112,27 @@ export default function App() {
     }
   }, []);
 
+  const knowledgeEndpoint = useCallback(
+    (cursor?: string) => {
+      const params = new URLSearchParams({ limit: "50" });
+      if (statusFilter !== "all") {
+        params.set("status", statusFilter);
+      }
+      if (cursor) {
+        // Later pages keep the first page's total instead of counting again
+        params.set("cursor", cursor);
+        params.set("count", "none");
+      }
+      return `/knowledge-items?${params.toString()}`;
+    },
+    [statusFilter]
+  );
+
   const refreshKnowledge = useCallback(async () => {
     setKnowledgeLoading(true);
     setError(null);
     try {
-      const endpoint =
-        statusFilter === "all"
-          ? "/knowledge-items?limit=50"
-          : `/knowledge-items?status=${statusFilter}&limit=50`;
-      const knowledgeData = await fetchJson<KnowledgeListResponse>(endpoint);
+      const knowledgeData = await fetchJson<KnowledgeListResponse>(knowledgeEndpoint());
       setKnowledge(knowledgeData);
       setLastUpdated(new Date().toLocaleTimeString());
     } catch (err) {
@@ -110,7 +140,28 @@ export default function App() {
     } finally {
       setKnowledgeLoading(false);
     }
-  }, [statusFilter]);
+  }, [knowledgeEndpoint]);
+
+  const loadMoreKnowledge = async () => {
+    if (!knowledge?.next_cursor) {
+      return;
+    }
+    setKnowledgeLoading(true);
+    setError(null);
+    try {
+      const page = await fetchJson<KnowledgeListResponse>(knowledgeEndpoint(knowledge.next_cursor));
+      setKnowledge((current) =>
+        current
+          ? { ...current, next_cursor: page.next_cursor, items: [...current.items, ...page.items] }
+          : page
+      );
+      setLastUpdated(new Date().toLocaleTimeString());
+    } catch (err) {
+      setError(err instanceof Error ? err.message : "Unable to load more knowledge items");
+    } finally {
+      setKnowledgeLoading(false);
+    }
+  };
 
   useEffect(() => {
     if (view === "dashboard") {
@@ -337,6 +388,7 @@ export default function App() {
                     <th>Status</th>
                     <th>Source</th>
                     <th>Last Error</th>
+                    <th>Time</th>
                     <th>Updated</th>
                   </tr>
                 </thead>
@@ -362,16 +414,32 @@ export default function App() {
                           "—"
                         )}
                       </td>
+                      <td>
+                        {item.stats ? (
+                          <span title={slowestStage(item.stats)?.[0] ?? ""}>
+                            {formatDuration(item.stats.total_ms)}
+                          </span>
+                        ) : (
+                          "—"
+                        )}
+                      </td>
                       <td>{formatDate(item.processed_at || item.created_at)}</td>
                     </tr>
                   ))}
                   {!knowledgeItems.length && !knowledgeLoading && (
                     <tr>
-                      <td colSpan={5}>No knowledge items match this filter.</td>
+                      <td colSpan={6}>No knowledge items match this filter.</td>
                     </tr>
                   )}
                 </tbody>
               </table>
+              {knowledge?.next_cursor && (
+                <div className="table-footer">
+                  <button className="secondary" onClick={loadMoreKnowledge} disabled={knowledgeLoading}>
+                    Load more
+                  </button>
+                </div>
+              )}
             </div>
             <div className="card knowledge-detail-card">
               <h3>Knowledge Item Details</h3>
@@ -460,6 +528,17 @@ export default function App() {
                     <p>
                       <strong>Last Error:</strong> {selectedItem.last_error ?? "None"}
                     </p>
+                    {selectedItem.stats && (
+                      <p>
+                        <strong>Last Attempt:</strong> {formatDuration(selectedItem.stats.total_ms)} (
+                        {Object.entries(selectedItem.stats.stages_ms)
+                          .map(([stage, ms]) => `${stage} ${formatDuration(ms)}`)
+                          .join(", ")}
+                        ), {formatBytes(selectedItem.stats.bytes_downloaded)} downloaded
+                        {selectedItem.stats.images_found != null &&
+                          `, ${selectedItem.stats.images_stored ?? 0}/${selectedItem.stats.images_found} images`}
+                      </p>
+                    )}
                   </div>
                   {selectedItem.last_error && (
                     <div className="error-panel">
@@ -20,6 +20,16 @@ export type QueueMetrics = {
   queued_tasks: Record<string, number>;
 };
 
+export type ItemStats = {
+  outcome: string;
+  total_ms: number;
+  stages_ms: Record<string, number>;
+  bytes_downloaded: number;
+  images_found?: number | null;
+  images_stored?: number | null;
+  recorded_at: string | null;
+};
+
 export type KnowledgeItemRow = {
   id: string;
   source_type: string;
@@ -30,9 +40,13 @@ export type KnowledgeItemRow = {
   last_error?: string | null;
   title?: string | null;
   has_transcript?: boolean;
+  text_content_length?: number | null;
+  stats?: ItemStats | null;
 };
 
 export type KnowledgeListResponse = {
-  total: number;
+  total: number | null;
+  total_is_estimate: boolean;
+  next_cursor: string | null;
   items: KnowledgeItemRow[];
 };
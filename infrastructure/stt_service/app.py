@@ -1,9 +1,11 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
 import whisper
 import tempfile
 import os
 import logging
+import time
 from typing import Dict, Any
 
 # Configure logging
@@ -31,11 +33,33 @@ MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "base")
 logger.info(f"Loading Whisper model: {MODEL_SIZE}")
 model = whisper.load_model(MODEL_SIZE)
 
+# Throughput: rate(stt_audio_seconds_total) / rate(stt_transcribe_seconds_total)
+# is the audio seconds transcribed per wall-clock second
+AUDIO_SECONDS = Counter("stt_audio_seconds_total", "Seconds of audio transcribed")
+TRANSCRIBE_SECONDS = Counter("stt_transcribe_seconds_total", "Wall-clock seconds spent transcribing")
+TRANSCRIPTIONS = Counter("stt_transcriptions_total", "Transcription requests by outcome", ["outcome"])
+REALTIME_FACTOR = Histogram(
+    "stt_realtime_factor", "Audio seconds per wall-clock second, per transcription",
+    buckets=(0.25, 0.5, 1, 2, 4, 8, 16, 32, 64),
+)
+
+def audio_duration(result: Dict[str, Any]) -> float:
+    """Length of the transcribed audio; Whisper reports it through the last segment's end"""
+    segments = result.get("segments") or []
+    if segments:
+        return float(segments[-1].get("end", 0))
+    return float(result.get("duration", 0))
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "model": MODEL_SIZE}
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.post("/transcribe")
 async def transcribe_audio(file: UploadFile = File(...)) -> Dict[str, Any]:
     """
@@ -55,17 +79,28 @@ async def transcribe_audio(file: UploadFile = File(...)) -> Dict[str, Any]:
             
             # Transcribe audio
             logger.info(f"Transcribing audio file: {file.filename}")
+            started = time.perf_counter()
             result = model.transcribe(temp_path)
+            elapsed = time.perf_counter() - started
+            duration = audio_duration(result)
+
+            TRANSCRIPTIONS.labels("success").inc()
+            AUDIO_SECONDS.inc(duration)
+            TRANSCRIBE_SECONDS.inc(elapsed)
+            if elapsed > 0:
+                REALTIME_FACTOR.observe(duration / elapsed)
+            logger.info(f"Transcribed {duration:.1f} s of audio in {elapsed:.1f} s")
             
             # Return transcript
             return {
                 "status": "success",
                 "transcript": result["text"],
                 "language": result["language"],
-                "duration": result.get("duration", 0)
+                "duration": duration
             }
             
         except Exception as e:
+            TRANSCRIPTIONS.labels("error").inc()
             logger.error(f"Error transcribing audio: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Error transcribing audio: {str(e)}")
             
@@ -82,3 +82,24 @@ def test_transcribe_error(mock_whisper_model):
         # Clean up temporary file
         if os.path.exists(temp_path):
             os.unlink(temp_path)
+
+def test_metrics_count_audio_and_wall_seconds(mock_whisper_model):
+    """Audio length comes from the last segment and is exported with the time spent"""
+    from prometheus_client import REGISTRY
+    mock_whisper_model.transcribe.return_value = {
+        "text": "Two segments",
+        "language": "en",
+        "segments": [{"start": 0.0, "end": 4.0}, {"start": 4.0, "end": 12.5}],
+    }
+    audio_before = REGISTRY.get_sample_value("stt_audio_seconds_total") or 0
+
+    files = {"file": ("test.mp3", b"fake audio content", "audio/mpeg")}
+    response = client.post("/transcribe", files=files)
+
+    assert response.status_code == 200
+    assert response.json()["duration"] == 12.5
+    assert REGISTRY.get_sample_value("stt_audio_seconds_total") == audio_before + 12.5
+    metrics = client.get("/metrics")
+    assert metrics.status_code == 200
+    assert "stt_transcribe_seconds_total" in metrics.text
+    assert 'stt_transcriptions_total{outcome="success"}' in metrics.text
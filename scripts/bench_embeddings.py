@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the embedding stage against the extraction it follows.
+Extracts the fixture pages once, then reports CPU time per item for
+extract_page and for embed_documents, embedding items one at a time (as
+after a capture) and in batches (as in a backfill). Uses EMBEDDING_MODEL,
+the hashing embedder by default.
+Usage: python scripts/bench_embeddings.py [--repeat N] [--batch N]
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+# Add backend and backend/worker to Python path
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), '..', 'backend')
+WORKER_DIR = os.path.join(BACKEND_DIR, 'worker')
+sys.path.insert(0, BACKEND_DIR)
+sys.path.append(WORKER_DIR)
+sys.path.append(os.path.join(BACKEND_DIR, 'api'))
+
+from embeddings import embed_documents, embedder_from_env
+from extraction import extract_page
+from fetcher import detect_charset
+
+FIXTURE_DIR = os.path.join(WORKER_DIR, 'fixtures', 'pages')
+
+
+def cpu_ms(run, repeat: int) -> float:
+    started = time.process_time()
+    for _ in range(repeat):
+        run()
+    return (time.process_time() - started) * 1000 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=20, help='passes over the corpus')
+    parser.add_argument('--batch', type=int, default=64, help='items per embed_documents call in the batched run')
+    args = parser.parse_args()
+
+    pages = []
+    for path in sorted(glob.glob(os.path.join(FIXTURE_DIR, '*.html'))):
+        with open(path, 'rb') as f:
+            raw = f.read()
+        pages.append(raw.decode(detect_charset('text/html', raw[:4096]), 'replace'))
+    extracted = [extract_page(page) for page in pages]
+    texts = ["\n".join(part for part in (page.title, page.text) if part) for page in extracted]
+    embedder = embedder_from_env()
+    embed_documents(texts, embedder)  # load the model and warm caches outside the timing
+
+    extract_ms = cpu_ms(lambda: [extract_page(page) for page in pages], args.repeat) / len(pages)
+    single_ms = cpu_ms(lambda: [embed_documents([text], embedder) for text in texts], args.repeat) / len(texts)
+    batch = (texts * (args.batch // len(texts) + 1))[:args.batch]
+    batched_ms = cpu_ms(lambda: embed_documents(batch, embedder), args.repeat) / len(batch)
+    words = sum(len(text.split()) for text in texts) / len(texts)
+
+    print(f"{len(texts)} fixture pages, {words:.0f} words on average, embedder {embedder.name}")
+    print(f"{'stage':<32}{'cpu ms/item':>12}")
+    print(f"{'extract_page':<32}{extract_ms:>12.2f}")
+    print(f"{'embed, one item per call':<32}{single_ms:>12.2f}")
+    print(f"{f'embed, {args.batch} items per call':<32}{batched_ms:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
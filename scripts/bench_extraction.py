@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark webpage extraction CPU time per page on the fixture corpus.
+Compares the original three-parse pipeline (readability + BeautifulSoup on
+the page + BeautifulSoup on the summary) with the single-parse
+extraction.extract_page.
+Usage: python scripts/bench_extraction.py [--repeat N]
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+# Add backend/worker to Python path
+WORKER_DIR = os.path.join(os.path.dirname(__file__), '..', 'backend', 'worker')
+sys.path.append(WORKER_DIR)
+
+from bs4 import BeautifulSoup
+from readability import Document
+
+from extraction import extract_page
+from fetcher import detect_charset
+
+FIXTURE_DIR = os.path.join(WORKER_DIR, 'fixtures', 'pages')
+
+
+def legacy_extract(raw: bytes, text: str):
+    """The pipeline process_webpage used before extract_page"""
+    doc = Document(text)
+    title = doc.title()
+    content = doc.summary()
+    soup = BeautifulSoup(raw, 'html.parser')
+    author_meta = soup.find('meta', attrs={'name': 'author'}) or soup.find('meta', attrs={'property': 'article:author'})
+    date_meta = soup.find('meta', attrs={'property': 'article:published_time'}) or soup.find('meta', attrs={'name': 'date'})
+    images = [img.get('src') for img in soup.find_all('img') if img.get('src')]
+    plain_text = BeautifulSoup(content, 'html.parser').get_text()
+    return title, content, plain_text, author_meta, date_meta, images
+
+
+def single_parse_extract(raw: bytes, text: str):
+    return extract_page(text)
+
+
+def cpu_ms_per_page(extract, pages, repeat: int) -> float:
+    started = time.process_time()
+    for _ in range(repeat):
+        for raw, text in pages:
+            extract(raw, text)
+    return (time.process_time() - started) * 1000 / (repeat * len(pages))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=20, help='passes over the corpus per pipeline')
+    args = parser.parse_args()
+
+    pages = []
+    names = []
+    for path in sorted(glob.glob(os.path.join(FIXTURE_DIR, '*.html'))):
+        with open(path, 'rb') as f:
+            raw = f.read()
+        pages.append((raw, raw.decode(detect_charset('text/html', raw[:4096]), 'replace')))
+        names.append(os.path.basename(path))
+
+    print(f"{'page':<24}{'bytes':>8}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+    for name, page in zip(names, pages):
+        before = cpu_ms_per_page(legacy_extract, [page], args.repeat)
+        after = cpu_ms_per_page(single_parse_extract, [page], args.repeat)
+        print(f"{name:<24}{len(page[0]):>8}{before:>12.2f}{after:>12.2f}{before / after:>9.1f}x")
+
+    before = cpu_ms_per_page(legacy_extract, pages, args.repeat)
+    after = cpu_ms_per_page(single_parse_extract, pages, args.repeat)
+    print(f"{'corpus mean':<32}{before:>12.2f}{after:>12.2f}{before / after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
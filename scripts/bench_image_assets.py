@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the commit phase of process_webpage for a page with many images.
+Compares the original ORM path (load the item, one ImageAsset object per
+image, attribute writes flushed at commit) with the targeted UPDATE plus
+single multi-row INSERT used by the worker now.
+Needs a Postgres database with the schema applied (DATABASE_URL).
+Usage: python scripts/bench_image_assets.py [--images N] [--repeat N]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+
+# Add backend and backend/worker to Python path
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), '..', 'backend')
+sys.path.insert(0, BACKEND_DIR)
+sys.path.append(os.path.join(BACKEND_DIR, 'worker'))
+
+from sqlalchemy import delete
+
+from api.database import SessionLocal
+from api.models import ImageAsset, KnowledgeItem
+from blobstore import add_image_assets
+from item_state import complete_item
+
+
+def asset_rows(item_id: str, count: int):
+    return [
+        {
+            "knowledge_item_id": item_id,
+            "storage_key": f"blobs/sha256/00/00/{i:064d}",
+            "original_url": f"https://example.com/images/{i}.jpg",
+            "mime_type": "image/jpeg",
+        }
+        for i in range(count)
+    ]
+
+
+def results(i: int):
+    return {
+        "title": f"Benchmark page {i}",
+        "processed_text_content": "text " * 2000,
+        "processed_html_content": "<p>html</p>" * 1000,
+        "author": "Bench",
+    }
+
+
+def orm_commit(item_id: str, rows, values) -> None:
+    """The pre-bulk path: ORM load, per-row objects, attribute writes"""
+    db = SessionLocal()
+    try:
+        item = db.query(KnowledgeItem).filter(KnowledgeItem.id == item_id).first()
+        for row in rows:
+            db.add(ImageAsset(**row))
+        for column, value in values.items():
+            setattr(item, column, value)
+        item.status = 'ready_for_distillation'
+        item.last_error = None
+        db.commit()
+    finally:
+        db.close()
+
+
+def bulk_commit(item_id: str, rows, values) -> None:
+    complete_item(SessionLocal, item_id, values, lambda db: add_image_assets(db, rows))
+
+
+def clear_assets(item_id: str) -> None:
+    db = SessionLocal()
+    try:
+        db.execute(delete(ImageAsset).where(ImageAsset.knowledge_item_id == item_id))
+        db.commit()
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--images', type=int, default=100, help='images on the benchmark page')
+    parser.add_argument('--repeat', type=int, default=30, help='commits timed per path')
+    args = parser.parse_args()
+
+    item_id = str(uuid.uuid4())
+    db = SessionLocal()
+    db.add(KnowledgeItem(id=item_id, user_id=uuid.uuid4(), source_type='webpage',
+                         source_url=f"https://example.com/bench/{item_id}", status='processing'))
+    db.commit()
+    db.close()
+
+    timings = {"orm": [], "bulk": []}
+    try:
+        rows = asset_rows(item_id, args.images)
+        for i in range(args.repeat):
+            # Alternate the paths so cache warmth and autovacuum hit both equally
+            for name, commit in (("orm", orm_commit), ("bulk", bulk_commit)):
+                started = time.perf_counter()
+                commit(item_id, rows, results(i))
+                timings[name].append((time.perf_counter() - started) * 1000)
+                clear_assets(item_id)
+    finally:
+        db = SessionLocal()
+        db.execute(delete(KnowledgeItem).where(KnowledgeItem.id == item_id))
+        db.commit()
+        db.close()
+
+    print(f"{args.images} images, {args.repeat} commits per path")
+    print(f"{'path':<8}{'median ms':>12}{'p90 ms':>10}")
+    for name, samples in timings.items():
+        samples.sort()
+        print(f"{name:<8}{statistics.median(samples):>12.2f}{samples[int(len(samples) * 0.9) - 1]:>10.2f}")
+    orm, bulk = statistics.median(timings["orm"]), statistics.median(timings["bulk"])
+    print(f"speedup {orm / bulk:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+"""
+Load test for the capture path of a running API.
+Fires concurrent POST /api/v1/capture requests with unique URLs while a
+probe polls /health, and reports latency percentiles for both. A blocked
+event loop shows up as /health latency tracking capture latency.
+Run the API with CELERY_BROKER_URL=memory:// to measure the database path
+without a Redis broker, e.g.
+    CELERY_BROKER_URL=memory:// uvicorn main:app --port 8000
+Usage: python scripts/load_test_capture.py [--url URL] [--requests N] [--concurrency N]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import httpx
+
+
+def percentile(samples, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def report(name: str, samples, errors: int) -> None:
+    if not samples:
+        print(f"{name:<10} no successful requests, {errors} errors")
+        return
+    print(f"{name:<10}{len(samples):>8}{errors:>8}"
+          f"{statistics.median(samples):>10.1f}{percentile(samples, 0.95):>10.1f}"
+          f"{percentile(samples, 0.99):>10.1f}{max(samples):>10.1f}")
+
+
+async def capture_worker(client: httpx.AsyncClient, queue: asyncio.Queue, latencies, errors) -> None:
+    while True:
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        payload = {"source_type": "webpage", "url": f"https://example.com/load/{uuid.uuid4()}"}
+        started = time.perf_counter()
+        try:
+            response = await client.post("/api/v1/capture", json=payload)
+            if response.status_code == 202:
+                latencies.append((time.perf_counter() - started) * 1000)
+            else:
+                errors.append(response.status_code)
+        except httpx.HTTPError as exc:
+            errors.append(str(exc))
+
+
+async def health_probe(client: httpx.AsyncClient, stop: asyncio.Event, latencies) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.get("/health")
+        if response.status_code == 200:
+            latencies.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(0.01)
+
+
+async def run(url: str, total: int, concurrency: int) -> None:
+    limits = httpx.Limits(max_connections=concurrency + 1, max_keepalive_connections=concurrency + 1)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        queue: asyncio.Queue = asyncio.Queue()
+        for i in range(total):
+            queue.put_nowait(i)
+
+        capture_latencies, capture_errors, health_latencies = [], [], []
+        stop = asyncio.Event()
+        probe = asyncio.create_task(health_probe(client, stop, health_latencies))
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            capture_worker(client, queue, capture_latencies, capture_errors)
+            for _ in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await probe
+
+    print(f"{total} captures, concurrency {concurrency}, {total / elapsed:.0f} req/s")
+    print(f"{'endpoint':<10}{'ok':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    report("capture", capture_latencies, len(capture_errors))
+    report("health", health_latencies, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:8000', help='base URL of the API')
+    parser.add_argument('--requests', type=int, default=2000, help='total capture requests')
+    parser.add_argument('--concurrency', type=int, default=50, help='requests in flight at once')
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.requests, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()